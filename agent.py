@@ -1,13 +1,35 @@
-from typing import Dict, Any, cast
-from state import State, ResearchState, Validation, CodeSolution, CodingState, Module, CodeReview, Documentation, DocumentationState, ResearchStateManager, CodingStateManager, LLMCost
+from typing import Dict, Any, Optional, cast
+from state import State, ResearchState, ResearchStep, Validation, CodeSolution, CodingState, CodingStep, Module, CodeReview, Documentation, DocumentationState, ResearchStateManager, CodingStateManager, merge_llm_costs
+from tool_nodes import BasicToolNode
+from context import ContextWindow
+from interfaces import describe_modules
+from sandbox import TestRunner
+from costs import llm_cost
+from streaming import BranchCancelled, streaming_config, with_cancellation
+from prompt_cache import cache_history, cached_system_prompt
+from content_index import ContentIndexes, format_passages
+from summarizer import HierarchicalSummarizer, response_text
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
-import json 
+from langgraph.config import get_config
+from langgraph.types import Send
+import contextvars, json, os, threading
+
+# Set while a post-coding branch runs under the branch timeout, and set off when the branch is abandoned
+BRANCH_CANCELLED: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("branch_cancelled", default=None)
 
 class CodeSolutionAgent:
     """Agent responsible for generating and validating code solutions using LLMs."""
 
-    def __init__(self, planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm, searchTool, logger):
+    # Independent consumers of the finished code, run in parallel once coding is complete, and their agentStatus keys
+    BRANCH_STATUS = {"tester": "tests", "documenter": "documentation", "validator": "validation"}
+    POST_CODING_BRANCHES = tuple(BRANCH_STATUS)
+
+    def __init__(self, planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm, searchTool, logger,
+                 tools=None, max_research_concurrency=4, context_window: ContextWindow = None, max_coding_concurrency=4,
+                 full_module_context=False, branch_timeout: float = None,
+                 test_runner: TestRunner = None, content_index: ContentIndexes = None, source_passages: int = 4,
+                 summarizer: HierarchicalSummarizer = None, max_tool_rounds: int = 5):
         """
         Initialize the CodeSolutionAgent with the necessary language models.
         
@@ -16,6 +38,18 @@ class CodeSolutionAgent:
             coder_llm: LLM for generating code solutions.
             documenter_llm: LLM for generating documentation.
             reviewer_llm: LLM for reviewing and validating code.
+            tools: Tools the researcher may call from inside a parallel research branch.
+            max_research_concurrency: Maximum number of parallel research branches running at once.
+            context_window: Selects and bounds the message history sent with the planner and researcher prompts.
+            max_coding_concurrency: Maximum number of modules generated at once when coding in parallel.
+            full_module_context: Send the full source of implemented modules to the coder instead of their interfaces.
+            branch_timeout: Seconds the tester, documenter and validator each get before their branch gives up.
+            test_runner: Executes the generated tests against the generated modules.
+            content_index: The per-run index of retrieved pages (shared with the URL retrieval tool) that the code
+                planner and coder query for the passages relevant to their task.
+            source_passages: Number of passages from the content index added to the code planner and coder prompts.
+            summarizer: Condenses the research results in a map-reduce tree before the final research summary.
+            max_tool_rounds: Rounds of tool calls a parallel research branch may make before it must give its final answer.
         """
         self.planner_llm = planner_llm
         self.researcher_llm = researcher_llm
@@ -25,10 +59,20 @@ class CodeSolutionAgent:
         self.reviewer_llm = reviewer_llm
         self.searchTool = searchTool
         self.logger = logger
-
-    def merge_llm_cost(response: AIMessage, costs: list[LLMCost] = []) -> list[LLMCost]:
-        costs.append({"model": response.response_metadata["model"], "input_tokens": response.response_metadata["usage"]["input_tokens"], "output_tokens": response.response_metadata["usage"]["output_tokens"]})
-        return costs
+        self.tool_node = BasicToolNode(tools or [])
+        self.research_slots = threading.BoundedSemaphore(max_research_concurrency)
+        self.context_window = context_window or ContextWindow()
+        self.coding_slots = threading.BoundedSemaphore(max_coding_concurrency)
+        self.full_module_context = full_module_context
+        self.branch_timeout = branch_timeout
+        self.test_runner = test_runner or TestRunner()
+        self.content_index = content_index
+        self.source_passages = source_passages
+        self.max_tool_rounds = max_tool_rounds
+        self.summarizer = summarizer or HierarchicalSummarizer(summarizer_llm, path=None, logger=logger)
+        self.abandoned_branches = 0
+        self.abandoned_costs = {}
+        self._abandoned_lock = threading.Lock()
 
     def research_planner(self, state: State) -> Dict[str, Any]:
         self.logger.info("Planning research")
@@ -55,8 +99,8 @@ class CodeSolutionAgent:
         ])
 
         researcher_chain = prompt | self.planner_llm
-        response = researcher_chain.invoke({"messages": state["messages"]})
-        cost = CodeSolutionAgent.merge_llm_cost(response)
+        response = researcher_chain.invoke({"messages": self.context_window.fit(state["messages"])})
+        cost = llm_cost(response)
         
 
         #print(f"Research Planner Response: {response}")
@@ -72,18 +116,8 @@ class CodeSolutionAgent:
         researchState["is_complete"] = False
         return {"messages": [response], "agentStatus": {"research": "inProgress"}, "research": researchState, "llmCosts": cost}
 
-    def researcher(self, state: State) -> Dict[str, Any]:
-        """Conduct research to gather information for generating a code solution."""
-        self.logger.info("Running researcher")
-
-        researchState: ResearchState = state["research"]
-        researchStateManager = ResearchStateManager(researchState)
-
-        currentStep = researchStateManager.getCurrentStep()
-        query = currentStep["query"]
-
-        search_results = self.searchTool.invoke(query)
-
+    def researcher_prompt(self) -> ChatPromptTemplate:
+        """Build the prompt used to review search results and summarize a research step."""
         system_message = """
             You are part of a team of researchers tasked with gathering information that will be used to generate a code solution.
 
@@ -112,36 +146,115 @@ class CodeSolutionAgent:
             {search_results}
         """
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("placeholder", "{messages}"),
+        # The instructions alone are below the minimum cacheable prefix, so the callers mark the end of the
+        # message history instead (cache_history), and each tool round reads the earlier rounds from the cache
+        return ChatPromptTemplate.from_messages([
             ("system", system_message),
+            ("placeholder", "{messages}"),
             ("human", prompt_message),
         ])
 
+    @staticmethod
+    def focus_tool_calls(response: AIMessage, query: str, problem: str):
+        """Ask the URL retrieval tool for the passages relevant to the research step, unless the LLM gave its own query."""
+        for tool_call in response.tool_calls:
+            if tool_call["name"] == "url_retrieval" and not tool_call["args"].get("query"):
+                tool_call["args"]["query"] = f"{query}. {problem}"
+
+    def retrieved_passages(self, query: str) -> str:
+        """The passages of the pages retrieved during this run's research that are most relevant to the query."""
+        if self.content_index is None or not self.source_passages:
+            return ""
+        try:
+            threadId = get_config().get("configurable", {}).get("thread_id")
+        except RuntimeError:
+            return ""
+        chunks = self.content_index.get(threadId).search(query, self.source_passages) if threadId else []
+        return f"Relevant passages from the pages retrieved during research:\n{format_passages(chunks)}" if chunks else ""
+
+    def researcher(self, state: State) -> Dict[str, Any]:
+        """Conduct research to gather information for generating a code solution."""
+        self.logger.info("Running researcher")
+
+        researchState: ResearchState = state["research"]
+        researchStateManager = ResearchStateManager(researchState)
+
+        currentStep = researchStateManager.getCurrentStep()
+        query = currentStep["query"]
+
+        search_results = self.searchTool.invoke(query)
+
         #self.logger.debug(f"Research State: {state}")
-        researcher_chain = prompt | self.researcher_llm
-        response: AIMessage = researcher_chain.invoke({"messages": state["messages"], "problem": researchState["problem_statement"], 
+        researcher_chain = self.researcher_prompt() | self.researcher_llm
+        response: AIMessage = researcher_chain.invoke({"messages": cache_history(self.context_window.for_research_step(state["messages"])),
+                                            "problem": researchState["problem_statement"],
                                             "query": query, "search_results": search_results})
-        cost = CodeSolutionAgent.merge_llm_cost(response)
+        cost = llm_cost(response)
 
         if response.response_metadata["stop_reason"] == "tool_use":
             # LLM decided to use a tool, so we are not ready to save the summarized research
+            self.focus_tool_calls(response, query, researchState["problem_statement"])
             return {"messages": [response], "llmCosts": cost}
         else:
             content = response.content
             content = content if isinstance(content, str) else content[0]
-            researchState["research_results"].append(content)
 
             researchPlan = researchState["research_plan"]
             currentStep = researchState["current_step"]
             nextStep = currentStep + 1
             isComplete = nextStep >= len(researchPlan)
-            researchPlan[currentStep]["status"] = "done"
+            updatedSteps = [{**researchPlan[currentStep], "status": "done"}]
             if not isComplete:
-                researchPlan[nextStep]["status"] = "inProgress"
-            researchState["current_step"] = nextStep
-            researchState["is_complete"] = isComplete
-            return {"messages": [response], "research": researchState, "llmCosts": cost}
+                updatedSteps.append({**researchPlan[nextStep], "status": "inProgress"})
+            research = {"research_results": [content], "research_plan": updatedSteps,
+                        "current_step": nextStep, "is_complete": isComplete}
+            return {"messages": [response], "research": research, "llmCosts": cost}
+
+    def dispatch_research(self, state: State) -> list[Send]:
+        """Fan out every step of the research plan to its own research_step branch."""
+        researchState: ResearchState = state["research"]
+        return [Send("research_step", {"messages": [state["messages"][0]], "problem": researchState["problem_statement"], "step": step})
+                for step in researchState["research_plan"]]
+
+    def research_step(self, branch: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute a single research step as an independent branch.
+
+        The branch runs its own search, tool loop and summary, and reports only its own step and result
+        so that the research state reducer can join the branches.
+        """
+        step: ResearchStep = branch["step"]
+        with self.research_slots:
+            self.logger.info(f"Running research step {step['id']}: {step['query']}")
+            search_results = self.searchTool.invoke(step["query"])
+
+            researcher_chain = self.researcher_prompt() | self.researcher_llm
+            # Nothing bounds this loop like the graph's recursion limit bounds the sequential researcher
+            final_chain = (self.researcher_prompt() + [("human", "You have used all of your tool calls.  Write your final research "
+                                                                 "summary now from the information gathered so far.")]) | self.researcher_llm
+            messages = []
+            costs = {}
+            rounds = 0
+            while True:
+                lastRound = rounds >= self.max_tool_rounds
+                response: AIMessage = (final_chain if lastRound else researcher_chain).invoke({
+                    "messages": cache_history(self.context_window.fit(branch["messages"] + messages)), "problem": branch["problem"],
+                    "query": step["query"], "search_results": search_results})
+                costs = merge_llm_costs(costs, llm_cost(response))
+                if lastRound and response.tool_calls:
+                    # Tool calls past the limit are never run, so only the text of the response is kept
+                    response = AIMessage(content=response_text(response), response_metadata=response.response_metadata)
+                messages.append(response)
+                if lastRound or response.response_metadata["stop_reason"] != "tool_use":
+                    break
+                rounds += 1
+                self.focus_tool_calls(response, step["query"], branch["problem"])
+                messages.extend(self.tool_node({"messages": [response]})["messages"])
+
+        content = response.content
+        content = content if isinstance(content, str) else content[0]
+        research = {"research_results": [content], "research_plan": [{**step, "status": "done"}]}
+        return {"messages": messages, "research": research, "llmCosts": costs}
         
     def research_summarizer(self, state: State) -> Dict[str, Any]:
         """Summarize the research results into a Markdown document."""
@@ -168,10 +281,13 @@ class CodeSolutionAgent:
             ("human", prompt_message),
         ])
 
+        # Many or long results are first condensed in parallel and merged in a tree, so this prompt stays bounded
+        notes, costs = self.summarizer.condense(researchState["problem_statement"], researchState["research_results"])
         summary_chain = prompt | self.summarizer_llm
-        response: AIMessage = summary_chain.invoke({"research_output", "\n".join(researchState["research_results"])})
-        researchState["final_research"] = response.content
-        return {"messages": [], "agentStatus": {"research": "done", "code":"inProgress"}, "researchState": researchState}
+        response: AIMessage = summary_chain.invoke({"research_output": "\n\n".join(notes)})
+        return {"messages": [], "agentStatus": {"research": "done", "code":"inProgress"},
+                "research": {"final_research": response.content, "is_complete": True},
+                "llmCosts": merge_llm_costs(costs, llm_cost(response))}
     
     def code_planner(self, state: State) -> Dict[str, Any]:
         self.logger.info("Planning code solution")
@@ -197,13 +313,15 @@ class CodeSolutionAgent:
                 - a brief description of the module including its purpose and what capabilities it will provide to other modules
                 - a file name for the module
                 - a status of pending
+                - depends_on: the list of IDs of the modules this module imports or otherwise needs to be compatible with
 
             Be sure to organize the modules in a logical order that will allow your teammates to implement the solution efficiently.
+            Only list real dependencies, so that modules which do not depend on each other can be implemented at the same time.
 
             Include only the JSON.  Do not include any text before or after the JSON.
 
-            Example: [{{"id": 1, "name": "Some module", "description":"A module that does something important", "file_name":"some_module.py", "status":"pending"}}, 
-                        {{"id": 2, "name": "another module", "description": "This module does something else", "file_name":"another_module.py", "status":"pending"}}]
+            Example: [{{"id": 1, "name": "Some module", "description":"A module that does something important", "file_name":"some_module.py", "status":"pending", "depends_on": []}}, 
+                        {{"id": 2, "name": "another module", "description": "This module does something else", "file_name":"another_module.py", "status":"pending", "depends_on": [1]}}]
         """
 
         prompt = ChatPromptTemplate.from_messages([
@@ -219,13 +337,17 @@ class CodeSolutionAgent:
             Problem Statement: {state["research"]["problem_statement"]} 
 
             Research Results: {state["research"]["final_research"]}
+
+            {self.retrieved_passages(state["research"]["problem_statement"])}
             """
             )]})
-        cost = CodeSolutionAgent.merge_llm_cost(response)
+        cost = llm_cost(response)
         
         print(f"Code Planner Response: {response}")
 
         codePlan = json.loads(response.content)
+        for step in codePlan:
+            step.setdefault("depends_on", [])
         codePlan[0]["status"] = "inProgress"
         codeState = CodingState()
         codeState["code_plan"] = codePlan
@@ -234,22 +356,15 @@ class CodeSolutionAgent:
         codeState["is_complete"] = False
         return {"messages": [response], "agentStatus": {"code": "inProgress"}, "generated_code": codeState, "llmCosts": cost}
 
-    def coder(self, state: State) -> Dict[str, Any]:
-        """Generate a code solution based on the research output."""
-        self.logger.info("Running coder")
-        #self.logger.debug(f"Research State: {state['research']}")
+    def coder_prompt(self) -> ChatPromptTemplate:
+        """Build the prompt used to generate one module of the code plan."""
+        # The instructions and the research are the same for every module, so they are sent as a cached prefix
+        # and the module to implement comes after them
         system_message = """
             Generate a detailed, well-structured, and well documented module as part of a larger code solution to address the user's input. 
             
-            Your teammate has planned the code modules that will be needed to implement the solution.  Your job is to implement the following module.
-            {code_step}
-
-            To achieve this task, you should use your knowledge of the topic and the additional information provided in the
-            research output:
-            {research_output}
-
-            The following modules have already been implemented. You should ensure that your module is compatible with the existing code.
-            {implemented_modules}
+            Your teammate has planned the code modules that will be needed to implement the solution.  Your job is to implement the module
+            described after the research output.
 
             Your response should include:
             - Prefix: A brief description of the problem and approach.
@@ -260,38 +375,161 @@ class CodeSolutionAgent:
             Prefix: This function calculates the factorial of a number.
             Imports: import math
             Code: def factorial(n): return math.factorial(n)
+
+            To achieve this task, you should use your knowledge of the topic and the additional information provided in the
+            research output:
+            {research_output}
         """
+        step_message = """
+            Implement the following module.
+            {code_step}
 
-        code_gen_prompt = ChatPromptTemplate.from_messages([
-            ("system", system_message),
+            The following modules have already been implemented. You should ensure that your module is compatible with the existing code.
+            Unless noted otherwise, only their public interface (imports, signatures and docstrings) is shown.
+            {implemented_modules}
+
+            {source_passages}
+        """
+
+        return ChatPromptTemplate.from_messages([
+            cached_system_prompt(system_message, step_message),
             ("placeholder", "{messages}"),
         ])
 
-        research_output = state["research"]["final_research"]
+    def generate_module(self, step: CodingStep, research_output: str, problem_message, implemented_modules: list[Module]):
+        """Generate the module for one step of the code plan, returning the module and the raw LLM response."""
+        code_gen_chain = self.coder_prompt() | self.coder_llm
+        response = code_gen_chain.invoke({"research_output": research_output, "messages": [problem_message],
+                                          "code_step": step,
+                                          "implemented_modules": describe_modules(implemented_modules, self.full_module_context),
+                                          "source_passages": self.retrieved_passages(f"{step['name']}. {step['description']}")},
+                                         streaming_config("streaming_module", "CodeSolution"))
+        parsed = cast(CodeSolution, response["parsed"])
+        module = Module(prefix=parsed.prefix, language=parsed.language, imports=parsed.imports, code=parsed.code,
+                        file_name=step["file_name"])
+        return module, response["raw"]
+
+    def coder(self, state: State) -> Dict[str, Any]:
+        """Generate a code solution based on the research output."""
+        self.logger.info("Running coder")
+        #self.logger.debug(f"Research State: {state['research']}")
         codePlan: CodingState = state["generated_code"]
         currentStep = CodingStateManager(codePlan).getCurrentStep()
-        implemented_modules = codePlan["modules"]
+        module, raw = self.generate_module(currentStep, state["research"]["final_research"], state["messages"][0], codePlan["modules"])
 
-        code_gen_chain = code_gen_prompt | self.coder_llm
-        response = code_gen_chain.invoke({"research_output": research_output, "messages": [state["messages"][0]],
-                                          "code_step": currentStep, "implemented_modules": implemented_modules})
-        parsed = cast(CodeSolution, response["parsed"])
-        module = Module(prefix=parsed.prefix, imports=parsed.imports, code=parsed.code)
+        nextStep = codePlan["current_step"] + 1
+        codeUpdate = {"modules": [module], "code_plan": [{**currentStep, "status": "done"}], "current_step": nextStep}
+        return {"messages": [raw], "generated_code": codeUpdate, "agentStatus": {"code": "done", "tests": "inProgress", "documentation": "inProgress"},
+                "llmCosts": llm_cost(raw)}
+
+    def coding_scheduler(self, state: State) -> Dict[str, Any]:
+        """Join point for the code_module branches; logs the progress of the code plan."""
+        codePlan: CodingState = state["generated_code"]
+        done = sum(1 for step in codePlan["code_plan"] if step["status"] == "done")
+        self.logger.info(f"Coding progress: {done}/{len(codePlan['code_plan'])} modules done")
+        return {}
 
-        codePlan["modules"].append(module)
-        codePlan["current_step"] += 1
-        codePlan["is_complete"] = codePlan["current_step"] >= len(codePlan["code_plan"])
-        currentStep["status"] = "done"
+    def dispatch_coding(self, state: State):
+        """
+        Send every module whose dependencies are implemented to its own code_module branch.
+
+        Routes to the post-coding branches once the whole code plan is done.
+        """
+        codePlan: CodingState = state["generated_code"]
+        if codePlan["is_complete"]:
+            return list(self.POST_CODING_BRANCHES)
+        codingStateManager = CodingStateManager(codePlan)
+        modulesByFile = {module["file_name"]: module for module in codePlan["modules"]}
+        return [Send("code_module", {"messages": [state["messages"][0]], "research_output": state["research"]["final_research"],
+                                     "step": step,
+                                     "dependencies": [modulesByFile[dependency["file_name"]] for dependency in codingStateManager.getDependencies(step)
+                                                      if dependency["file_name"] in modulesByFile]})
+                for step in codingStateManager.getReadySteps()]
+
+    def code_module(self, branch: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate a single module as an independent branch, given only the modules it depends on."""
+        step: CodingStep = branch["step"]
+        with self.coding_slots:
+            self.logger.info(f"Running coder for module {step['id']}: {step['file_name']}")
+            module, raw = self.generate_module(step, branch["research_output"], branch["messages"][0], branch["dependencies"])
+        codeUpdate = {"modules": [module], "code_plan": [{**step, "status": "done"}]}
+        return {"messages": [raw], "generated_code": codeUpdate, "agentStatus": {"code": "done", "tests": "inProgress", "documentation": "inProgress"},
+                "llmCosts": llm_cost(raw)}
+
+    def run_branch(self, name: str, branch, state: State) -> Dict[str, Any]:
+        """
+        Run a post-coding branch with the branch timeout.
+
+        A branch that times out reports "timedOut" in agentStatus so that the run can finish with the
+        results of the other branches.  Every branch gets its own thread, so the timeout starts when the
+        branch does rather than counting time queued behind other sessions' branches.  A timed out branch
+        is cancelled: its LLM call stops at the next streamed token, or is not made (branch_config).  What
+        it spent until then is logged and added to abandoned_costs, and its result is discarded.
+        """
+        if self.branch_timeout is None:
+            return branch(state)
+        cancelled = threading.Event()
+        context = contextvars.copy_context()
+        context.run(BRANCH_CANCELLED.set, cancelled)
+        outcome = {}
+        def run():
+            try:
+                outcome["update"] = context.run(branch, state)
+            except BaseException as e:
+                outcome["error"] = e
+            if cancelled.is_set():
+                self.discard_branch(name, outcome)
+        thread = threading.Thread(target=run, name=f"post-coding-{name}", daemon=True)
+        thread.start()
+        thread.join(self.branch_timeout)
+        if thread.is_alive():
+            cancelled.set()
+            with self._abandoned_lock:
+                self.abandoned_branches += 1
+            self.logger.warning(f"{name} timed out after {self.branch_timeout} seconds and was cancelled")
+            return {"agentStatus": {self.BRANCH_STATUS[name]: "timedOut"}}
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["update"]
+
+    def discard_branch(self, name: str, outcome: dict):
+        """Log how a cancelled branch ended, and count the LLM costs of its discarded result."""
+        costs = (outcome.get("update") or {}).get("llmCosts") or {}
+        with self._abandoned_lock:
+            self.abandoned_costs = merge_llm_costs(self.abandoned_costs, costs)
+        if isinstance(outcome.get("error"), BranchCancelled):
+            self.logger.info(f"Cancelled {name} stopped its LLM call")
+        elif "error" in outcome:
+            self.logger.info(f"Cancelled {name} failed: {outcome['error']}")
+        else:
+            self.logger.info(f"Cancelled {name} finished after its timeout; its result was discarded "
+                             f"(${sum(cost.get('cost', 0.0) for cost in costs.values()):.4f} of LLM calls)")
+
+    def branch_config(self, state_key: str, tool: str):
+        """streaming_config for the LLM call of a post-coding branch, which stops the call if the branch is cancelled."""
+        config = streaming_config(state_key, tool)
+        cancelled = BRANCH_CANCELLED.get()
+        return config if cancelled is None else with_cancellation(config, cancelled)
+
+    def post_coding_join(self, state: State) -> Dict[str, Any]:
+        """Join point for the tester, documenter and validator branches."""
+        agentStatus = state.get("agentStatus", {})
+        self.logger.info("Post-coding branches finished: " + ", ".join(f"{name}={agentStatus.get(status)}" for name, status in self.BRANCH_STATUS.items()))
+        return {}
 
-        return {"messages": [response["raw"]], "generated_code": codePlan, "agentStatus": {"code": "done", "tests": "inProgress", "documentation": "inProgress"}}
-    
     def tester(self, state: State) -> Dict[str, Any]:
         """Generate tests to validate the code solution."""
+        return self.run_branch("tester", self.generate_tests, state)
+
+    def generate_tests(self, state: State) -> Dict[str, Any]:
         self.logger.info("Running tester")
         system_message = """
             Generate a detailed, well-structured, and well documented set of tests to validate the behavior of the code solution provided. 
             
-            You can assume that the application code will be in a file called app.py and the test code will be in a file called tests.py.
+            The application code is in the following modules, in the directory the tests are run from, so a module is imported by its file name without .py:
+            {module_files}
+
+            The test code will be in a file called {tests_file}.
             
             {code_solution}
 
@@ -306,36 +544,78 @@ class CodeSolutionAgent:
         ])
 
         code_gen_chain = code_gen_prompt | self.coder_llm
-        response = code_gen_chain.invoke({"code_solution": state["generated_code"], "messages": [HumanMessage("Generate a comprehensive suite of tests for the code solution.")]})
+        modules = state["generated_code"]["modules"]
+        moduleFiles = "\n".join(f"- {os.path.basename(module['file_name'])}" for module in modules if module.get("file_name"))
+        testsFile = self.test_runner.tests_file_name(modules)
+        response = code_gen_chain.invoke({"code_solution": state["generated_code"], "module_files": moduleFiles, "tests_file": testsFile,
+                                          "messages": [HumanMessage("Generate a comprehensive suite of tests for the code solution.")]},
+                                         self.branch_config("streaming_tests", "CodeSolution"))
         parsed = cast(CodeSolution, response["parsed"])
-        module = Module(prefix=parsed.prefix, imports=parsed.imports, code=parsed.code)
-
-        return {"messages": [response["raw"]], "generated_tests": module, "agentStatus": {"tests": "done", "validation": "inProgress"}}
+        module = Module(prefix=parsed.prefix, language=parsed.language, imports=parsed.imports, code=parsed.code, file_name=testsFile)
+
+        return {"messages": [response["raw"]], "generated_tests": module, "agentStatus": {"tests": "done", "validation": "inProgress"},
+                "llmCosts": llm_cost(response["raw"])}
+
+    def run_tests(self, state: State) -> Dict[str, Any]:
+        """Execute the generated tests in a sandbox and report the result of every test into validation."""
+        tests = state.get("generated_tests")
+        if not tests:
+            self.logger.info("No generated tests to run")
+            return {}
+        self.logger.info("Running generated tests")
+        return self.test_validation(self.test_runner.run(state["generated_code"]["modules"], tests))
+
+    async def arun_tests(self, state: State) -> Dict[str, Any]:
+        """run_tests for async graph runs (the server), awaiting the sandbox without blocking the event loop."""
+        tests = state.get("generated_tests")
+        if not tests:
+            self.logger.info("No generated tests to run")
+            return {}
+        self.logger.info("Running generated tests")
+        return self.test_validation(await self.test_runner.arun(state["generated_code"]["modules"], tests))
+
+    def test_validation(self, result: dict) -> Dict[str, Any]:
+        self.logger.info(f"Generated tests: {result['passed']} passed, {result['failed']} failed in {result['duration']}s"
+                         + (" (cached)" if result["cached"] else "") + (" (timed out)" if result["timed_out"] else ""))
+        validation = {"test_results": result["tests"], "tests_passed": result["passed"], "tests_failed": result["failed"],
+                      "test_output": result["output"] if result["failed"] or result["run_error"] else ""}
+        return {"validation": validation}
 
     def documenter(self, state: State) -> Dict[str, Any]:
         """Generate documentation for the code solution."""
+        return self.run_branch("documenter", self.generate_documentation, state)
+
+    def generate_documentation(self, state: State) -> Dict[str, Any]:
         self.logger.info("Running documenter")
-        response = self.documenter_llm.invoke(f"Generate markdown documentation for the code solution: {state['generated_code']}")
+        response = self.documenter_llm.invoke(f"Generate markdown documentation for the code solution: {state['generated_code']}",
+                                              self.branch_config("streaming_documentation", "Documentation"))
 
         parsed = cast(Documentation, response["parsed"])
         documentationState = DocumentationState(prefix=parsed.prefix, markdown=parsed.markdown)
-        agentStatus = state.get("agentStatus", {})
-        agentStatus["documentation"] = "done"
-        return {"messages": [response["raw"]], "documentation": documentationState, "agentStatus": {"documentation": "done"}}
+        return {"messages": [response["raw"]], "documentation": documentationState, "agentStatus": {"documentation": "done"},
+                "llmCosts": llm_cost(response["raw"])}
 
     def validator(self, state: State) -> Dict[str, Any]:
         """Validate the generated code and tests, and provide a code review."""
+        return self.run_branch("validator", self.review_code, state)
+
+    def review_code(self, state: State) -> Dict[str, Any]:
         self.logger.info("Running validator")
-        generated_code = state["generated_code"]
-        generated_tests = state["generated_tests"]
-        code_to_validate = f"Application Code: {generated_code["imports"]}\n\n{generated_code["code"]} \n\nTest Code: {generated_tests["imports"]}\n\n{generated_tests["code"]}"
+        # The tests are generated in parallel with the review, so they are only included when already present
+        modules = list(state["generated_code"]["modules"])
+        if state.get("generated_tests"):
+            modules.append(state["generated_tests"])
+        code_to_validate = "\n\n".join(f"# File: {module.get('file_name')}\n{module['imports']}\n\n{module['code']}" for module in modules)
         validation = Validation()
         validation["compile_errors"] = []
 
-        try:
-            compile(code_to_validate, "<string>", "exec")
-        except Exception as e:
-            validation["compile_errors"].append(e)
+        for module in modules:
+            if module.get("language", "python").lower() not in ("python", "py"):
+                continue
+            try:
+                compile(f"{module['imports']}\n{module['code']}", module.get("file_name") or "<string>", "exec")
+            except Exception as e:
+                validation["compile_errors"].append(f"{module.get('file_name')}: {e}")
 
         code_review_prompt = f"""
             You are an expert coder who is adept at finding errors, performance issues, testability issues, and security flaws in code.
@@ -349,9 +629,10 @@ class CodeSolutionAgent:
             {code_to_validate}
         """
 
-        response = self.reviewer_llm.invoke(code_review_prompt)
+        response = self.reviewer_llm.invoke(code_review_prompt, self.branch_config("streaming_review", "CodeReview"))
         code_review = cast(CodeReview, response["parsed"])
         validation["feedback"] =  code_review.feedback
         validation["reviewed_code"] = code_review.reviewed_code
 
-        return {"validation": validation, "messages": [response["raw"]], "agentStatus": {"validation": "done"}}
\ No newline at end of file
+        return {"validation": validation, "messages": [response["raw"]], "agentStatus": {"validation": "done"},
+                "llmCosts": llm_cost(response["raw"])}
\ No newline at end of file
@@ -1,15 +1,26 @@
 from dotenv import load_dotenv
-import time, pickle, logging, argparse, os, pprint
+import time, pickle, logging, argparse, os, pprint, uuid
 
 import langchain
 from langgraph.graph import StateGraph, START, END
 from langchain_anthropic import ChatAnthropic
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langgraph.prebuilt import ToolNode, tools_condition
+from langchain_core.runnables import RunnableLambda
 from langgraph.checkpoint.memory import MemorySaver
 
 from state import State, CodeSolution, Documentation, CodeReview, StateWrapper
 from utils import URLRetrievalTool, set_env, configure_logging
+from content_index import ContentIndexes
+from summarizer import HierarchicalSummarizer
+from cache import SearchCache, LLMResponseCache
+from checkpointer import SQLiteCheckpointer
+from journal import StateJournal
+from costs import CostLedger, CostCallbackHandler
+from scheduler import ModelScheduler, ScheduledModel, parse_limits
+from routing import ModelRouter, RoutedModel, valid_json_list, valid_structured_output
+from streaming import TokenPrinter
+from batch import BatchRunner, read_prompts
 from agent import CodeSolutionAgent
 
 # Define model constants for easy configuration and reuse
@@ -23,56 +34,107 @@ def configure_environment():
     set_env("TAVILY_API_KEY")
     #langchain.debug = True
 
-def create_llms(search_tool, url_tool):
-    """Create and configure the language models with necessary tools and structured outputs."""
-    base_llm = ChatAnthropic(model=HAIKU_MODEL)
-    planner_llm = base_llm
-    researcher_llm = base_llm.bind_tools([url_tool])
-    summary_llm = ChatAnthropic(model=HAIKU_MODEL, max_tokens=4096)
-    documenter_llm = base_llm.with_structured_output(Documentation, include_raw=True)
-    coder_llm = ChatAnthropic(model=HAIKU_MODEL, max_tokens=4096).with_structured_output(CodeSolution, include_raw=True)
-    reviewer_llm = ChatAnthropic(model=SONNET_MODEL, max_tokens=4096).with_structured_output(CodeReview, include_raw=True)
-    return planner_llm, researcher_llm, summary_llm, coder_llm, documenter_llm, reviewer_llm
-
-def build_graph(graph_builder, agent, tools, checkpointer=None):
-    """Construct the state graph with nodes and edges for the code solution process."""
+def create_llms(search_tool, url_tool, llm_cache=None, callbacks=None, scheduler: ModelScheduler = None, router: ModelRouter = None):
+    """
+    Create and configure the language models with necessary tools and structured outputs.
+
+    An optional LLMResponseCache is shared by every model so unchanged prompts are answered from the cache.
+    Callbacks, such as a CostCallbackHandler, are attached to every model.  When a ModelScheduler is given,
+    every call is rate limited and queued fairly across threads by it.  When a ModelRouter is given, every
+    model is created on both Haiku and Sonnet and the router picks one per call; planner and structured
+    outputs that cannot be parsed are retried on Sonnet.  Otherwise only the model each node uses is created.
+    """
+    chatModels = {}
+    def chat_model(model: str, large: bool) -> ChatAnthropic:
+        if (model, large) not in chatModels:
+            chatModels[model, large] = ChatAnthropic(model=model, cache=llm_cache, callbacks=callbacks, **({"max_tokens": 4096} if large else {}))
+        return chatModels[model, large]
+
+    # Per node, in the order they are returned: whether it needs a long answer, and how the chat model is wrapped for it
+    roles = {"planner": (False, lambda llm: llm), "researcher": (False, lambda llm: llm.bind_tools([url_tool])),
+             "summarizer": (True, lambda llm: llm), "coder": (True, lambda llm: llm.with_structured_output(CodeSolution, include_raw=True)),
+             "documenter": (False, lambda llm: llm.with_structured_output(Documentation, include_raw=True)),
+             "reviewer": (True, lambda llm: llm.with_structured_output(CodeReview, include_raw=True))}
+
+    def node_llm(role: str, model: str):
+        large, wrap = roles[role]
+        llm = wrap(chat_model(model, large))
+        return ScheduledModel(llm, scheduler, model) if scheduler is not None else llm
+
+    if router is not None:
+        validators = {"planner": valid_json_list, "coder": valid_structured_output, "documenter": valid_structured_output,
+                      "reviewer": valid_structured_output}
+        return tuple(RoutedModel({model: node_llm(role, model) for model in router.models}, router, validators.get(role)) for role in roles)
+    # Only the reviewer runs on Sonnet
+    return tuple(node_llm(role, SONNET_MODEL if role == "reviewer" else HAIKU_MODEL) for role in roles)
+
+def build_graph(graph_builder, agent, tools, checkpointer=None, parallel_research=False, parallel_coding=False):
+    """
+    Construct the state graph with nodes and edges for the code solution process.
+
+    When parallel_research is set, research_planner fans out every research step to a concurrent
+    research_step branch instead of looping through the steps in the researcher node.
+
+    When parallel_coding is set, every module of the code plan whose dependencies are implemented is
+    generated concurrently in a code_module branch, instead of one module per visit of the coder node.
+    """
     graph_builder.add_node("research_planner", agent.research_planner)    
-    graph_builder.add_node("researcher", agent.researcher)
-    tool_node = ToolNode(tools=tools)
-    graph_builder.add_node("tools", tool_node)
     graph_builder.add_node("research_summarizer", agent.research_summarizer)
     graph_builder.add_node("code_planner", agent.code_planner)
-    graph_builder.add_node("coder", agent.coder)
-    #graph_builder.add_node("documenter", agent.documenter)
+    graph_builder.add_node("documenter", agent.documenter)
     graph_builder.add_node("tester", agent.tester)
-    #graph_builder.add_node("validator", agent.validator)
-
-    def research_condition(state):
-        if tools_condition(state) == END:
-            if state["research"]["is_complete"]:
-                return END
-            return "loop"
-        return "tools"
-    
-    # Define conditional and direct edges between nodes
-    graph_builder.add_conditional_edges(
-        "researcher",
-        research_condition,
-        {"tools": "tools", "loop":"researcher", END: "research_summarizer"},
-    )
-
-    graph_builder.add_conditional_edges("coder", 
-                                        (lambda state: END if state["generated_code"]["is_complete"] else "loop"), 
-                                        {"loop": "coder", END: "tester"})
+    graph_builder.add_node("validator", agent.validator)
+    # Sync runs (the CLI) block on the sandbox, async runs (the server) await it
+    graph_builder.add_node("test_runner", RunnableLambda(agent.run_tests, afunc=agent.arun_tests, name="test_runner"))
+
+    if parallel_research:
+        graph_builder.add_node("research_step", agent.research_step)
+        graph_builder.add_conditional_edges("research_planner", agent.dispatch_research, ["research_step"])
+        graph_builder.add_edge("research_step", "research_summarizer")
+    else:
+        graph_builder.add_node("researcher", agent.researcher)
+        tool_node = ToolNode(tools=tools)
+        graph_builder.add_node("tools", tool_node)
+
+        def research_condition(state):
+            if tools_condition(state) == END:
+                if state["research"]["is_complete"]:
+                    return END
+                return "loop"
+            return "tools"
+
+        # Define conditional and direct edges between nodes
+        graph_builder.add_conditional_edges(
+            "researcher",
+            research_condition,
+            {"tools": "tools", "loop":"researcher", END: "research_summarizer"},
+        )
+        graph_builder.add_edge("research_planner", "researcher")
+        graph_builder.add_edge("tools", "researcher")
+
+    if parallel_coding:
+        # Branches join in coding_scheduler so that each wave of ready modules is dispatched once
+        graph_builder.add_node("code_module", agent.code_module)
+        graph_builder.add_node("coding_scheduler", agent.coding_scheduler)
+        graph_builder.add_edge("code_planner", "coding_scheduler")
+        graph_builder.add_edge("code_module", "coding_scheduler")
+        graph_builder.add_conditional_edges("coding_scheduler", agent.dispatch_coding, ["code_module", *agent.POST_CODING_BRANCHES])
+    else:
+        graph_builder.add_node("coder", agent.coder)
+        graph_builder.add_edge("code_planner", "coder")
+        graph_builder.add_conditional_edges("coder", 
+                                            (lambda state: list(agent.POST_CODING_BRANCHES) if state["generated_code"]["is_complete"] else "coder"), 
+                                            ["coder", *agent.POST_CODING_BRANCHES])
 
     graph_builder.add_edge(START, "research_planner")
-    graph_builder.add_edge("research_planner", "researcher")
-    graph_builder.add_edge("tools", "researcher")
     graph_builder.add_edge("research_summarizer", "code_planner")
-    #graph_builder.add_edge("tester", "documenter")
-    #graph_builder.add_edge("tester", "validator")
-    #graph_builder.add_edge("documenter", END)
-    #graph_builder.add_edge("validator", END)
+
+    # The tester, documenter and validator run in parallel and join before the run ends.  The generated
+    # tests are executed as soon as they are written.
+    graph_builder.add_node("post_coding_join", agent.post_coding_join)
+    graph_builder.add_edge("tester", "test_runner")
+    graph_builder.add_edge(["test_runner", "documenter", "validator"], "post_coding_join")
+    graph_builder.add_edge("post_coding_join", END)
 
     return graph_builder.compile(checkpointer=checkpointer)
 
@@ -117,13 +179,30 @@ def output_state(eventName, graph, config, output_dir="output/state"):
         pickle.dump(graph_state, file)
 
 
-def stream_graph_updates(graph, user_input: str, config, log_file="logs/llm.log"):
-    """Stream updates from the graph execution and log the LLM interactions."""
-    for event in graph.stream({"messages": [("user", user_input)]}, config=config):
-        eventName = list(event.keys())[0]
-        print(f"Saving post event state file from {eventName}")
-        #pprint.pprint(event)
-        output_state(eventName, graph, config)
+def stream_graph_updates(graph, user_input: str, config, log_file="logs/llm.log", journal: StateJournal = None, output_dir="output/state",
+                         stream_tokens=False):
+    """
+    Stream updates from the graph execution and log the LLM interactions.
+
+    Each event's update is appended to a state journal (one compressed file per run) instead of pickling
+    the whole state after every event.  Use journal.JournalReader to rebuild the state at any event.
+    With stream_tokens, the LLM output of every node is also printed token by token as it is generated.
+    """
+    graph_input = {"messages": [("user", user_input)]}
+    if journal is None:
+        journal = StateJournal(os.path.join(output_dir, f"{config['configurable']['thread_id']}_{time.time()}.journal"))
+    with journal:
+        journal.record_input(graph_input)
+        printTokens = TokenPrinter()
+        for mode, event in graph.stream(graph_input, config=config, stream_mode=["updates", "messages"] if stream_tokens else ["updates"]):
+            if mode == "messages":
+                printTokens(*event)
+                continue
+            eventName = list(event.keys())[0]
+            print(f"Journaling post event state update from {eventName}")
+            #pprint.pprint(event)
+            journal.record_event(event, graph, config)
+        journal.snapshot(graph.get_state(config=config).values)
 
 def parse_args():
     """Parse command-line arguments for configuring the assistant run."""
@@ -131,6 +210,45 @@ def parse_args():
     parser.add_argument("--user-input", type=str, help="The user input to provide to the assistant", dest="input")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
     parser.add_argument("--show-graph", action="store_true", help="Show the graph instead of running the assistant")
+    parser.add_argument("--parallel-research", action="store_true", help="Run the research plan steps concurrently")
+    parser.add_argument("--research-concurrency", type=int, default=4, help="Maximum number of research steps to run at once")
+    parser.add_argument("--parallel-coding", action="store_true", help="Generate independent modules of the code plan concurrently")
+    parser.add_argument("--coding-concurrency", type=int, default=4, help="Maximum number of modules to generate at once")
+    parser.add_argument("--stream-tokens", action="store_true", help="Print the LLM output of every node as it is generated")
+    parser.add_argument("--thread-id", help="Thread to run in, e.g. to resume a run kept with --checkpoint-db (default: a new thread)")
+    parser.add_argument("--branch-timeout", type=float, help="Seconds the tester, documenter and validator each get to finish")
+    parser.add_argument("--full-module-context", action="store_true",
+                        help="Send the full source of implemented modules to the coder instead of their interfaces")
+    parser.add_argument("--llm-cache", choices=LLMResponseCache.MODES, help="Record LLM responses to, or replay them from, the LLM cache")
+    parser.add_argument("--llm-cache-path", default=".cache/llm.sqlite", help="Path of the LLM response cache")
+    parser.add_argument("--route-models", action="store_true",
+                        help="Pick Haiku or Sonnet per call from the node, prompt size, budget and latency, instead of a fixed model per node")
+    parser.add_argument("--run-budget", type=float, help="With --route-models, USD a run may spend before every call falls back to the cheapest model")
+    parser.add_argument("--latency-slo", type=float, help="With --route-models, seconds a call should take; slower models are avoided")
+    parser.add_argument("--content-index-dir", default=".cache/content_index",
+                        help="Directory where the pages retrieved during each run are kept for the code planner and coder")
+    parser.add_argument("--content-index-max-files", type=int, default=1000,
+                        help="Number of runs whose retrieved pages are kept in the content index directory")
+    parser.add_argument("--content-index-max-age", type=float, default=7 * 24 * 3600,
+                        help="Seconds the retrieved pages of a run are kept in the content index directory")
+    parser.add_argument("--source-passages", type=int, default=4,
+                        help="Number of passages of the retrieved pages added to the code planner and coder prompts")
+    parser.add_argument("--summary-fan-in", type=int, default=4,
+                        help="Number of research notes merged per call when condensing many research results")
+    parser.add_argument("--summary-cache-path", default=".cache/summaries.sqlite", help="Path of the cache of condensed research results")
+    parser.add_argument("--rpm", action="append", metavar="[MODEL=]N",
+                        help="Requests per minute allowed for a model (name prefix), or for every model; 0 for unlimited.  Repeatable")
+    parser.add_argument("--tpm", action="append", metavar="[MODEL=]N",
+                        help="Input tokens per minute allowed for a model (name prefix), or for every model; 0 for unlimited.  Repeatable")
+    parser.add_argument("--checkpoint-db", help="Store checkpoints durably in this SQLite file instead of in memory")
+    parser.add_argument("--keep-checkpoints", type=int, help="Number of checkpoints to keep per thread in the checkpoint database")
+
+    subparsers = parser.add_subparsers(dest="command")
+    batchParser = subparsers.add_parser("batch", help="Run every prompt of a JSONL file through the graph concurrently")
+    batchParser.add_argument("prompts", help="JSONL file with one {\"id\": ..., \"prompt\": ...} object per line")
+    batchParser.add_argument("--output-dir", default="output/batch", help="Directory for the results, journals and manifest")
+    batchParser.add_argument("--workers", type=int, default=4, help="Number of prompts to run at once")
+    batchParser.add_argument("--retry-failed", action="store_true", help="Run the items that failed in an earlier run again")
     return parser.parse_args()
 
 def main():
@@ -140,15 +258,37 @@ def main():
 
     # Set up the graph and agents
     logger = configure_logging()
-    memory_checkpointer = MemorySaver()
+    checkpointer = SQLiteCheckpointer(args.checkpoint_db, keep_last=args.keep_checkpoints) if args.checkpoint_db else MemorySaver()
     search_tool = TavilySearchResults(max_results=2)
-    url_tool = URLRetrievalTool()
+    content_index = ContentIndexes(directory=args.content_index_dir, max_files=args.content_index_max_files,
+                                   max_age=args.content_index_max_age)
+    url_tool = URLRetrievalTool(content_index=content_index)
     tools = [search_tool, url_tool]
     graph_builder = StateGraph(State)
-    planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm = create_llms(search_tool, url_tool)
-    agent = CodeSolutionAgent(planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm, search_tool, logger)
-    graph = build_graph(graph_builder, agent, tools , memory_checkpointer)
-    config = {"configurable": {"thread_id": "1"}}
+    llm_cache = LLMResponseCache(args.llm_cache_path, mode=args.llm_cache) if args.llm_cache else None
+    ledger = CostLedger()
+    router = ModelRouter([HAIKU_MODEL, SONNET_MODEL], latency_slo=args.latency_slo, run_budget=args.run_budget,
+                         logger=logger) if args.route_models else None
+    planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm = create_llms(search_tool, url_tool, llm_cache,
+                                                                                                       [CostCallbackHandler(ledger)], ModelScheduler(parse_limits(args.rpm, args.tpm)),
+                                                                                                       router)
+    agent = CodeSolutionAgent(planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm, SearchCache(search_tool), logger,
+                              tools=tools, max_research_concurrency=args.research_concurrency, max_coding_concurrency=args.coding_concurrency,
+                              full_module_context=args.full_module_context, branch_timeout=args.branch_timeout,
+                              content_index=content_index, source_passages=args.source_passages,
+                              summarizer=HierarchicalSummarizer(summarizer_llm, args.summary_fan_in, max_concurrency=args.research_concurrency,
+                                                                path=args.summary_cache_path, logger=logger))
+    graph = build_graph(graph_builder, agent, tools , checkpointer, parallel_research=args.parallel_research,
+                        parallel_coding=args.parallel_coding)
+    if args.command == "batch":
+        runner = BatchRunner(graph, args.output_dir, args.workers, ledger, logger, retry_failed=args.retry_failed)
+        summary = runner.run(read_prompts(args.prompts))
+        logger.info(f"Batch finished: {summary['ran']} run, {summary['done']} done, {summary['failed']} failed")
+        return
+
+    # Every run gets its own thread unless an earlier thread is resumed
+    config = {"configurable": {"thread_id": args.thread_id or str(uuid.uuid4())}}
+    logger.info(f"Thread id: {config['configurable']['thread_id']}")
 
     # Display the graph if requested, otherwise run the assistant
     if args.show_graph:
@@ -157,7 +297,10 @@ def main():
 
     # Execute the graph with user input
     user_input = args.input or input("User: ")
-    stream_graph_updates(graph, user_input, config)
+    stream_graph_updates(graph, user_input, config, stream_tokens=args.stream_tokens)
+    logger.info(f"LLM usage: {pprint.pformat(ledger.thread(config['configurable']['thread_id']), sort_dicts=False)}")
+    if router is not None:
+        logger.info(f"Model routing: {pprint.pformat(router.stats(), sort_dicts=False)}")
     #output_results(graph, config)
 
 def display_graph(graph):
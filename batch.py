@@ -0,0 +1,147 @@
+import hashlib, json, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Optional
+from costs import CostLedger
+from journal import StateJournal
+
+MANIFEST = "manifest.jsonl"
+
+def read_prompts(path: str) -> list[dict]:
+    """
+    Read a JSONL file of prompts.  Each line is an object with a "prompt" (or "input") and an optional "id";
+    lines without an id are identified by a hash of their prompt, so the ids are stable across runs.
+    """
+    items = []
+    with open(path) as file:
+        for lineNumber, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            prompt = record.get("prompt") or record.get("input")
+            if not prompt:
+                raise ValueError(f"{path}:{lineNumber} has no prompt")
+            itemId = str(record.get("id") or hashlib.sha256(prompt.encode()).hexdigest()[:12])
+            items.append({"id": re.sub(r"[^\w.-]", "_", itemId), "prompt": prompt})
+    return items
+
+def read_manifest(output_dir: str) -> dict[str, dict]:
+    """The latest manifest record of every item, so an interrupted batch can be resumed."""
+    records = {}
+    path = os.path.join(output_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by an interrupted write
+                records[record["id"]] = record
+    return records
+
+def write_results(state: dict, output_dir: str):
+    """Write the generated modules, tests, documentation, research and review of a finished run."""
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write(file_name: str, content: str):
+        with open(os.path.join(output_dir, os.path.basename(file_name)), "w") as file:
+            file.write(content)
+
+    for module in state.get("generated_code", {}).get("modules", []):
+        write(module["file_name"], f'"""{module["prefix"]}"""\n\n{module["imports"]}\n\n{module["code"]}\n')
+    if state.get("generated_tests"):
+        tests = state["generated_tests"]
+        write(tests.get("file_name") or "tests.py", f'"""{tests["prefix"]}"""\n\n{tests["imports"]}\n\n{tests["code"]}\n')
+    if state.get("documentation"):
+        write("documentation.md", state["documentation"]["markdown"])
+    if state.get("research", {}).get("final_research"):
+        write("research.md", state["research"]["final_research"])
+    validation = state.get("validation") or {}
+    if validation:
+        write("review.md", "# Code Review Notes and Suggestions\n\n## Compile Errors:\n\n" +
+              ("\n".join(validation.get("compile_errors", [])) or "No compile errors found.") +
+              f"\n\n## Tests:\n\n{validation.get('tests_passed', 0)} passed, {validation.get('tests_failed', 0)} failed" +
+              (f"\n\n## Feedback:\n\n{validation['feedback']}\n\n```python\n{validation.get('reviewed_code', '')}\n```" if validation.get("feedback") else ""))
+
+class BatchRunner:
+    """
+    Run a corpus of prompts through one compiled graph on a pool of workers.
+
+    Every prompt runs on its own thread id (batch-<id>) with batch priority, and writes its results and
+    state journal to <output_dir>/<id>/ as soon as it finishes.  Each finished or failed item is
+    appended to <output_dir>/manifest.jsonl, so a rerun skips the items that are already done.  With a
+    durable checkpointer, an item that was interrupted mid-run resumes from its last checkpoint.
+    """
+
+    def __init__(self, graph, output_dir: str, workers: int = 4, ledger: Optional[CostLedger] = None, logger=None,
+                 retry_failed: bool = False):
+        self.graph = graph
+        self.output_dir = output_dir
+        self.workers = workers
+        self.ledger = ledger
+        self.logger = logger
+        self.retry_failed = retry_failed
+        self._lock = threading.Lock()
+
+    def pending(self, items: list[dict]) -> list[dict]:
+        manifest = read_manifest(self.output_dir)
+        skip = {"done", "failed"} if not self.retry_failed else {"done"}
+        return [item for item in items if manifest.get(item["id"], {}).get("status") not in skip]
+
+    def run(self, items: list[dict]) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        pending = self.pending(items)
+        self._log(f"Batch: {len(items) - len(pending)} of {len(items)} items already done, running {len(pending)}")
+        counts = {"done": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            futures = [executor.submit(self.run_item, item) for item in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                counts[record["status"]] += 1
+                self._log(f"Batch: {record['id']} {record['status']} in {record['duration']}s "
+                          f"({counts['done'] + counts['failed']}/{len(pending)})")
+        summary = {"items": len(items), "ran": len(pending), **counts}
+        if self.ledger is not None:
+            costs = self.ledger.summary()
+            summary["costs"] = {"models": costs["models"], "nodes": costs["nodes"]}
+        with open(os.path.join(self.output_dir, "summary.json"), "w") as file:
+            json.dump(summary, file, indent=2)
+        return summary
+
+    def run_item(self, item: dict) -> dict:
+        threadId = f"batch-{item['id']}"
+        config = {"configurable": {"thread_id": threadId, "priority": "batch"}}
+        itemDir = os.path.join(self.output_dir, item["id"])
+        start = time.perf_counter()
+        record: dict[str, Any] = {"id": item["id"], "thread_id": threadId}
+        try:
+            snapshot = self.graph.get_state(config)
+            graph_input = None
+            if snapshot.next:
+                self._log(f"Batch: resuming {item['id']} at {', '.join(snapshot.next)}")
+            else:
+                graph_input = {"messages": [("user", item["prompt"])]}
+            with StateJournal(os.path.join(itemDir, "state.journal")) as journal:
+                if graph_input is not None:
+                    journal.record_input(graph_input)
+                for event in self.graph.stream(graph_input, config=config):
+                    journal.record_event(event, self.graph, config)
+                journal.snapshot(self.graph.get_state(config).values)
+            state = self.graph.get_state(config).values
+            write_results(state, itemDir)
+            record.update(status="done", llm_costs=state.get("llmCosts", {}), agent_status=state.get("agentStatus", {}))
+        except Exception as error:
+            record.update(status="failed", error=f"{type(error).__name__}: {error}")
+            if self.logger:
+                self.logger.exception(f"Batch item {item['id']} failed")
+        record["duration"] = round(time.perf_counter() - start, 2)
+        if self.ledger is not None:
+            record["usage"] = (self.ledger.thread(threadId) or {}).get("total")
+        with self._lock, open(os.path.join(self.output_dir, MANIFEST), "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+        return record
+
+    def _log(self, message: str):
+        if self.logger:
+            self.logger.info(message)
+        else:
+            print(message)
@@ -0,0 +1,420 @@
+import argparse, contextlib, functools, io, json, logging, os, pickle, platform, statistics, subprocess, tempfile, threading, time, timeit
+from importlib.metadata import PackageNotFoundError, version
+from concurrent.futures import Future
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
+
+from state import State, CodeSolution, Documentation, CodeReview, LLMCost, Module, TestResult, merge_agent_status, merge_llm_costs
+from agent import CodeSolutionAgent
+from app import build_graph, output_state
+from cache import SQLiteCache
+from costs import CostLedger, CostCallbackHandler
+from journal import StateJournal
+from sandbox import TestRunner
+
+RESULTS_FILE = "benchmarks/results.jsonl"
+
+# The agent methods registered as graph nodes, by node name
+NODE_METHODS = {"research_planner": "research_planner", "researcher": "researcher", "research_step": "research_step",
+                "research_summarizer": "research_summarizer", "code_planner": "code_planner", "coder": "coder",
+                "code_module": "code_module", "coding_scheduler": "coding_scheduler", "tester": "tester", "test_runner": "run_tests",
+                "documenter": "documenter", "validator": "validator", "post_coding_join": "post_coding_join"}
+
+class Timeline:
+    """Thread-safe record of the intervals spent inside graph nodes and tools."""
+
+    def __init__(self):
+        self.intervals: list[tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float):
+        with self._lock:
+            self.intervals.append((name, start, end))
+
+    def timed(self, name: str, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, start, time.perf_counter())
+        return wrapper
+
+    def busy(self) -> float:
+        """Total time during which at least one node or tool was running."""
+        total, end = 0.0, float("-inf")
+        for _, start, finish in sorted(self.intervals, key=lambda interval: interval[1]):
+            if finish > end:
+                total += finish - max(start, end)
+                end = finish
+        return total
+
+class FakeChatModel(BaseChatModel):
+    """
+    A deterministic chat model that answers every prompt of the agent after a fixed latency.
+
+    Plans, tool calls and structured outputs are recognized from the prompt and the bound tools, so the
+    real prompts, output parsers and graph run unchanged.  Text answers are payload_chars long.
+    """
+
+    model: str = "fake-haiku"
+    latency: float = 0.0
+    payload_chars: int = 2000
+    research_steps: int = 3
+    modules: int = 3
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, tool_choice: Optional[str] = None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], tool_choice=tool_choice, **kwargs)
+
+    def _tool_call(self, name: str, args: dict, messages: List[BaseMessage]) -> AIMessage:
+        return AIMessage("", tool_calls=[{"name": name, "args": args, "id": f"call_{name}_{len(messages)}"}])
+
+    def _answer(self, messages: List[BaseMessage], tools: list) -> AIMessage:
+        text = "\n".join(str(message.content) for message in messages)
+        toolNames = [tool["function"]["name"] for tool in tools or []]
+        padding = ("lorem ipsum " * (self.payload_chars // 12 + 1))[:self.payload_chars]
+        if "CodeSolution" in toolNames:
+            if "suite of tests" in text:
+                return self._tool_call("CodeSolution", {"prefix": padding, "language": "python", "imports": "import unittest",
+                                                        "code": "class GeneratedTests(unittest.TestCase):\n    def test_passes(self):\n        self.assertTrue(True)\n"},
+                                       messages)
+            index = text.count("# File:") + 1
+            return self._tool_call("CodeSolution", {"prefix": padding, "language": "python", "imports": "import os",
+                                                    "code": f"def function_{index}():\n    \"\"\"Return {index}.\"\"\"\n    return {index}\n"}, messages)
+        if "Documentation" in toolNames:
+            return self._tool_call("Documentation", {"prefix": "Documentation", "markdown": f"# Documentation\n\n{padding}"}, messages)
+        if "CodeReview" in toolNames:
+            return self._tool_call("CodeReview", {"feedback": padding, "reviewed_code": "# reviewed"}, messages)
+        if "search queries" in text:
+            return AIMessage(json.dumps([{"id": step, "query": f"query {step}", "status": "pending"}
+                                         for step in range(1, self.research_steps + 1)]))
+        if "plan the code modules" in text.lower():
+            # Every module but the last is independent, so parallel coding has work to overlap
+            return AIMessage(json.dumps([{"id": module, "name": f"module {module}", "description": f"Module {module}",
+                                          "file_name": f"module_{module}.py", "status": "pending",
+                                          "depends_on": list(range(1, module)) if module == self.modules else []}
+                                         for module in range(1, self.modules + 1)]))
+        if "url_retrieval" in toolNames and not any(isinstance(message, ToolMessage) for message in messages):
+            return self._tool_call("url_retrieval", {"url": f"https://example.com/{len(messages)}"}, messages)
+        return AIMessage(padding)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        message = self._answer(messages, kwargs.get("tools"))
+        inputTokens = sum(len(str(prompt.content)) for prompt in messages) // 4
+        outputTokens = (len(message.content) + len(json.dumps([call["args"] for call in message.tool_calls]))) // 4
+        message.response_metadata = {"model": self.model, "stop_reason": "tool_use" if message.tool_calls else "end_turn",
+                                     "usage": {"input_tokens": inputTokens, "output_tokens": outputTokens}}
+        message.usage_metadata = {"input_tokens": inputTokens, "output_tokens": outputTokens, "total_tokens": inputTokens + outputTokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+class FakeSearchTool(BaseTool):
+    """Stands in for TavilySearchResults: two results of payload_chars each, after a fixed latency."""
+
+    name: str = "tavily_search_results_json"
+    description: str = "Search the web."
+    latency: float = 0.0
+    payload_chars: int = 2000
+    timeline: Optional[Any] = None
+
+    def _run(self, query: str) -> list[dict]:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        results = [{"url": f"https://example.com/{query.replace(' ', '-')}/{result}", "content": (query + " ") * (self.payload_chars // (len(query) + 1))}
+                   for result in range(2)]
+        if self.timeline is not None:
+            self.timeline.add("search", start, time.perf_counter())
+        return results
+
+class FakeURLRetrievalTool(BaseTool):
+    """Stands in for URLRetrievalTool: the text of a page of payload_chars, after a fixed latency."""
+
+    name: str = "url_retrieval"
+    description: str = "Retrieve and parse text from a URL."
+    latency: float = 0.0
+    payload_chars: int = 2000
+    timeline: Optional[Any] = None
+
+    def _run(self, url: str, query: Optional[str] = None) -> str:
+        start = time.perf_counter()
+        time.sleep(self.latency)
+        text = (f"Text of {url}. " * (self.payload_chars // (len(url) + 10) + 1))[:self.payload_chars]
+        if self.timeline is not None:
+            self.timeline.add("url_retrieval", start, time.perf_counter())
+        return text
+
+class FakeTestRunner(TestRunner):
+    """Stands in for TestRunner: every generated test passes after a fixed latency, without starting a subprocess."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def submit(self, modules: list[Module], tests: Module) -> Future:
+        time.sleep(self.latency)
+        future = Future()
+        future.set_result({"passed": 1, "failed": 0, "timed_out": False, "exit_code": 0, "run_error": False, "duration": self.latency,
+                           "tests": [TestResult(name="tests.GeneratedTests.test_passes", outcome="passed", message="")],
+                           "output": "", "cached": False})
+        return future
+
+    def close(self):
+        pass
+
+def build_benchmark_graph(args, timeline: Timeline, checkpointer, cache_dir: str):
+    """
+    The real graph topology, with fake models, tools and test runner, and every agent node timed into the timeline.
+
+    With --real-sandbox the generated tests run in the real sandboxed subprocess, which is timed as "sandbox".
+    """
+    llm = FakeChatModel(latency=args.llm_latency, payload_chars=args.payload_chars, research_steps=args.research_steps, modules=args.modules,
+                        callbacks=[CostCallbackHandler(CostLedger())])
+    searchTool = FakeSearchTool(latency=args.tool_latency, payload_chars=args.payload_chars, timeline=timeline)
+    urlTool = FakeURLRetrievalTool(latency=args.tool_latency, payload_chars=args.payload_chars, timeline=timeline)
+    tools = [searchTool, urlTool]
+    if args.real_sandbox:
+        testRunner = TestRunner(cache=SQLiteCache(os.path.join(cache_dir, "test_results.sqlite"), table="test_results"))
+    else:
+        testRunner = FakeTestRunner(args.sandbox_latency)
+    testRunner.run = timeline.timed("sandbox", testRunner.run)
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.WARNING)
+    agent = CodeSolutionAgent(llm, llm.bind_tools([urlTool]), llm, llm.with_structured_output(CodeSolution, include_raw=True),
+                              llm.with_structured_output(Documentation, include_raw=True), llm.with_structured_output(CodeReview, include_raw=True),
+                              searchTool, logger, tools=tools, test_runner=testRunner)
+    for node, method in NODE_METHODS.items():
+        setattr(agent, method, timeline.timed(node, getattr(agent, method)))
+    return build_graph(StateGraph(State), agent, tools, checkpointer, parallel_research=args.parallel_research,
+                       parallel_coding=args.parallel_coding)
+
+def bench_graph(args, cache_dir: str) -> dict:
+    """
+    Run the graph repeat times and split the wall time into time spent inside nodes and tools, and the rest.
+
+    The rest is the framework overhead: scheduling, reducers, checkpointing and callbacks.  Overlapping
+    branches are counted once.  The gap is the time between the previous node finishing and a node starting.
+    """
+    runs = []
+    for run in range(args.repeat):
+        timeline = Timeline()
+        graph = build_benchmark_graph(args, timeline, MemorySaver(), cache_dir)
+        config = {"configurable": {"thread_id": f"benchmark-{run}"}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            executions = sum(len(event) for event in graph.stream({"messages": [("user", args.prompt)]}, config=config))
+            wall = time.perf_counter() - start
+        busy = timeline.busy()
+        runs.append({"wall": wall, "busy": busy, "overhead": wall - busy, "executions": executions, "timeline": timeline})
+
+    median = sorted(runs, key=lambda run: run["overhead"])[len(runs) // 2]
+    nodes: dict[str, dict] = {}
+    lastEnd = None
+    for name, start, end in sorted(median["timeline"].intervals, key=lambda interval: interval[1]):
+        node = nodes.setdefault(name, {"count": 0, "time": 0.0, "gap": 0.0})
+        node["count"] += 1
+        node["time"] += end - start
+        if lastEnd is not None and start > lastEnd:
+            node["gap"] += start - lastEnd
+        lastEnd = end if lastEnd is None else max(lastEnd, end)
+    return {"wall": round(statistics.median(run["wall"] for run in runs), 6),
+            "busy": round(statistics.median(run["busy"] for run in runs), 6),
+            "overhead": round(statistics.median(run["overhead"] for run in runs), 6),
+            "executions": median["executions"],
+            "overhead_per_node": round(median["overhead"] / median["executions"], 6) if median["executions"] else 0.0,
+            "nodes": {name: {"count": node["count"], "mean": round(node["time"] / node["count"], 6),
+                             "mean_gap": round(node["gap"] / node["count"], 6)} for name, node in sorted(nodes.items())}}
+
+def per_call(statement, number: Optional[int] = None) -> float:
+    """Microseconds per call of statement."""
+    timer = timeit.Timer(statement)
+    if number is None:
+        number, _ = timer.autorange()
+    return round(min(timer.repeat(repeat=5, number=number)) / number * 1e6, 3)
+
+def bench_reducers(history_sizes: list[int]) -> dict:
+    """Cost of one update through the state reducers that run on every node update."""
+    status = {key: "done" for key in ("research", "code", "tests", "documentation", "validation", "review", "planning", "summary")}
+    costs = {model: LLMCost(model=model, input_tokens=1000, output_tokens=500, calls=3, cost=0.01)
+             for model in ("claude-3-5-haiku-latest", "claude-3-5-sonnet-latest")}
+    costUpdate = {"claude-3-5-haiku-latest": LLMCost(model="claude-3-5-haiku-latest", input_tokens=100, output_tokens=50, calls=1, cost=0.001)}
+    results = {"merge_agent_status": per_call(lambda: merge_agent_status(status, {"code": "inProgress"})),
+               "merge_llm_costs": per_call(lambda: merge_llm_costs(costs, costUpdate)),
+               "add_messages": {}}
+    for size in history_sizes:
+        history = add_messages([], [HumanMessage(f"message {index}") if index % 2 else AIMessage(f"message {index}")
+                                    for index in range(size)])
+        results["add_messages"][str(size)] = per_call(lambda: add_messages(history, [AIMessage("new message")]))
+    return results
+
+def bench_checkpoints(args, cache_dir: str) -> dict:
+    """Serialized size of the state at every checkpoint of one run, and the bytes the checkpointer holds."""
+    checkpointer = MemorySaver()
+    graph = build_benchmark_graph(args, Timeline(), checkpointer, cache_dir)
+    config = {"configurable": {"thread_id": "benchmark-checkpoints"}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in graph.stream({"messages": [("user", args.prompt)]}, config=config):
+            pass
+    history = list(reversed(list(graph.get_state_history(config))))
+    steps = []
+    for previous, snapshot in zip([None] + history, history):
+        steps.append({"step": snapshot.metadata.get("step"), "after": ",".join(previous.next) if previous else "input",
+                      "bytes": len(checkpointer.serde.dumps_typed(snapshot.values)[1])})
+    stored = sum(len(checkpoint[1]) + len(metadata[1]) for namespaces in checkpointer.storage.values()
+                 for checkpoints in namespaces.values() for checkpoint, metadata, _ in checkpoints.values())
+    stored += sum(len(blob[1]) for blob in checkpointer.blobs.values())
+    stored += sum(len(write[2][1]) for writes in checkpointer.writes.values() for write in writes.values())
+    return {"checkpoints": len(steps), "first_bytes": steps[0]["bytes"], "last_bytes": steps[-1]["bytes"],
+            "max_bytes": max(step["bytes"] for step in steps),
+            "growth_per_step": round((steps[-1]["bytes"] - steps[0]["bytes"]) / max(len(steps) - 1, 1)),
+            "stored_bytes": stored, "steps": steps}
+
+def bench_persistence(args, cache_dir: str) -> dict:
+    """Time to persist the state after every streamed event: a full pickle with output_state, or a journal update."""
+    graph = build_benchmark_graph(args, Timeline(), MemorySaver(), cache_dir)
+    config = {"configurable": {"thread_id": "benchmark-persistence"}}
+    stateDir = os.path.join(cache_dir, "state")
+    outputTimes, journalTimes = [], []
+    with contextlib.redirect_stdout(io.StringIO()), StateJournal(os.path.join(cache_dir, "benchmark.journal")) as journal:
+        for event in graph.stream({"messages": [("user", args.prompt)]}, config=config):
+            eventName = list(event.keys())[0]
+            start = time.perf_counter()
+            output_state(eventName, graph, config, stateDir)
+            outputTimes.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            journal.record_event(event, graph, config)
+            journalTimes.append(time.perf_counter() - start)
+    outputBytes = sum(os.path.getsize(os.path.join(stateDir, name)) for name in os.listdir(stateDir))
+
+    def summary(times: list[float], size: int) -> dict:
+        return {"events": len(times), "mean": round(statistics.mean(times), 6), "max": round(max(times), 6),
+                "total": round(sum(times), 6), "bytes": size}
+
+    return {"output_state": summary(outputTimes, outputBytes),
+            "journal": summary(journalTimes, os.path.getsize(journal.path)),
+            "final_state_bytes": len(pickle.dumps(graph.get_state(config).values))}
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def package_version(name: str) -> Optional[str]:
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+# Metrics compared against the previous result, where larger is worse
+TRACKED = {"overhead_per_node": ("graph", "overhead_per_node"), "merge_agent_status": ("reducers", "merge_agent_status"),
+           "merge_llm_costs": ("reducers", "merge_llm_costs"), "checkpoint_last_bytes": ("checkpoints", "last_bytes"),
+           "output_state_mean": ("persistence", "output_state", "mean"), "journal_mean": ("persistence", "journal", "mean")}
+
+def lookup(result: dict, path: tuple) -> Optional[float]:
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+def previous_result(path: str, params: dict) -> Optional[dict]:
+    """The most recent result in the results file that was run with the same parameters."""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if result.get("params") == params:
+                previous = result
+    return previous
+
+def compare(result: dict, previous: dict) -> dict[str, float]:
+    """The relative change of every tracked metric since the previous result."""
+    changes = {}
+    paths = {**TRACKED, **{f"add_messages[{size}]": ("reducers", "add_messages", size) for size in result["reducers"]["add_messages"]}}
+    for name, path in paths.items():
+        now, before = lookup(result, path), lookup(previous, path)
+        if now is not None and before:
+            changes[name] = round((now - before) / before, 4)
+    return changes
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the graph overhead offline, with fake LLMs and tools")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds every fake LLM call takes")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="Seconds every fake search and URL retrieval takes")
+    parser.add_argument("--payload-chars", type=int, default=2000, help="Size of the fake LLM answers, search results and pages")
+    parser.add_argument("--sandbox-latency", type=float, default=0.0, help="Seconds every fake run of the generated tests takes")
+    parser.add_argument("--real-sandbox", action="store_true",
+                        help="Run the generated tests in the real sandboxed subprocess instead of a fake test runner")
+    parser.add_argument("--research-steps", type=int, default=3, help="Number of research steps the fake planner plans")
+    parser.add_argument("--modules", type=int, default=3, help="Number of modules the fake code planner plans")
+    parser.add_argument("--parallel-research", action="store_true", help="Benchmark the parallel research topology")
+    parser.add_argument("--parallel-coding", action="store_true", help="Benchmark the parallel coding topology")
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=[10, 100, 1000], help="Message history sizes for the messages reducer")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of graph runs; the median is reported")
+    parser.add_argument("--prompt", default="Write a command line tool that counts the words in a file.")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSONL file the results are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Print the results without appending them to the results file")
+    parser.add_argument("--max-regression", type=float, help="Exit with an error if a tracked metric grew by more than this fraction "
+                                                             "since the previous result with the same parameters, e.g. 0.2")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    params = {key: value for key, value in vars(args).items() if key not in ("results", "no_save", "max_regression")}
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as cacheDir:
+        result = {"timestamp": time.time(), "revision": git_revision(), "python": platform.python_version(),
+                  "langgraph": package_version("langgraph"), "langchain_core": package_version("langchain-core"), "params": params,
+                  "graph": bench_graph(args, cacheDir), "reducers": bench_reducers(args.history_sizes),
+                  "checkpoints": bench_checkpoints(args, cacheDir), "persistence": bench_persistence(args, cacheDir)}
+
+    graph = result["graph"]
+    print(f"Graph: {graph['wall'] * 1000:.1f} ms wall, {graph['busy'] * 1000:.1f} ms in nodes and tools, "
+          f"{graph['overhead'] * 1000:.1f} ms overhead over {graph['executions']} node executions "
+          f"({graph['overhead_per_node'] * 1000:.2f} ms per node)")
+    for name, node in graph["nodes"].items():
+        print(f"  {name:<20} x{node['count']:<3} {node['mean'] * 1000:8.2f} ms in node {node['mean_gap'] * 1000:8.2f} ms gap before")
+    reducers = result["reducers"]
+    print(f"Reducers: merge_agent_status {reducers['merge_agent_status']} us, merge_llm_costs {reducers['merge_llm_costs']} us, " +
+          ", ".join(f"add_messages({size}) {cost} us" for size, cost in reducers["add_messages"].items()))
+    checkpoints = result["checkpoints"]
+    print(f"Checkpoints: {checkpoints['checkpoints']} checkpoints, state {checkpoints['first_bytes']} -> {checkpoints['last_bytes']} bytes "
+          f"(+{checkpoints['growth_per_step']} per step), {checkpoints['stored_bytes']} bytes held by the checkpointer")
+    persistence = result["persistence"]
+    for name in ("output_state", "journal"):
+        print(f"Persistence ({name}): {persistence[name]['mean'] * 1000:.2f} ms per event, {persistence[name]['total'] * 1000:.1f} ms "
+              f"over {persistence[name]['events']} events, {persistence[name]['bytes']} bytes written")
+
+    previous = previous_result(args.results, params)
+    regressions = {}
+    if previous is not None:
+        changes = compare(result, previous)
+        print(f"Since {previous.get('revision')}: " + ", ".join(f"{name} {change:+.1%}" for name, change in changes.items()))
+        if args.max_regression is not None:
+            regressions = {name: change for name, change in changes.items() if change > args.max_regression}
+    if not args.no_save:
+        if os.path.dirname(args.results):
+            os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, "a") as file:
+            file.write(json.dumps(result) + "\n")
+    if regressions:
+        raise SystemExit(f"Regressions over {args.max_regression:.0%}: " + ", ".join(f"{name} {change:+.1%}" for name, change in regressions.items()))
+
+if __name__ == "__main__":
+    main()
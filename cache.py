@@ -0,0 +1,309 @@
+import hashlib, json, os, re, sqlite3, threading, time
+from typing import Any, Callable, Optional, Sequence
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+class SQLiteCache:
+    """
+    A size-bounded key/value store kept in a SQLite file.
+
+    Values are stored as JSON.  Entries older than the ttl are treated as misses and the least recently
+    used entries are evicted once the table grows past max_entries or max_bytes.  The file can be shared
+    by several threads and processes, so a restarted process starts warm.
+    """
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """A connection for the calling thread, created with the cache table on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,
+                stored_at REAL NOT NULL, accessed_at REAL NOT NULL)""")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def get_entry(self, key: str, include_expired: bool = False) -> Optional[dict]:
+        """Return {"value", "stored_at"} for a key, marking it as recently used, or None on a miss."""
+        row = self.connection.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or (not include_expired and self.is_expired(row[1])):
+            self._count("misses")
+            return None
+        with self.connection:
+            self.connection.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self._count("hits")
+        return {"value": json.loads(row[0]), "stored_at": row[1]}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self.get_entry(key)
+        return default if entry is None else entry["value"]
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value)
+        now = time.time()
+        with self.connection:
+            self.connection.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                                    (key, data, len(data), now, now))
+        self._evict()
+
+    def touch(self, key: str):
+        """Reset the age of an entry, e.g. after the origin confirmed it is still current."""
+        now = time.time()
+        with self.connection:
+            self.connection.execute(f"UPDATE {self.table} SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def delete(self, key: str):
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {self.table}")
+
+    def is_expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def stats(self) -> dict:
+        entries, size = self.connection.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": entries, "bytes": size}
+
+    def _evict(self):
+        """Drop the least recently used entries until the table is within its entry and byte limits."""
+        with self.connection:
+            if self.max_entries is not None:
+                cursor = self.connection.execute(f"""DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+                self._count("evictions", cursor.rowcount)
+            if self.max_bytes is not None:
+                total = self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+                if total > self.max_bytes:
+                    victims = []
+                    for key, size in self.connection.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+                        if total <= self.max_bytes:
+                            break
+                        victims.append((key,))
+                        total -= size
+                    self.connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+                    self._count("evictions", len(victims))
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings of the same page share a cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = parts.hostname.lower() if parts.hostname else ""
+    if parts.port and not (scheme, parts.port) in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith(TRACKING_PARAMS))
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+class PageCache:
+    """
+    Cache the extracted text of web pages, keyed by normalized URL.
+
+    Pages younger than the ttl are served straight from the cache.  Older pages are revalidated with
+    the ETag/Last-Modified validators they were stored with, so an unchanged page costs a 304 response
+    and no parsing.  The cache is bounded by max_bytes with least recently used eviction.
+    """
+
+    def __init__(self, path: str = ".cache/pages.sqlite", ttl: float = 24 * 3600, max_bytes: int = 100 * 1024 * 1024):
+        self.store = SQLiteCache(path, table="pages", max_bytes=max_bytes)
+        self.ttl = ttl
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def retrieve(self, url: str, fetch: Callable, parse: Callable) -> str:
+        """Return the text of a page, calling fetch(url, headers) and parse(response) only when needed."""
+        key = normalize_url(url)
+        entry = self._lookup(key)
+        if entry is not None and self._is_fresh(entry):
+            self._count("hits")
+            return entry["value"]["text"]
+        response = fetch(url, self._conditional_headers(entry))
+        text = None if self._not_modified(entry, response) else parse(response)
+        return self._handle_response(key, url, entry, response, text)
+
+    async def aretrieve(self, url: str, afetch: Callable, aparse: Callable) -> str:
+        """Asynchronous version of retrieve, awaiting afetch(url, headers) and aparse(response)."""
+        key = normalize_url(url)
+        entry = self._lookup(key)
+        if entry is not None and self._is_fresh(entry):
+            self._count("hits")
+            return entry["value"]["text"]
+        response = await afetch(url, self._conditional_headers(entry))
+        text = None if self._not_modified(entry, response) else await aparse(response)
+        return self._handle_response(key, url, entry, response, text)
+
+    def stats(self) -> dict:
+        store = self.store.stats()
+        return {"hits": self.hits, "revalidations": self.revalidations, "misses": self.misses,
+                "evictions": store["evictions"], "entries": store["entries"], "bytes": store["bytes"]}
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        return self.store.get_entry(key, include_expired=True)
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["stored_at"] <= self.ttl
+
+    @staticmethod
+    def _conditional_headers(entry: Optional[dict]) -> dict:
+        headers = {}
+        if entry is not None:
+            if entry["value"].get("etag"):
+                headers["If-None-Match"] = entry["value"]["etag"]
+            if entry["value"].get("last_modified"):
+                headers["If-Modified-Since"] = entry["value"]["last_modified"]
+        return headers
+
+    @staticmethod
+    def _not_modified(entry: Optional[dict], response) -> bool:
+        return entry is not None and response.status_code == 304
+
+    def _handle_response(self, key: str, url: str, entry: Optional[dict], response, text: Optional[str]) -> str:
+        if self._not_modified(entry, response):
+            self._count("revalidations")
+            self.store.touch(key)
+            return entry["value"]["text"]
+        self._count("misses")
+        self.store.set(key, {"url": url, "text": text, "etag": response.headers.get("etag"),
+                             "last_modified": response.headers.get("last-modified")})
+        return text
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+STOPWORDS = frozenset("""a an and are as at be by for from how in into is it of on or that the this to using
+    what when where which why with""".split())
+# Words ending in s that are not plurals, or whose singular would be mistaken for a different word
+SINGULAR_WORDS = frozenset("""alias always canvas does express has https kubernetes news pandas perhaps postgres
+    redis series species status was whereas windows""".split())
+
+def singular(token: str) -> str:
+    """Fold a regular English plural to its singular, leaving short words and likely non-plurals alone."""
+    if len(token) <= 3 or token in SINGULAR_WORDS or not token.endswith("s") or token.endswith(("ss", "us", "is")):
+        return token
+    if token.endswith("sses"):
+        return token[:-2]
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    return token[:-1]
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different spellings share a cache entry.
+
+    Case, punctuation, whitespace and stopwords are ignored and regular plurals are folded to the singular,
+    so "How to use LangGraph's ToolNodes?" and "use langgraph s toolnode" map to the same key.  Word order
+    and repeated words are kept, since "convert json to csv" and "convert csv to json" are different searches.
+    """
+    return " ".join(singular(token) for token in re.findall(r"[a-z0-9]+", query.lower()) if token not in STOPWORDS)
+
+class SearchCache:
+    """
+    Cache the results of a search tool, keyed by normalized query.
+
+    Wraps any tool with an invoke(query) method, such as TavilySearchResults.  Results are kept in a
+    SQLite file with a ttl and a bounded number of entries, so they survive process restarts.  Error
+    results, which search tools return as strings, are never cached.
+    """
+
+    def __init__(self, search_tool, path: str = ".cache/search.sqlite", ttl: float = 24 * 3600, max_entries: int = 5000):
+        self.search_tool = search_tool
+        self.store = SQLiteCache(path, table="search", ttl=ttl, max_entries=max_entries)
+        self.namespace = f"{getattr(search_tool, 'name', type(search_tool).__name__)}:{getattr(search_tool, 'max_results', '')}"
+
+    @property
+    def name(self) -> str:
+        return getattr(self.search_tool, "name", type(self.search_tool).__name__)
+
+    def invoke(self, query: str, config=None, **kwargs) -> Any:
+        key = f"{self.namespace}:{normalize_query(query)}"
+        results = self.store.get(key)
+        if results is not None:
+            return results
+        results = self.search_tool.invoke(query, config, **kwargs)
+        if not isinstance(results, str):
+            self.store.set(key, results)
+        return results
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+class LLMCacheMiss(LookupError):
+    """Raised in replay mode when a prompt has no recorded response."""
+
+class LLMResponseCache(BaseCache):
+    """
+    Cache chat model responses keyed on a hash of the model configuration and the rendered prompt.
+
+    The model configuration string that LangChain passes in covers the model name, its parameters and
+    any bound tools or structured output schema, so a change to any of them is a miss.  Responses are
+    kept in a size-bounded SQLite file.
+
+    Modes:
+        record: Return recorded responses and call the model (recording the result) on a miss.
+        replay: Return recorded responses only and raise LLMCacheMiss on a miss, so a replay never
+            reaches the API.
+    """
+
+    MODES = ("record", "replay")
+
+    def __init__(self, path: str = ".cache/llm.sqlite", mode: str = "record", max_entries: int = 10000,
+                 max_bytes: int = 500 * 1024 * 1024):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode}, expected one of {self.MODES}")
+        self.mode = mode
+        self.store = SQLiteCache(path, table="llm", max_entries=max_entries, max_bytes=max_bytes)
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        generations = self.store.get(self.key(prompt, llm_string))
+        if generations is None:
+            if self.mode == "replay":
+                raise LLMCacheMiss("No recorded LLM response for this prompt; run in record mode first")
+            return None
+        return [loads(generation) for generation in generations]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.store.set(self.key(prompt, llm_string), [dumps(generation) for generation in return_val])
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> dict:
+        return self.store.stats()
@@ -4,7 +4,7 @@ import React, { useState, useEffect } from 'react';
 import TabHeader from './tabheader';
 import TabContent from './tabcontent';
 import { useCoAgent } from "@copilotkit/react-core"; 
-import { ResearchState, ResearchStep, TabNameEnum, TabStatusEnum, AgentState } from './statetypes';
+import { ResearchState, ResearchStep, TabNameEnum, TabStatusEnum, AgentState, Module } from './statetypes';
 import { testState } from './statetypes';
 import LLMSummary from './llmsummary';
 
@@ -68,16 +68,22 @@ const [state, setAgentState] = useState<AgentState>(testState);
           tabs={tabs}
           tabStatuses={tabStatuses}
         />
-        <LLMSummary llmState={state.llmCost} />
+        <LLMSummary llmState={state.llmCosts} />
       </div>
       <TabContent
         activeTab={activeTab}
         research={state.research}
-        code={state.generated_code}
-        tests={isAvailable(state, TabNameEnum.Tests) ? state.generated_tests.imports + '\n\n' + state.generated_tests.code : ''}
-        documentation={isAvailable(state, TabNameEnum.Documentation) ? state.documentation.markdown : ''}
-        feedback={isAvailable(state, TabNameEnum.Validation) ? state.validation.feedback : ''}
-        reviewed_code={isAvailable(state, TabNameEnum.Validation) ? state.validation.reviewed_code : ''}
+        code={state.streaming_module && state.generated_code && !state.generated_code.is_complete
+              ? { ...state.generated_code, modules: [...state.generated_code.modules, state.streaming_module as Module] }
+              : state.generated_code}
+        tests={isAvailable(state, TabNameEnum.Tests) && state.generated_tests ? state.generated_tests.imports + '\n\n' + state.generated_tests.code
+               : (state.streaming_tests?.code ?? '')}
+        documentation={isAvailable(state, TabNameEnum.Documentation) && state.documentation ? state.documentation.markdown
+                       : (state.streaming_documentation?.markdown ?? '')}
+        feedback={isAvailable(state, TabNameEnum.Validation) && state.validation?.feedback ? state.validation.feedback
+                  : (state.streaming_review?.feedback ?? '')}
+        reviewed_code={isAvailable(state, TabNameEnum.Validation) && state.validation?.reviewed_code ? state.validation.reviewed_code
+                       : (state.streaming_review?.reviewed_code ?? '')}
       />
     </div>
   );
@@ -4,46 +4,30 @@ import { faDollarSign, faTimes } from '@fortawesome/free-solid-svg-icons';
 import { LLMCost } from './statetypes'; // Adjust the path as necessary
 
 interface LLMSummaryProps {
-  llmState: LLMCost[];
+  llmState: { [model: string]: LLMCost };
 }
 
-const modelPrices = {
-  "claude-3-5-haiku": { input_tokens: 0.000001, output_tokens: 0.000005 },
-  "claude-3-5-sonnet": { input_tokens: 0.000003, output_tokens: 0.000015 },
-};
-
 const LLMSummary: React.FC<LLMSummaryProps> = ({ llmState }) => {
   const [showPopup, setShowPopup] = useState<boolean>(false);
 
-  // Helper function to trim model name
-  const getModelKey = (model: string) => {
-    const parts = model.split('-');
-    return parts.slice(0, parts.length - 1).join('-');
-  };
-
-  // Aggregate costs by model
-  const costsByModel = llmState.reduce((acc, cost) => {
-    const modelKey = getModelKey(cost.model);
-    if (!acc[modelKey]) {
-      acc[modelKey] = { input_tokens: 0, output_tokens: 0, cost: 0 };
-    }
-    const price = modelPrices[modelKey];
-    acc[modelKey].input_tokens += cost.input_tokens;
-    acc[modelKey].output_tokens += cost.output_tokens;
-    acc[modelKey].cost +=
-      cost.input_tokens * price.input_tokens + cost.output_tokens * price.output_tokens;
+  // The agent keeps running totals per model, priced on the server
+  const costsByModel = Object.entries(llmState ?? {}).reduce((acc, [model, cost]) => {
+    acc[model] = { input_tokens: cost.input_tokens, output_tokens: cost.output_tokens, cache_read_tokens: cost.cache_read_tokens ?? 0,
+                   cache_write_tokens: cost.cache_write_tokens ?? 0, cost: cost.cost ?? 0 };
     return acc;
-  }, {} as Record<string, { input_tokens: number; output_tokens: number; cost: number }>);
+  }, {} as Record<string, { input_tokens: number; output_tokens: number; cache_read_tokens: number; cache_write_tokens: number; cost: number }>);
 
   // Calculate overall totals
   const totals = Object.values(costsByModel).reduce(
     (acc, modelCost) => {
       acc.input_tokens += modelCost.input_tokens;
       acc.output_tokens += modelCost.output_tokens;
+      acc.cache_read_tokens += modelCost.cache_read_tokens;
+      acc.cache_write_tokens += modelCost.cache_write_tokens;
       acc.cost += modelCost.cost;
       return acc;
     },
-    { input_tokens: 0, output_tokens: 0, cost: 0 }
+    { input_tokens: 0, output_tokens: 0, cache_read_tokens: 0, cache_write_tokens: 0, cost: 0 }
   );
 
   return (
@@ -64,6 +48,7 @@ const LLMSummary: React.FC<LLMSummaryProps> = ({ llmState }) => {
                   <strong>{model}</strong>: ${cost.cost.toFixed(2)}
                   <div>Input Tokens: {cost.input_tokens}</div>
                   <div>Output Tokens: {cost.output_tokens}</div>
+                  <div>Cached Input Tokens: {cost.cache_read_tokens} read, {cost.cache_write_tokens} written</div>
                 </li>
               ))}
             </ul>
@@ -71,6 +56,7 @@ const LLMSummary: React.FC<LLMSummaryProps> = ({ llmState }) => {
               <strong>Total Cost: {totals.cost.toFixed(2)}$</strong>
               <div>Total Input Tokens: {totals.input_tokens}</div>
               <div>Total Output Tokens: {totals.output_tokens}</div>
+              <div>Total Cached Input Tokens: {totals.cache_read_tokens} read, {totals.cache_write_tokens} written</div>
             </div>
           </div>
         </div>
@@ -21,6 +21,7 @@ export type CodingStep = {
     description: string;
     file_name: string;
     status: string;
+    depends_on: number[];
 };
 
 export type Module = {
@@ -43,16 +44,30 @@ export type DocumentationState = {
   markdown: string;
 };
 
+export type TestResult = {
+  name: string;
+  outcome: string;
+  message: string;
+};
+
 export type ValidationState = {
   compile_errors: string[];
   feedback: string;
   reviewed_code: string;
+  test_results: TestResult[];
+  tests_passed: number;
+  tests_failed: number;
+  test_output: string;
 };
 
 export type LLMCost = {
   input_tokens: number;
   output_tokens: number;
   model: string;
+  calls: number;
+  cost: number;
+  cache_read_tokens?: number;
+  cache_write_tokens?: number;
 };
 
 export type AgentState = {
@@ -62,7 +77,12 @@ export type AgentState = {
   documentation: DocumentationState;
   validation: ValidationState;
   agentStatus: { [key: string]: string };
-  llmCost: LLMCost[];
+  llmCosts: { [model: string]: LLMCost };
+  // Partial structured output streamed while a node is still generating it
+  streaming_module?: Partial<Module>;
+  streaming_tests?: Partial<Module>;
+  streaming_documentation?: Partial<DocumentationState>;
+  streaming_review?: { feedback?: string; reviewed_code?: string };
   messages: any[];
 };
 
@@ -136,5 +156,5 @@ export const testState: AgentState = {
       validation: TabStatusEnum.NotStarted
     },
     messages: [],
-    llmCost: [{"model":"claude-3-5-haiku-latest","input_tokens":1000,"output_tokens":500},{"model":"claude-3-5-haiku-latest ","input_tokens":2000,"output_tokens":1000}]
+    llmCosts: {"claude-3-5-haiku-latest": {"model":"claude-3-5-haiku-latest","input_tokens":3000,"output_tokens":1500,"calls":2,"cost":0.0084}}
   };
\ No newline at end of file
@@ -0,0 +1,260 @@
+import asyncio, os, random, sqlite3, threading, zlib
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+try:
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:  # older langgraph-checkpoint releases store the metadata as given
+    def get_checkpoint_metadata(config: RunnableConfig, metadata: CheckpointMetadata) -> CheckpointMetadata:
+        return metadata
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_checkpoint_id TEXT,
+    type TEXT NOT NULL, checkpoint BLOB NOT NULL, metadata_type TEXT NOT NULL, metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL,
+    type TEXT NOT NULL, data BLOB, compressed INTEGER NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version));
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, data BLOB, compressed INTEGER NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));
+"""
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    """
+    A durable checkpoint saver that keeps graph checkpoints in a SQLite file.
+
+    Channel values are stored once per version: each checkpoint saves only the channels whose version
+    changed in that step, and a checkpoint is rebuilt from the blob of each channel at the version it
+    references.  A changed channel is stored whole, so the messages channel is written in full at every
+    step that adds a message.  Values larger than compress_threshold bytes are zlib-compressed, which keeps
+    long message histories small.  When keep_last is set, a thread that has compact_every checkpoints more
+    than keep_last is compacted to its newest keep_last, and the writes and channel blobs that no remaining
+    checkpoint references are removed.
+
+    The async methods run the blocking SQLite calls on a worker thread, so they do not block the event loop.
+
+    Args:
+        path: The SQLite file to store checkpoints in.
+        keep_last: Number of checkpoints to keep per thread, or None to keep every checkpoint.
+        compress_threshold: Serialized values larger than this many bytes are compressed.
+        compact_every: Number of checkpoints a thread may grow past keep_last before it is compacted.
+    """
+
+    def __init__(self, path: str = "output/checkpoints.sqlite", keep_last: Optional[int] = None,
+                 compress_threshold: int = 1024, compact_every: int = 10, *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_last = keep_last
+        self.compact_every = max(compact_every, 1)
+        self.compress_threshold = compress_threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """A connection for the calling thread, created with the checkpoint tables on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _dump(self, value: Any) -> tuple[str, bytes, int]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) > self.compress_threshold:
+            return type_, zlib.compress(data), 1
+        return type_, data, 0
+
+    def _load(self, type_: str, data: bytes, compressed: int) -> Any:
+        return self.serde.loads_typed((type_, zlib.decompress(data) if compressed else data))
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            row = self.connection.execute(
+                "SELECT type, data, compressed FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version))).fetchone()
+            if row is not None and row[0] != "empty":
+                values[channel] = self._load(*row)
+        return values
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        rows = self.connection.execute(
+            """SELECT task_id, channel, type, data, compressed FROM writes
+               WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx""",
+            (thread_id, checkpoint_ns, checkpoint_id))
+        return [(task_id, channel, self._load(type_, data, compressed)) for task_id, channel, type_, data, compressed in rows]
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, data, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, data))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"])},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                           if parent_checkpoint_id else None),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get the checkpoint named in the config, or the latest checkpoint of the thread."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = """SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                   FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"""
+        if checkpoint_id := get_checkpoint_id(config):
+            row = self.connection.execute(query + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+        else:
+            row = self.connection.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+        return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """List checkpoints, newest first, optionally filtered by thread, namespace, metadata and checkpoint id."""
+        query = """SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                   FROM checkpoints WHERE 1 = 1"""
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+
+        for thread_id, checkpoint_ns, *row in self.connection.execute(query, params).fetchall():
+            if limit is not None and limit <= 0:
+                break
+            checkpointTuple = self._tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and not all(checkpointTuple.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield checkpointTuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Save a checkpoint, storing blobs only for the channels updated in this step."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = checkpoint.copy()
+        values = saved.pop("channel_values")
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, data, compressed = self._dump(values[channel]) if channel in values else ("empty", None, 0)
+            blobs.append((thread_id, checkpoint_ns, channel, str(version), type_, data, compressed))
+        type_, data = self.serde.dumps_typed(saved)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)", blobs)
+            self.connection.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                                     type_, data, metadata_type, metadata_data))
+        # Compacting reads every remaining checkpoint of the thread, so it is done in batches of compact_every
+        if self.keep_last is not None and self._count(thread_id) >= self.keep_last + self.compact_every:
+            self.compact(thread_id, self.keep_last)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        """Save the pending writes of a task against a checkpoint."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data, compressed = self._dump(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, compressed, task_path))
+        # Special writes (errors, interrupts) replace earlier ones, regular writes are only stored once
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        with self._lock, self.connection:
+            self.connection.executemany(f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _count(self, thread_id: str) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+    def compact(self, thread_id: str, keep_last: int) -> None:
+        """Keep only the newest keep_last checkpoints of a thread and drop the writes and blobs they no longer need."""
+        with self._lock, self.connection:
+            for (checkpoint_ns,) in self.connection.execute("SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?",
+                                                            (thread_id,)).fetchall():
+                stale = self.connection.execute(
+                    """SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                       ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?""", (thread_id, checkpoint_ns, keep_last)).fetchall()
+                if not stale:
+                    continue
+                keys = [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in stale]
+                self.connection.executemany("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", keys)
+                self.connection.executemany("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", keys)
+
+                referenced = set()
+                for type_, data in self.connection.execute("SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                                                           (thread_id, checkpoint_ns)):
+                    referenced.update((channel, str(version)) for channel, version in
+                                      self.serde.loads_typed((type_, data))["channel_versions"].items())
+                unreferenced = [(thread_id, checkpoint_ns, channel, version) for channel, version in
+                                self.connection.execute("SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                                                        (thread_id, checkpoint_ns))
+                                if (channel, version) not in referenced]
+                self.connection.executemany("DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                                            unreferenced)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint, write and blob of a thread."""
+        with self._lock, self.connection:
+            for table in ("checkpoints", "writes", "blobs"):
+                self.connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in checkpoints:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
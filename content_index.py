@@ -0,0 +1,231 @@
+import json, os, re, threading, time, zlib
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from cache import normalize_url
+from extraction import truncate_to_tokens
+from retrieval_index import BM25Index, Chunk
+
+WORD = re.compile(r"\w+")
+# The first line of a retrieved page ("[page-2] <url>...") and of each of its passages ("[page-2#3] (<url>)")
+PAGE_HEADER = re.compile(r"\[(page-\d+)\] ")
+PASSAGE_HEADER = re.compile(r"^\[((page-\d+)#\d+)\] \(", re.M)
+
+def fingerprint(text: str, shingle: int = 5, sample: int = 4) -> frozenset[int]:
+    """
+    A sample of the hashed word shingles of a text, for estimating how similar two texts are.
+
+    Only the shingle hashes divisible by sample are kept, so the fingerprint of two texts is sampled
+    consistently and the Jaccard similarity of the fingerprints estimates that of the texts.
+    """
+    words = WORD.findall(text.lower())
+    if len(words) < shingle:
+        return frozenset({zlib.crc32(" ".join(words).encode())})
+    hashes = (zlib.crc32(" ".join(words[index:index + shingle]).encode()) for index in range(len(words) - shingle + 1))
+    return frozenset(value for value in hashes if value % sample == 0)
+
+def similarity(left: frozenset, right: frozenset) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+class Page(NamedTuple):
+    ref: str
+    url: str
+    text: str
+    fingerprint: frozenset
+
+class ContentIndex:
+    """
+    The pages retrieved during one run, so a page is only fetched once.
+
+    Pages are looked up by normalized URL, and a page whose body is a near duplicate of an earlier one
+    (by the Jaccard similarity of their shingle fingerprints) is reported as a duplicate of it and
+    shares its reference.  Every page is also chunked into a BM25 index, so the passages relevant to a
+    query can be retrieved from one page or from everything the run has read.  With a path, the pages
+    are appended to a JSONL file and the index is rebuilt from it when the run is loaded again.
+
+    Whether a page was already shown to the LLM depends on the prompt it is sent in, not on the run, so
+    repeats are left out when the prompt is assembled (elide_repeats), not here.
+    """
+
+    def __init__(self, threshold: float = 0.85, chunk_tokens: int = 200, path: Optional[str] = None):
+        self.threshold = threshold
+        self.path = path
+        self.pages: list[Page] = []
+        self.urls: dict[str, Page] = {}
+        self.retrieval = BM25Index(chunk_tokens)
+        self.fetches_saved = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str):
+        with open(path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by an interrupted write
+                if "text" in record:
+                    self._add(record["url"], record["text"])
+                elif record.get("duplicate_of") in {page.ref for page in self.pages}:
+                    self.urls[normalize_url(record["url"])] = next(page for page in self.pages if page.ref == record["duplicate_of"])
+
+    def _persist(self, record: dict):
+        if self.path:
+            with open(self.path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def get(self, url: str) -> Optional[Page]:
+        """The page already retrieved from url in this run, if any."""
+        with self._lock:
+            page = self.urls.get(normalize_url(url))
+            if page is not None:
+                self.fetches_saved += 1
+            return page
+
+    def _add(self, url: str, text: str) -> tuple[Page, bool]:
+        pageFingerprint = fingerprint(text)
+        for page in self.pages:
+            if similarity(pageFingerprint, page.fingerprint) >= self.threshold:
+                self.urls[normalize_url(url)] = page
+                return page, True
+        page = Page(f"page-{len(self.pages) + 1}", url, text, pageFingerprint)
+        self.pages.append(page)
+        self.urls[normalize_url(url)] = page
+        self.retrieval.add(page.ref, url, text)
+        return page, False
+
+    def add(self, url: str, text: str) -> tuple[Page, bool]:
+        """Index a retrieved page.  Returns the page and False, or the earlier page and True if the text is a near duplicate."""
+        with self._lock:
+            page, duplicate = self._add(url, text)
+            self._persist({"url": url, "duplicate_of": page.ref} if duplicate else {"url": url, "text": text})
+            return page, duplicate
+
+    def passages(self, page: Page, query: str, k: int = 4) -> list[Chunk]:
+        """The k chunks of a page most relevant to the query, or its first k chunks if none match."""
+        with self._lock:
+            ranked = [chunk for _, chunk in self.retrieval.search(query, k, refs={page.ref})]
+            return ranked or [chunk for chunk in self.retrieval.chunks if chunk.ref == page.ref][:k]
+
+    def search(self, query: str, k: int = 4) -> list[Chunk]:
+        """The k chunks of all the pages of the run most relevant to the query."""
+        with self._lock:
+            return [chunk for _, chunk in self.retrieval.search(query, k)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pages": len(self.pages), "urls": len(self.urls), "chunks": len(self.retrieval.chunks),
+                    "fetches_saved": self.fetches_saved}
+
+class ContentIndexes:
+    """
+    The content index of every run, keyed by thread id, dropping the least recently used runs beyond
+    max_runs or idle past the ttl.  With a directory, every run's pages are kept in <directory>/<thread id>.jsonl,
+    so a dropped or resumed run is loaded back from disk.  The files of runs not in memory are deleted once
+    they are older than max_age seconds, or beyond the newest max_files, when the indexes are created and
+    then at most every sweep_interval seconds as new runs start.
+    """
+
+    def __init__(self, max_runs: int = 200, ttl: Optional[float] = 3600, threshold: float = 0.85, chunk_tokens: int = 200,
+                 directory: Optional[str] = None, max_files: Optional[int] = 1000, max_age: Optional[float] = 7 * 24 * 3600,
+                 sweep_interval: float = 600):
+        self.max_runs = max_runs
+        self.ttl = ttl
+        self.threshold = threshold
+        self.chunk_tokens = chunk_tokens
+        self.directory = directory
+        self.max_files = max_files
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self.files_deleted = 0
+        self._indexes: OrderedDict[str, tuple[ContentIndex, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.sweep()
+
+    def path(self, thread_id: str) -> Optional[str]:
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", thread_id) + ".jsonl") if self.directory else None
+
+    def get(self, thread_id: str) -> ContentIndex:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._indexes.pop(thread_id, None)
+            index = entry[0] if entry is not None else ContentIndex(self.threshold, self.chunk_tokens, self.path(thread_id))
+            self._indexes[thread_id] = (index, now)
+            for threadId, (_, used) in list(self._indexes.items()):
+                if len(self._indexes) > self.max_runs or (self.ttl is not None and now - used > self.ttl):
+                    del self._indexes[threadId]
+            sweep = entry is None and self.directory and now - self._swept > self.sweep_interval
+        if sweep:
+            self.sweep()
+        return index
+
+    def drop(self, thread_id: str):
+        with self._lock:
+            self._indexes.pop(thread_id, None)
+
+    def sweep(self) -> int:
+        """Delete the expired run files, except those of the runs in memory.  Returns the number of files deleted."""
+        if not self.directory:
+            return 0
+        with self._lock:
+            self._swept = time.monotonic()
+            active = {self.path(threadId) for threadId in self._indexes}
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".jsonl") and entry.path not in active:
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        files.sort(reverse=True)
+        now = time.time()
+        expired = [path for position, (modified, path) in enumerate(files)
+                   if (self.max_age is not None and now - modified > self.max_age) or (self.max_files is not None and position >= self.max_files)]
+        for path in expired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.files_deleted += len(expired)
+        return len(expired)
+
+def format_page(page: Page, url: str, max_tokens: Optional[int] = None) -> str:
+    same = "" if normalize_url(url) == normalize_url(page.url) else f" (same content as {page.url})"
+    return f"[{page.ref}] {url}{same}\n\n{page.text if max_tokens is None else truncate_to_tokens(page.text, max_tokens)}"
+
+def format_passages(chunks: list[Chunk]) -> str:
+    return "\n\n".join(f"[{chunk.id}] ({chunk.url})\n{chunk.text}" for chunk in chunks)
+
+def format_page_passages(page: Page, url: str, query: str, chunks: list[Chunk]) -> str:
+    same = "" if normalize_url(url) == normalize_url(page.url) else f" (same content as {page.url})"
+    return f'[{page.ref}] {url}{same}: the passages most relevant to "{truncate_to_tokens(query, 50, " ...")}"\n\n{format_passages(chunks)}'
+
+def elide_repeats(text: str, shown: set[str]) -> tuple[str, set[str]]:
+    """
+    A retrieved page (format_page) or its passages (format_page_passages) with what is in shown, the page
+    and passage ids already shown in full earlier in the same prompt, replaced by a short note.  Returns
+    the text and the ids it shows in full.  Any other text is returned unchanged.
+    """
+    match = PAGE_HEADER.match(text)
+    if match is None or "\n\n" not in text:
+        return text, set()
+    ref = match.group(1)
+    header, body = text.split("\n\n", 1)
+    starts = [passage.start() for passage in PASSAGE_HEADER.finditer(body)]
+    if not starts or starts[0] != 0:
+        if ref in shown:
+            return f"{header}\n\n[{ref}] is shown in full above, so it is not repeated here.", set()
+        return text, {ref}
+    passages = [body[start:end].rstrip() for start, end in zip(starts, starts[1:] + [len(body)])]
+    kept = [passage for passage in passages
+            if ref not in shown and PASSAGE_HEADER.match(passage).group(1) not in shown]
+    if len(kept) == len(passages):
+        return text, {PASSAGE_HEADER.match(passage).group(1) for passage in passages}
+    note = f"{len(passages) - len(kept)} of these passages are shown above, so they are not repeated here."
+    return "\n\n".join([header, *kept, note]), {PASSAGE_HEADER.match(passage).group(1) for passage in kept}
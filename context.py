@@ -0,0 +1,117 @@
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from content_index import elide_repeats
+from extraction import estimate_tokens, truncate_to_tokens
+
+def message_tokens(message: BaseMessage) -> int:
+    """Estimate the prompt tokens used by a message, including any tool call arguments."""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tokens = estimate_tokens(content)
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(str(tool_call.get("args", "")))
+    return tokens
+
+class ContextWindow:
+    """
+    Select the message history that is sent with a node's prompt.
+
+    History is scoped to the current research step, tool results older than the most recent
+    keep_tool_results are replaced with a short excerpt, and the oldest exchanges are dropped until
+    the history fits in max_tokens.  The first message, which holds the user's problem statement, and
+    the newest exchange are always kept, and a tool call is never separated from its results.  When the
+    newest exchange alone is over the budget, its tool results are truncated to share what is left.
+    A retrieved page or passage that is shown in full earlier in the selected history is replaced with
+    a note pointing at that copy, so a repeat is only left out where the LLM can still read the original.
+    """
+
+    def __init__(self, max_tokens: int = 12000, keep_tool_results: int = 2, stale_excerpt_chars: int = 300):
+        self.max_tokens = max_tokens
+        self.keep_tool_results = keep_tool_results
+        self.stale_excerpt_chars = stale_excerpt_chars
+
+    def for_research_step(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """
+        Return the history for the research step in progress.
+
+        Every research step ends with an AI message that has no tool calls (the research plan or a step
+        summary), so the current step is everything after the last such message.
+        """
+        start = 1
+        for index in range(len(messages) - 1, 0, -1):
+            message = messages[index]
+            if isinstance(message, AIMessage) and not message.tool_calls:
+                start = index + 1
+                break
+        return self.fit(messages[:1] + messages[start:])
+
+    def fit(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Compact stale tool results and drop the oldest exchanges until the history fits the token budget."""
+        if not messages:
+            return messages
+        head, exchanges = messages[0], self._exchanges(self._compact(messages[1:]))
+        budget = self.max_tokens - message_tokens(head)
+        if not exchanges:
+            return [head]
+        # The newest exchange holds the tool results the model just asked for, so it is never dropped
+        newest = self._truncate(exchanges[-1], budget)
+        kept = [newest]
+        budget -= sum(message_tokens(message) for message in newest)
+        for exchange in reversed(exchanges[:-1]):
+            tokens = sum(message_tokens(message) for message in exchange)
+            if tokens > budget:
+                break
+            kept.insert(0, exchange)
+            budget -= tokens
+        return self._elide_repeats([head] + [message for exchange in kept for message in exchange], {id(message) for message in messages})
+
+    @staticmethod
+    def _elide_repeats(messages: list[BaseMessage], intact: set[int]) -> list[BaseMessage]:
+        """Replace retrieved content already shown in full earlier in the messages with a short note."""
+        shown, elided = set(), []
+        for message in messages:
+            # Only tool results kept as retrieved count: a compacted or truncated copy no longer shows the page
+            if isinstance(message, ToolMessage) and isinstance(message.content, str) and id(message) in intact:
+                content, full = elide_repeats(message.content, shown)
+                shown |= full
+                if content != message.content:
+                    message = message.model_copy(update={"content": content})
+            elided.append(message)
+        return elided
+
+    def _truncate(self, exchange: list[BaseMessage], budget: int, min_tokens: int = 200) -> list[BaseMessage]:
+        """Truncate the tool results of an exchange so they share the budget left after its other messages."""
+        if sum(message_tokens(message) for message in exchange) <= budget:
+            return exchange
+        results = [message for message in exchange if isinstance(message, ToolMessage)]
+        if not results:
+            return exchange
+        share = max((budget - sum(message_tokens(message) for message in exchange if not isinstance(message, ToolMessage))) // len(results),
+                    min_tokens)
+        return [message.model_copy(update={"content": truncate_to_tokens(message.content, share)})
+                if isinstance(message, ToolMessage) and isinstance(message.content, str) else message for message in exchange]
+
+    def _compact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Replace all but the most recent tool results with a short excerpt."""
+        # The results of the newest exchange are the ones the model is about to read, so they are never stale
+        newest = max((index for index, message in enumerate(messages) if not isinstance(message, ToolMessage)), default=0)
+        toolIndexes = [index for index, message in enumerate(messages) if isinstance(message, ToolMessage) and index < newest]
+        stale = set(toolIndexes[:-self.keep_tool_results] if self.keep_tool_results else toolIndexes)
+        compacted = []
+        for index, message in enumerate(messages):
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            if index in stale and len(content) > self.stale_excerpt_chars:
+                excerpt = content[:self.stale_excerpt_chars].rstrip()
+                message = message.model_copy(update={"content": f"{excerpt}\n[... earlier {message.name or 'tool'} result truncated, "
+                                                                 f"{estimate_tokens(content)} tokens omitted ...]"})
+            compacted.append(message)
+        return compacted
+
+    @staticmethod
+    def _exchanges(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+        """Group messages so that each AI tool call stays together with the tool results that answer it."""
+        exchanges = []
+        for message in messages:
+            if isinstance(message, ToolMessage) and exchanges:
+                exchanges[-1].append(message)
+            else:
+                exchanges.append([message])
+        return exchanges
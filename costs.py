@@ -0,0 +1,187 @@
+import threading, time
+from collections import OrderedDict, defaultdict, deque
+from typing import Any, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import LLMResult
+from state import LLMCost
+
+# USD per million tokens, matched against model names by prefix.  Writing a prompt to the cache costs more than
+# sending it uncached, reading it back costs a tenth.
+PRICES = {
+    "claude-3-5-haiku": {"input": 0.80, "output": 4.00, "cache_write": 1.00, "cache_read": 0.08},
+    "claude-3-5-sonnet": {"input": 3.00, "output": 15.00, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-7-sonnet": {"input": 3.00, "output": 15.00, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-opus": {"input": 15.00, "output": 75.00, "cache_write": 18.75, "cache_read": 1.50},
+    "claude-3-haiku": {"input": 0.25, "output": 1.25, "cache_write": 0.30, "cache_read": 0.03},
+}
+
+def model_price(model: str, prices: dict = PRICES) -> dict:
+    """Return the price of a model from the longest matching prefix in the price table, or zero if unknown."""
+    matches = [prefix for prefix in prices if model.startswith(prefix)]
+    return prices[max(matches, key=len)] if matches else {"input": 0.0, "output": 0.0, "cache_write": 0.0, "cache_read": 0.0}
+
+def call_cost(model: str, input_tokens: int, output_tokens: int, prices: dict = PRICES, cache_read_tokens: int = 0,
+              cache_write_tokens: int = 0) -> float:
+    """The cost of a call.  input_tokens includes the tokens read from and written to the prompt cache."""
+    price = model_price(model, prices)
+    uncachedTokens = max(input_tokens - cache_read_tokens - cache_write_tokens, 0)
+    return (uncachedTokens * price["input"] + output_tokens * price["output"] +
+            cache_write_tokens * price.get("cache_write", price["input"] * 1.25) +
+            cache_read_tokens * price.get("cache_read", price["input"] * 0.1)) / 1_000_000
+
+def response_usage(message: AIMessage) -> tuple[str, int, int]:
+    """Return the model, input tokens and output tokens reported with an LLM response.  Cached prompt tokens count as input."""
+    metadata = message.response_metadata or {}
+    model = metadata.get("model") or metadata.get("model_name") or "unknown"
+    if message.usage_metadata:
+        return model, message.usage_metadata["input_tokens"], message.usage_metadata["output_tokens"]
+    usage = metadata.get("usage", {})
+    return model, usage.get("input_tokens", 0) + sum(cache_usage(message)), usage.get("output_tokens", 0)
+
+def cache_usage(message: AIMessage) -> tuple[int, int]:
+    """Return the prompt tokens read from and written to the prompt cache by an LLM response."""
+    details = (message.usage_metadata or {}).get("input_token_details") or {}
+    if details:
+        written = sum(details.get(key) or 0 for key in ("cache_creation", "ephemeral_5m_input_tokens", "ephemeral_1h_input_tokens"))
+        return details.get("cache_read") or 0, written
+    usage = (message.response_metadata or {}).get("usage", {})
+    return usage.get("cache_read_input_tokens") or 0, usage.get("cache_creation_input_tokens") or 0
+
+def llm_cost(response: AIMessage) -> dict[str, LLMCost]:
+    """The llmCosts update for one LLM response: the call's usage keyed by model."""
+    model, inputTokens, outputTokens = response_usage(response)
+    cacheRead, cacheWrite = cache_usage(response)
+    return {model: LLMCost(model=model, input_tokens=inputTokens, output_tokens=outputTokens, calls=1,
+                           cache_read_tokens=cacheRead, cache_write_tokens=cacheWrite,
+                           cost=call_cost(model, inputTokens, outputTokens, cache_read_tokens=cacheRead, cache_write_tokens=cacheWrite))}
+
+def empty_totals() -> dict:
+    return {"calls": 0, "errors": 0, "retries": 0, "input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0,
+            "cache_write_tokens": 0, "cost": 0.0, "latency": 0.0, "max_latency": 0.0}
+
+class CostLedger:
+    """
+    Running cost, token and latency totals for LLM calls, aggregated per thread, per model and per node.
+
+    Each call updates a fixed number of totals, so recording is O(1) and memory does not grow with the
+    number of calls.  Only the most recent calls are kept individually, and threads beyond max_threads
+    are forgotten oldest first.
+    """
+
+    def __init__(self, prices: dict = PRICES, keep_recent: int = 200, max_threads: int = 10000):
+        self.prices = prices
+        self.max_threads = max_threads
+        self.recent = deque(maxlen=keep_recent)
+        self.models = defaultdict(empty_totals)
+        self.nodes = defaultdict(empty_totals)
+        self.threads: OrderedDict[str, dict] = OrderedDict()
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, model: str, input_tokens: int = 0, output_tokens: int = 0, latency: float = 0.0, node: Optional[str] = None,
+               thread_id: Optional[str] = None, retries: int = 0, error: bool = False, cache_read_tokens: int = 0,
+               cache_write_tokens: int = 0) -> dict:
+        call = {"time": time.time(), "thread_id": thread_id, "node": node, "model": model, "input_tokens": input_tokens,
+                "output_tokens": output_tokens, "cache_read_tokens": cache_read_tokens, "cache_write_tokens": cache_write_tokens,
+                "latency": round(latency, 4), "retries": retries, "error": error,
+                "cost": call_cost(model, input_tokens, output_tokens, self.prices, cache_read_tokens, cache_write_tokens)}
+        with self._lock:
+            self.recent.append(call)
+            threadTotals = self._thread(thread_id or "unknown")
+            for totals in (self.models[model], self.nodes[node or "unknown"], threadTotals["total"], threadTotals["models"][model]):
+                totals["calls"] += 1
+                totals["errors"] += error
+                totals["retries"] += retries
+                totals["input_tokens"] += input_tokens
+                totals["output_tokens"] += output_tokens
+                totals["cache_read_tokens"] += cache_read_tokens
+                totals["cache_write_tokens"] += cache_write_tokens
+                totals["cost"] += call["cost"]
+                totals["latency"] += latency
+                totals["max_latency"] = max(totals["max_latency"], latency)
+        return call
+
+    def _thread(self, thread_id: str) -> dict:
+        totals = self.threads.get(thread_id)
+        if totals is None:
+            totals = self.threads[thread_id] = {"total": empty_totals(), "models": defaultdict(empty_totals)}
+            while len(self.threads) > self.max_threads:
+                self.threads.popitem(last=False)
+        else:
+            self.threads.move_to_end(thread_id)
+        return totals
+
+    @staticmethod
+    def _report(totals: dict) -> dict:
+        return {**totals, "cost": round(totals["cost"], 6), "latency": round(totals["latency"], 3), "max_latency": round(totals["max_latency"], 3),
+                "avg_latency": round(totals["latency"] / totals["calls"], 3) if totals["calls"] else 0.0}
+
+    def thread(self, thread_id: str) -> Optional[dict]:
+        """Totals for one thread, overall and per model, or None if the thread is unknown."""
+        with self._lock:
+            totals = self.threads.get(thread_id)
+            if totals is None:
+                return None
+            return {"thread_id": thread_id, "total": self._report(totals["total"]),
+                    "models": {model: self._report(modelTotals) for model, modelTotals in totals["models"].items()}}
+
+    def summary(self) -> dict:
+        """Totals per model and per node, the total per thread, and the most recent calls."""
+        with self._lock:
+            return {"since": self.started,
+                    "models": {model: self._report(totals) for model, totals in self.models.items()},
+                    "nodes": {node: self._report(totals) for node, totals in self.nodes.items()},
+                    "threads": {threadId: self._report(totals["total"]) for threadId, totals in self.threads.items()},
+                    "recent": list(self.recent)}
+
+class CostCallbackHandler(BaseCallbackHandler):
+    """
+    Record every chat model call in a CostLedger.
+
+    The graph node and thread id come from the metadata LangGraph attaches to each run.  A failed
+    attempt is recorded as an error, and counted as a retry of the next successful call made by the
+    same parent run.
+    """
+
+    def __init__(self, ledger: CostLedger):
+        self.ledger = ledger
+        self._runs: dict[UUID, tuple] = {}
+        self._failures: dict[Optional[UUID], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata: Optional[dict] = None, **kwargs: Any):
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), parent_run_id, metadata.get("langgraph_node"), metadata.get("thread_id"),
+                                  metadata.get("ls_model_name") or params.get("model") or "unknown")
+
+    on_llm_start = on_chat_model_start
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            start, parentRunId, node, threadId, model = run
+            retries = self._failures.pop(parentRunId, 0)
+        message = getattr(response.generations[0][0], "message", None) if response.generations and response.generations[0] else None
+        inputTokens = outputTokens = cacheRead = cacheWrite = 0
+        if isinstance(message, AIMessage):
+            responseModel, inputTokens, outputTokens = response_usage(message)
+            cacheRead, cacheWrite = cache_usage(message)
+            model = model if responseModel == "unknown" else responseModel
+        self.ledger.record(model, inputTokens, outputTokens, time.perf_counter() - start, node, threadId, retries,
+                           cache_read_tokens=cacheRead, cache_write_tokens=cacheWrite)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            start, parentRunId, node, threadId, model = run
+            self._failures[parentRunId] += 1
+        self.ledger.record(model, latency=time.perf_counter() - start, node=node, thread_id=threadId, error=True)
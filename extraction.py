@@ -0,0 +1,61 @@
+import re
+from typing import Optional
+from bs4 import BeautifulSoup
+
+# lxml is several times faster than the pure Python parser, but is optional
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+# Elements that never hold the main content of a page
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "form", "button",
+                    "nav", "header", "footer", "aside"]
+BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo", "complementary", "search"]
+MAIN_CONTENT_SELECTORS = ["main", "article", "[role=main]", "#content", "#main-content", ".content"]
+
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in a string using the ~4 characters per token rule of thumb."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = "\n\n[... content truncated ...]") -> str:
+    """Truncate text to roughly max_tokens, cutting at a paragraph or line boundary where possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = max_chars
+    return text[:cut].rstrip() + marker
+
+def extract_main_text(html: str, max_tokens: Optional[int] = 4000) -> str:
+    """
+    Extract the readable main content of an HTML page.
+
+    Scripts, navigation, headers, footers and other boilerplate are dropped, the main content block is
+    preferred over the whole body when the page marks one, and the result is bounded to max_tokens unless it is None.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    for element in soup(BOILERPLATE_TAGS):
+        element.decompose()
+    for role in BOILERPLATE_ROLES:
+        for element in soup.find_all(attrs={"role": role}):
+            element.decompose()
+
+    root = None
+    for selector in MAIN_CONTENT_SELECTORS:
+        root = soup.select_one(selector)
+        if root is not None and root.get_text(strip=True):
+            break
+        root = None
+    root = root or soup.body or soup
+
+    text = root.get_text(separator="\n")
+    lines = (re.sub(r"[ \t\xa0]+", " ", line).strip() for line in text.splitlines())
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return text if max_tokens is None else truncate_to_tokens(text, max_tokens)
@@ -0,0 +1,149 @@
+import asyncio, threading, weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+
+DEFAULT_TIMEOUT = httpx.Timeout(connect=5.0, read=20.0, write=10.0, pool=10.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30.0)
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; CodeSolutionAgent/1.0)"}
+
+class UnsupportedContentError(httpx.HTTPError):
+    """Raised when a response's content type is not one the caller accepts."""
+
+def _check_content_type(response: httpx.Response, content_types: tuple):
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_types and content_type and not content_type.startswith(content_types):
+        raise UnsupportedContentError(f"Unsupported content type {content_type} for url {response.url}")
+
+def _capped_response(response: httpx.Response, body: bytes) -> httpx.Response:
+    """Copy a streamed response with a (possibly truncated) decoded body."""
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+    return httpx.Response(response.status_code, headers=headers, content=body, request=response.request)
+
+class PooledFetcher:
+    """
+    Fetch URLs over shared, keep-alive connection pools.
+
+    One sync client is shared by every thread and one async client is kept per event loop, so repeat
+    requests to a host reuse the open connection instead of paying for a new TLS handshake.  Requests
+    are bounded by connect/read timeouts and by a per-host connection limit.
+
+    Responses are streamed so that a body can be capped at max_bytes and an unwanted content type can
+    be rejected from the headers, before the body is downloaded.
+
+    Methods:
+        get(url) -> httpx.Response: Fetch a URL on the shared sync client.
+        aget(url) -> httpx.Response: Fetch a URL on the async client of the running event loop.
+        fetch_all(urls) -> list: Fetch a list of URLs concurrently from a thread pool.
+        afetch_all(urls) -> list: Fetch a list of URLs concurrently on the running event loop.
+    """
+
+    def __init__(self, timeout: httpx.Timeout = DEFAULT_TIMEOUT, limits: httpx.Limits = DEFAULT_LIMITS,
+                 max_connections_per_host: int = 6, headers: dict = DEFAULT_HEADERS):
+        self.timeout = timeout
+        self.limits = limits
+        self.max_connections_per_host = max_connections_per_host
+        self.headers = headers
+        self._lock = threading.Lock()
+        self._client = None
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_host_slots = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> httpx.Client:
+        """The shared sync client, created on first use."""
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(timeout=self.timeout, limits=self.limits, headers=self.headers, follow_redirects=True)
+            return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        """The async client bound to the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_clients:
+                self._async_clients[loop] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, headers=self.headers,
+                                                              follow_redirects=True)
+                self._async_host_slots[loop] = defaultdict(lambda: asyncio.Semaphore(self.max_connections_per_host))
+            return self._async_clients[loop]
+
+    def get(self, url: str, headers: dict = None, max_bytes: int = None, content_types: tuple = ()) -> httpx.Response:
+        """
+        Fetch a URL, waiting for a free connection slot on its host.
+
+        The body is truncated at max_bytes, and UnsupportedContentError is raised before the body is read
+        if the response content type does not start with one of content_types.
+        """
+        with self._host_slot(url):
+            with self.client.stream("GET", url, headers=headers) as response:
+                if response.is_success:
+                    _check_content_type(response, content_types)
+                body = bytearray()
+                for chunk in response.iter_bytes():
+                    body += chunk
+                    if max_bytes is not None and len(body) >= max_bytes:
+                        break
+                return _capped_response(response, bytes(body[:max_bytes]))
+
+    async def aget(self, url: str, headers: dict = None, max_bytes: int = None, content_types: tuple = ()) -> httpx.Response:
+        """Fetch a URL asynchronously, waiting for a free connection slot on its host.  See get for the limits applied."""
+        client = self.async_client()
+        async with self._async_host_slots[asyncio.get_running_loop()][self._host(url)]:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.is_success:
+                    _check_content_type(response, content_types)
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if max_bytes is not None and len(body) >= max_bytes:
+                        break
+                return _capped_response(response, bytes(body[:max_bytes]))
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """The connection slots of the url's host, shared by every thread fetching from it."""
+        host = self._host(url)
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return slot
+
+    def fetch_all(self, urls: list[str], max_workers: int = 8) -> list:
+        """Fetch URLs concurrently.  Each entry is the response, or the exception raised for that URL."""
+        def fetch(url):
+            try:
+                return self.get(url)
+            except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(fetch, urls))
+
+    async def afetch_all(self, urls: list[str]) -> list:
+        """Fetch URLs concurrently.  Each entry is the response, or the exception raised for that URL."""
+        return await asyncio.gather(*(self.aget(url) for url in urls), return_exceptions=True)
+
+    def close(self):
+        """Close the shared sync client.  Async clients are released with their event loop."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+def shared_fetcher() -> PooledFetcher:
+    """Return the process-wide fetcher so every tool instance shares the same connection pools."""
+    global _shared_fetcher
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = PooledFetcher()
+        return _shared_fetcher
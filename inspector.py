@@ -0,0 +1,176 @@
+import argparse, glob, os, pickle, re, sys
+from datetime import datetime
+from pprint import pformat
+from typing import Any, Optional
+
+from journal import MAGIC, JournalReader, SNAPSHOT, UPDATE
+
+QUERY_TOKEN = re.compile(r"""\.?([A-Za-z_]\w*)|\[(-?\d+)\]|\[["']([^"']+)["']\]""")
+
+def parse_query(query: str) -> list:
+    """Split a query such as generated_code.modules[2].code into keys, attributes and list indexes."""
+    parts, position = [], 0
+    query = query.strip()
+    while position < len(query):
+        match = QUERY_TOKEN.match(query, position)
+        if match is None:
+            raise ValueError(f"Invalid query {query!r} at position {position}")
+        name, index, key = match.groups()
+        parts.append(int(index) if index is not None else (name or key))
+        position = match.end()
+    return parts
+
+def resolve(value: Any, query: str) -> Any:
+    """Resolve a query against nested dicts, lists and objects (e.g. message.content)."""
+    for part in parse_query(query) if query else []:
+        if isinstance(part, int):
+            value = value[part]
+        elif isinstance(value, dict):
+            value = value[part]
+        else:
+            value = getattr(value, part)
+    return value
+
+def shorten(value: Any, max_chars: int) -> Any:
+    """Truncate every long string inside a value so that it can be rendered cheaply."""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else f"{value[:max_chars]}... [{len(value) - max_chars} more chars]"
+    if isinstance(value, dict):
+        return {key: shorten(item, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shorten(item, max_chars) for item in value]
+    if isinstance(value, tuple):
+        return tuple(shorten(item, max_chars) for item in value)
+    if hasattr(value, "model_dump"):
+        return {"type": type(value).__name__, **shorten(value.model_dump(exclude_none=True), max_chars)}
+    return value
+
+def render(value: Any, max_chars: int = 500) -> str:
+    if isinstance(value, str):
+        return shorten(value, max_chars * 4)
+    return pformat(shorten(value, max_chars), width=120, sort_dicts=False)
+
+def describe(value: Any) -> str:
+    """One-line description of a value: its type and its length or size."""
+    if isinstance(value, (str, list, tuple, dict)):
+        size = f"{len(value)} chars" if isinstance(value, str) else f"{len(value)} items"
+    else:
+        size = f"{len(repr(value))} chars repr"
+    return f"{type(value).__name__} ({size})"
+
+class JournalSource:
+    """A state journal: events are indexed from the record headers and states are rebuilt on demand."""
+
+    def __init__(self, path: str):
+        self.reader = JournalReader(path)
+
+    def entries(self) -> list[dict]:
+        return [{"index": record.index, "kind": "snapshot" if record.kind == SNAPSHOT else "update", "node": record.node,
+                 "time": record.timestamp, "bytes": record.payload_length} for record in self.reader.records()]
+
+    def state(self, index: Optional[int]) -> dict:
+        return self.reader.state_at(index)
+
+    def update(self, index: int) -> dict:
+        return {record.node: self.reader.load(record) for record in self.reader.records()
+                if record.kind == UPDATE and record.index == index}
+
+class PickleSource:
+    """A single state pickle, or a directory of the <event>_<timestamp>.pkl files written by app.output_state."""
+
+    def __init__(self, path: str):
+        files = sorted(glob.glob(os.path.join(path, "*.pkl"))) if os.path.isdir(path) else [path]
+        self.files = sorted(files, key=self._timestamp)
+
+    @staticmethod
+    def _timestamp(path: str) -> float:
+        match = re.search(r"_(\d+(?:\.\d+)?)\.pkl$", path)
+        return float(match.group(1)) if match else os.path.getmtime(path)
+
+    def entries(self) -> list[dict]:
+        return [{"index": index, "kind": "state", "node": re.sub(r"_[\d.]+$", "", os.path.basename(path)[:-4]),
+                 "time": self._timestamp(path), "bytes": os.path.getsize(path)} for index, path in enumerate(self.files)]
+
+    def state(self, index: Optional[int]) -> dict:
+        with open(self.files[-1 if index is None else index], "rb") as file:
+            return pickle.load(file)
+
+    def update(self, index: int) -> dict:
+        return self.state(index)
+
+def open_source(path: str):
+    if os.path.isfile(path):
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) == MAGIC:
+                return JournalSource(path)
+    return PickleSource(path)
+
+def list_entries(source, node: Optional[str] = None):
+    print(f"{'index':>5}  {'kind':<8}  {'node':<22}  {'bytes':>9}  time")
+    for entry in source.entries():
+        if node and entry["node"] != node:
+            continue
+        print(f"{entry['index']:>5}  {entry['kind']:<8}  {entry['node']:<22}  {entry['bytes']:>9}  "
+              f"{datetime.fromtimestamp(entry['time']).isoformat(timespec='seconds')}")
+
+def list_fields(value: Any):
+    items = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, (list, tuple)) else vars(value).items()
+    for key, item in items:
+        print(f"{str(key):<24}  {describe(item)}")
+
+def list_messages(messages: list, max_chars: int):
+    for index, message in enumerate(messages):
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        calls = ", ".join(call["name"] for call in getattr(message, "tool_calls", None) or [])
+        preview = content.strip().splitlines()[0][:max_chars] if content.strip() else f"<tool calls: {calls}>" if calls else ""
+        print(f"{index:>4}  {message.type:<6}  {message.name or '':<16}  {len(content):>7} chars  {preview}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect saved graph state journals and pickles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    listParser = subparsers.add_parser("list", help="List the events of a journal or the state pickles")
+    listParser.add_argument("path")
+    listParser.add_argument("--node", help="Only list events from this node")
+
+    for name, helpText in (("fields", "List the fields of a state value with their sizes"),
+                           ("show", "Show a state value"),
+                           ("messages", "List the messages of a state"),
+                           ("update", "Show the update a node made in an event")):
+        subparser = subparsers.add_parser(name, help=helpText)
+        subparser.add_argument("path")
+        if name == "update":
+            subparser.add_argument("index", type=int, help="Event index")
+        subparser.add_argument("query", nargs="?", default="", help="Path to a value, e.g. generated_code.modules[2].code")
+        subparser.add_argument("--at", type=int, help="Event index to inspect the state after (default: the last event)")
+        subparser.add_argument("--max-chars", type=int, default=500, help="Truncate strings longer than this")
+
+    dumpParser = subparsers.add_parser("dump", help="Write a truncated rendering of a state to a file")
+    dumpParser.add_argument("path")
+    dumpParser.add_argument("--at", type=int)
+    dumpParser.add_argument("--max-chars", type=int, default=500)
+    dumpParser.add_argument("--output", default="state.txt")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Inspect graph state without rendering every message and tool payload."""
+    args = parse_args(argv)
+    source = open_source(args.path)
+
+    if args.command == "list":
+        list_entries(source, args.node)
+    elif args.command == "dump":
+        with open(args.output, "w") as file:
+            file.write(render(source.state(args.at), args.max_chars))
+    else:
+        root = source.update(args.index) if args.command == "update" else source.state(args.at)
+        value = resolve(root, args.query)
+        if args.command == "fields":
+            list_fields(value)
+        elif args.command == "messages":
+            list_messages(value if args.query else value["messages"], args.max_chars)
+        else:
+            print(render(value, args.max_chars))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import ast
+from functools import lru_cache
+from state import Module
+
+def _signature(node: ast.FunctionDef | ast.AsyncFunctionDef) -> str:
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    decorators = "".join(f"@{ast.unparse(decorator)}\n" for decorator in node.decorator_list)
+    return f"{decorators}{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+def _docstring(node: ast.AST, indent: str) -> list[str]:
+    docstring = ast.get_docstring(node)
+    if not docstring:
+        return []
+    return [f'{indent}"""' + docstring.strip().replace("\n", f"\n{indent}") + '"""']
+
+def _is_public(name: str) -> bool:
+    return not name.startswith("_") or (name.startswith("__") and name.endswith("__"))
+
+def _function(node: ast.FunctionDef | ast.AsyncFunctionDef, indent: str = "") -> list[str]:
+    lines = [indent + line for line in _signature(node).splitlines()]
+    lines[-1] += ":"
+    return lines + (_docstring(node, indent + "    ") or [f"{indent}    ..."])
+
+def _class(node: ast.ClassDef) -> list[str]:
+    bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+    lines = [f"@{ast.unparse(decorator)}" for decorator in node.decorator_list]
+    lines.append(f"class {node.name}({bases}):" if bases else f"class {node.name}:")
+    body = _docstring(node, "    ")
+    for item in node.body:
+        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and _is_public(item.name):
+            body += _function(item, "    ")
+        elif isinstance(item, ast.AnnAssign) and isinstance(item.target, ast.Name) and _is_public(item.target.id):
+            body.append(f"    {ast.unparse(item.target)}: {ast.unparse(item.annotation)}")
+        elif isinstance(item, ast.Assign) and all(isinstance(target, ast.Name) and _is_public(target.id) for target in item.targets):
+            body.append("    " + " = ".join(target.id for target in item.targets) + " = ...")
+    return lines + (body or ["    ..."])
+
+@lru_cache(maxsize=256)
+def summarize_source(source: str) -> str:
+    """
+    Reduce Python source to its public interface: the module docstring, imports, constants, class and
+    function signatures with their docstrings, and __all__.  Function bodies are dropped.
+
+    Raises SyntaxError if the source cannot be parsed.
+    """
+    tree = ast.parse(source)
+    lines = _docstring(tree, "")
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(ast.unparse(node))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and _is_public(node.name):
+            lines += _function(node)
+        elif isinstance(node, ast.ClassDef) and _is_public(node.name):
+            lines += _class(node)
+        elif isinstance(node, ast.Assign) and all(isinstance(target, ast.Name) and _is_public(target.id) for target in node.targets):
+            names = [target.id for target in node.targets]
+            value = ast.unparse(node.value) if "__all__" in names else "..."
+            lines.append(" = ".join(names) + f" = {value}")
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name) and _is_public(node.target.id):
+            lines.append(f"{node.target.id}: {ast.unparse(node.annotation)}")
+    return "\n".join(lines)
+
+def summarize_module(module: Module) -> str:
+    """
+    Describe an implemented module by its file name, prefix and public interface.
+
+    Modules that are not Python, or that do not parse, are described by their full source instead.
+    """
+    source = f"{module['imports']}\n{module['code']}"
+    if module.get("language", "python").lower() in ("python", "py"):
+        try:
+            source = summarize_source(source)
+        except SyntaxError:
+            pass
+    return f"# File: {module['file_name']}\n# {module['prefix']}\n{source}"
+
+def full_module(module: Module) -> str:
+    return f"# File: {module['file_name']}\n# {module['prefix']}\n{module['imports']}\n{module['code']}"
+
+def describe_modules(modules: list[Module], full_source: bool = False) -> str:
+    """Render implemented modules for a prompt, as interface summaries unless full_source is set."""
+    if not modules:
+        return "None"
+    describe = full_module if full_source else summarize_module
+    return "\n\n".join(describe(module) for module in modules)
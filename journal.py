@@ -0,0 +1,165 @@
+import os, pickle, struct, time, zlib
+from typing import Annotated, Any, Callable, Iterator, NamedTuple, Optional, get_args, get_origin, get_type_hints
+
+MAGIC = b"STATEJOURNAL1\n"
+UPDATE = b"U"
+SNAPSHOT = b"S"
+
+# kind, event index, timestamp, node name length, payload length
+HEADER = struct.Struct(">cIdHI")
+
+class JournalRecord(NamedTuple):
+    """Location and description of one record in a state journal.  The payload is not loaded."""
+    offset: int
+    kind: bytes
+    index: int
+    timestamp: float
+    node: str
+    payload_offset: int
+    payload_length: int
+
+def state_reducers(state_schema: type) -> dict[str, Callable]:
+    """Return the reducer of every Annotated key of a graph state schema, e.g. add_messages for messages."""
+    reducers = {}
+    for key, hint in get_type_hints(state_schema, include_extras=True).items():
+        if get_origin(hint) is Annotated:
+            for metadata in get_args(hint)[1:]:
+                if callable(metadata):
+                    reducers[key] = metadata
+    return reducers
+
+class StateJournal:
+    """
+    Append-only, compressed log of the updates streamed from a graph run.
+
+    Each streamed event appends only the node's update instead of the whole graph state.  A full snapshot
+    of the state is appended every snapshot_every events so that JournalReader can rebuild the state at
+    any event by replaying a handful of updates.  Every record has an uncompressed header (kind, event
+    index, timestamp, node) followed by a zlib-compressed pickle of its payload.
+    """
+
+    def __init__(self, path: str, snapshot_every: int = 10):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.index = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        isNew = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if isNew:
+            self._file.write(MAGIC)
+        else:
+            records = JournalReader(path).records()
+            self.index = records[-1].index if records else 0
+
+    def append(self, kind: bytes, node: str, payload: Any):
+        data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        name = node.encode()
+        self._file.write(HEADER.pack(kind, self.index, time.time(), len(name), len(data)) + name + data)
+        self._file.flush()
+
+    def record_input(self, graph_input: dict):
+        """Record the input the run was started with as the first update."""
+        self.append(UPDATE, "__input__", graph_input)
+
+    def record_event(self, event: dict, graph=None, config=None):
+        """Record the node updates of one streamed event, and snapshot the graph state when one is due."""
+        self.index += 1
+        for node, update in event.items():
+            self.append(UPDATE, node, update)
+        if graph is not None and self.index % self.snapshot_every == 0:
+            self.snapshot(graph.get_state(config=config).values)
+
+    def snapshot(self, state: dict):
+        self.append(SNAPSHOT, "__snapshot__", dict(state))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class JournalReader:
+    """
+    Read a state journal written by StateJournal.
+
+    records() scans only the record headers, so a journal can be listed without decompressing any
+    payload.  state_at(index) rebuilds the state after an event from the closest earlier snapshot.
+    """
+
+    def __init__(self, path: str, reducers: Optional[dict[str, Callable]] = None):
+        self.path = path
+        self._reducers = reducers
+        self._records = None
+
+    @property
+    def reducers(self) -> dict[str, Callable]:
+        if self._reducers is None:
+            from state import State
+            self._reducers = state_reducers(State)
+        return self._reducers
+
+    def records(self) -> list[JournalRecord]:
+        if self._records is None:
+            records = []
+            with open(self.path, "rb") as file:
+                if file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{self.path} is not a state journal")
+                while True:
+                    offset = file.tell()
+                    header = file.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        break
+                    kind, index, timestamp, nameLength, payloadLength = HEADER.unpack(header)
+                    node = file.read(nameLength).decode()
+                    payloadOffset = file.tell()
+                    if os.fstat(file.fileno()).st_size < payloadOffset + payloadLength:
+                        break  # a record cut short by an interrupted write
+                    file.seek(payloadLength, os.SEEK_CUR)
+                    records.append(JournalRecord(offset, kind, index, timestamp, node, payloadOffset, payloadLength))
+            self._records = records
+        return self._records
+
+    def load(self, record: JournalRecord) -> Any:
+        """Decompress and unpickle the payload of a record."""
+        with open(self.path, "rb") as file:
+            file.seek(record.payload_offset)
+            return pickle.loads(zlib.decompress(file.read(record.payload_length)))
+
+    def updates(self) -> Iterator[tuple[JournalRecord, Any]]:
+        for record in self.records():
+            if record.kind == UPDATE:
+                yield record, self.load(record)
+
+    def state_at(self, index: Optional[int] = None) -> dict:
+        """Rebuild the graph state after the event with the given index, or after the last event."""
+        records = self.records()
+        if index is None:
+            index = records[-1].index if records else 0
+        start = 0
+        state = {}
+        for position, record in enumerate(records):
+            if record.kind == SNAPSHOT and record.index <= index:
+                start, state = position + 1, None
+        if state is None:
+            state = self.load(records[start - 1])
+        for record in records[start:]:
+            if record.index > index:
+                break
+            if record.kind == UPDATE:
+                self.apply(state, self.load(record))
+        return state
+
+    def apply(self, state: dict, update: Any):
+        """Apply one node update to a state using the state's reducers."""
+        if not isinstance(update, dict):
+            return
+        for key, value in update.items():
+            if key in self.reducers:
+                current = state.get(key)
+                state[key] = self.reducers[key](type(value)() if current is None else current, value)
+            else:
+                state[key] = value
@@ -0,0 +1,50 @@
+from textwrap import dedent
+from typing import Optional
+from langchain_core.messages import BaseMessage
+
+# Anthropic caches the prompt prefix up to and including a block marked with cache_control for five minutes.
+# Prefixes shorter than the model's minimum (1024 tokens for Sonnet, 2048 for Haiku) are sent uncached, so a
+# breakpoint only pays off after a large, repeated part of the prompt: the research document in the coder's
+# system prompt, or the tool results in the researcher's history.
+EPHEMERAL = {"type": "ephemeral"}
+
+def text_block(text: str) -> dict:
+    return {"type": "text", "text": dedent(text).strip()}
+
+def cached_block(text: str) -> dict:
+    """A text content block that ends a cacheable prompt prefix."""
+    return {**text_block(text), "cache_control": EPHEMERAL}
+
+def cached_system_prompt(static: str, volatile: Optional[str] = None) -> tuple[str, list[dict]]:
+    """
+    A system message template whose static part is cached, followed by an optional volatile part.
+
+    The static part must only contain text (and template variables) that stay the same across the calls
+    that should share the cache, e.g. the instructions and the research document, so that the parts that
+    change on every call, like the current step, come after the cache breakpoint.
+    """
+    blocks = [cached_block(static)]
+    if volatile:
+        blocks.append(text_block(volatile))
+    return ("system", blocks)
+
+def cache_history(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """
+    A copy of the message history with a cache breakpoint after its last message.
+
+    Every round of a tool loop resends the previous round's history plus the new tool results, so the
+    next round reads everything up to this breakpoint, retrieved pages included, from the cache.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    if isinstance(last.content, str):
+        if not last.content.strip():
+            return messages  # empty text blocks are rejected by the API
+        content = [{"type": "text", "text": last.content, "cache_control": EPHEMERAL}]
+    else:
+        content = [block if isinstance(block, dict) else {"type": "text", "text": block} for block in last.content]
+        if not content:
+            return messages
+        content[-1] = {**content[-1], "cache_control": EPHEMERAL}
+    return messages[:-1] + [last.model_copy(update={"content": content})]
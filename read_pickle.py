@@ -1,8 +1,6 @@
-import pickle
-from pprint import pprint
 import sys
+from inspector import main
 
-with open(sys.argv[1], "rb") as f:
-    state = pickle.load(f)
-    with open("state.txt", "w") as f2:
-        pprint(state, stream=f2)
\ No newline at end of file
+# Kept for the old `python read_pickle.py <file>` workflow.  Writes a truncated rendering of the state to
+# state.txt; use inspector.py to list, query and page through states instead of dumping them.
+main(["dump", sys.argv[1], "--output", "state.txt"] + sys.argv[2:])
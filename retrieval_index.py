@@ -0,0 +1,93 @@
+import math, re
+from collections import Counter, defaultdict
+from typing import NamedTuple, Optional
+from extraction import estimate_tokens
+
+WORD = re.compile(r"\w+")
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = frozenset("""a an and are as at be but by can do for from has have how i if in into is it its of on or that the
+                         their them then there these this to use using was we what when which will with you your""".split())
+
+def terms(text: str) -> list[str]:
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+def chunk_text(text: str, max_tokens: int = 200) -> list[str]:
+    """Split a text into chunks of up to about max_tokens, on paragraph boundaries, then sentences, then words."""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE.split(paragraph):
+            words = sentence.split()
+            step = max(max_tokens * 3 // 4, 1)  # about four characters, or three quarters of a word, per token
+            pieces.extend(" ".join(words[start:start + step]) for start in range(0, len(words), step))
+    chunks, current = [], []
+    for piece in pieces:
+        if current and estimate_tokens("\n\n".join(current + [piece])) > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+        current.append(piece)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+class Chunk(NamedTuple):
+    id: str
+    ref: str
+    url: str
+    text: str
+
+class BM25Index:
+    """
+    An in-process Okapi BM25 index over the chunks of retrieved pages.
+
+    Adding a page costs a pass over its words, and a search only scores the chunks that share a term
+    with the query, so the index stays cheap for the few dozen pages of a run.
+    """
+
+    def __init__(self, chunk_tokens: int = 200, k1: float = 1.5, b: float = 0.75):
+        self.chunk_tokens = chunk_tokens
+        self.k1 = k1
+        self.b = b
+        self.chunks: list[Chunk] = []
+        self.lengths: list[int] = []
+        self.postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self.total_length = 0
+
+    def add(self, ref: str, url: str, text: str) -> list[Chunk]:
+        """Chunk and index the text of a page.  Chunk ids are the page reference and the chunk number, e.g. page-2#3."""
+        added = []
+        for number, chunkText in enumerate(chunk_text(text, self.chunk_tokens), 1):
+            position = len(self.chunks)
+            chunk = Chunk(f"{ref}#{number}", ref, url, chunkText)
+            counts = Counter(terms(chunkText))
+            for term, count in counts.items():
+                self.postings[term][position] = count
+            self.chunks.append(chunk)
+            self.lengths.append(sum(counts.values()))
+            self.total_length += self.lengths[-1]
+            added.append(chunk)
+        return added
+
+    def search(self, query: str, k: int = 4, refs: Optional[set[str]] = None, exclude: frozenset = frozenset()) -> list[tuple[float, Chunk]]:
+        """The k chunks that best match the query, optionally only of the pages in refs and not in exclude."""
+        if not self.chunks:
+            return []
+        averageLength = self.total_length / len(self.chunks) or 1.0
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, count in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / averageLength)
+                scores[position] += idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(((score, self.chunks[position]) for position, score in scores.items()
+                         if (refs is None or self.chunks[position].ref in refs) and self.chunks[position].id not in exclude),
+                        key=lambda item: -item[0])
+        return ranked[:k]
@@ -0,0 +1,203 @@
+import json, threading, time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, NamedTuple, Optional, Union
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
+from costs import PRICES, cache_usage, call_cost, response_usage
+from scheduler import estimate_input_tokens
+
+# The reviewer has always run on Sonnet, so it is never routed to a weaker model by default
+DEFAULT_NODE_FLOOR = {"validator": "claude-3-5-sonnet-latest"}
+
+class RoutingDecision(NamedTuple):
+    model: str
+    node: str
+    thread_id: str
+    input_tokens: int
+    reason: str
+
+def valid_json_list(output: Any) -> bool:
+    """Whether a plain LLM response is the JSON list a planner asked for."""
+    content = output.content if isinstance(output, AIMessage) else output
+    if not isinstance(content, str):
+        return False
+    try:
+        return isinstance(json.loads(content), list)
+    except json.JSONDecodeError:
+        return False
+
+def valid_structured_output(output: Any) -> bool:
+    """Whether a with_structured_output(include_raw=True) response was parsed."""
+    return not isinstance(output, dict) or (output.get("parsed") is not None and output.get("parsing_error") is None)
+
+class ModelRouter:
+    """
+    Pick the model for every LLM call from a list of models ordered from cheapest to strongest.
+
+    A call starts from the cheapest model allowed for its node (node_floor), and moves one model up when
+    its prompt is larger than escalate_tokens.  Of the remaining models, the cheapest one whose observed
+    latency for the node meets the latency SLO is used, unless it would take the run over its cost
+    budget, in which case the node's floor is used, even for a large prompt.  A call whose output fails
+    validation is retried once on the next stronger model.  Savings are measured against sending every
+    call to the strongest model.
+    """
+
+    def __init__(self, models: list[str], prices: dict = PRICES, node_floor: Optional[dict[str, str]] = None,
+                 escalate_tokens: Optional[int] = 20000, latency_slo: Union[float, dict[str, float], None] = None,
+                 run_budget: Optional[float] = None, max_threads: int = 10000, logger=None):
+        self.models = models
+        self.prices = prices
+        self.node_floor = DEFAULT_NODE_FLOOR if node_floor is None else node_floor
+        self.escalate_tokens = escalate_tokens
+        self.latency_slo = latency_slo
+        self.run_budget = run_budget
+        self.max_threads = max_threads
+        self.logger = logger
+        self._latency: dict[tuple[str, str], float] = {}
+        self._output_tokens: dict[str, float] = {}
+        self._spent: OrderedDict[str, float] = OrderedDict()
+        self._stats = defaultdict(lambda: {"calls": 0, "escalations": 0, "failures": 0, "cost": 0.0, "baseline_cost": 0.0,
+                                           "models": defaultdict(int)})
+        self._lock = threading.Lock()
+
+    def _slo(self, node: str) -> Optional[float]:
+        return self.latency_slo.get(node) if isinstance(self.latency_slo, dict) else self.latency_slo
+
+    def estimated_cost(self, model: str, node: str, input_tokens: int) -> float:
+        return call_cost(model, input_tokens, int(self._output_tokens.get(node, 1000)), self.prices)
+
+    def route(self, node: Optional[str], input_tokens: int, thread_id: Optional[str] = None,
+              available: Optional[list[str]] = None) -> RoutingDecision:
+        node, thread_id = node or "unknown", thread_id or "default"
+        models = [model for model in self.models if available is None or model in available]
+        nodeFloor = models.index(self.node_floor[node]) if self.node_floor.get(node) in models else 0
+        floor = nodeFloor
+        reasons = [f"floor {models[floor]}"] if floor else []
+        if self.escalate_tokens is not None and input_tokens > self.escalate_tokens and floor < len(models) - 1:
+            floor += 1
+            reasons.append(f"prompt of {input_tokens} tokens")
+        candidates = models[floor:]
+        with self._lock:
+            slo = self._slo(node)
+            model = candidates[0]
+            if slo is not None:
+                latencies = [(self._latency.get((candidate, node)), candidate) for candidate in candidates]
+                meeting = [candidate for latency, candidate in latencies if latency is None or latency <= slo]
+                if meeting:
+                    model = meeting[0]
+                else:
+                    model = min(latencies)[1]
+                    reasons.append(f"latency SLO {slo}s")
+            if self.run_budget is not None and model != models[nodeFloor]:
+                remaining = self.run_budget - self._spent.get(thread_id, 0.0)
+                if self.estimated_cost(model, node, input_tokens) > remaining:
+                    model = models[nodeFloor]
+                    reasons.append(f"budget ({remaining:.4f} left)")
+        return RoutingDecision(model, node, thread_id, input_tokens, ", ".join(reasons) or "cheapest")
+
+    def escalate(self, decision: RoutingDecision, available: Optional[list[str]] = None) -> Optional[RoutingDecision]:
+        """The next stronger model after a failed call, or None if the failed call used the strongest model."""
+        models = [model for model in self.models if available is None or model in available]
+        index = models.index(decision.model) + 1
+        if index >= len(models):
+            return None
+        return decision._replace(model=models[index], reason="escalated after a failed call")
+
+    def record(self, decision: RoutingDecision, output: Any, latency: float, failed: bool = False, escalated: bool = False):
+        """Record the usage, latency and savings of a routed call."""
+        message = output.get("raw") if isinstance(output, dict) else output
+        cost = baseline = 0.0
+        if isinstance(message, AIMessage):
+            _, inputTokens, outputTokens = response_usage(message)
+            cacheRead, cacheWrite = cache_usage(message)
+            cost = call_cost(decision.model, inputTokens, outputTokens, self.prices, cacheRead, cacheWrite)
+            baseline = call_cost(self.models[-1], inputTokens, outputTokens, self.prices, cacheRead, cacheWrite)
+        with self._lock:
+            key = (decision.model, decision.node)
+            self._latency[key] = latency if key not in self._latency else 0.8 * self._latency[key] + 0.2 * latency
+            if isinstance(message, AIMessage):
+                self._output_tokens[decision.node] = outputTokens if decision.node not in self._output_tokens else \
+                    0.8 * self._output_tokens[decision.node] + 0.2 * outputTokens
+            self._spent[decision.thread_id] = self._spent.get(decision.thread_id, 0.0) + cost
+            self._spent.move_to_end(decision.thread_id)
+            while len(self._spent) > self.max_threads:
+                self._spent.popitem(last=False)
+            stats = self._stats[decision.node]
+            stats["calls"] += 1
+            stats["escalations"] += escalated
+            stats["failures"] += failed
+            stats["cost"] += cost
+            stats["baseline_cost"] += baseline
+            stats["models"][decision.model] += 1
+        if self.logger:
+            # Every call is routed, so only escalations and failures are worth logging above debug
+            log = self.logger.info if failed or escalated else self.logger.debug
+            log(f"Routed {decision.node} call of {decision.input_tokens} tokens to {decision.model} ({decision.reason}): "
+                f"${cost:.4f} in {latency:.1f}s, ${baseline - cost:.4f} saved{', failed' if failed else ''}")
+
+    def thread_cost(self, thread_id: str) -> float:
+        with self._lock:
+            return self._spent.get(thread_id, 0.0)
+
+    def stats(self) -> dict:
+        """Calls, escalations, cost and savings per node, and the observed latency per model and node."""
+        with self._lock:
+            nodes = {node: {**stats, "models": dict(stats["models"]), "cost": round(stats["cost"], 6),
+                            "baseline_cost": round(stats["baseline_cost"], 6), "saved": round(stats["baseline_cost"] - stats["cost"], 6)}
+                     for node, stats in self._stats.items()}
+            return {"nodes": nodes, "saved": round(sum(node["saved"] for node in nodes.values()), 6),
+                    "latency": {f"{model}/{node}": round(latency, 3) for (model, node), latency in self._latency.items()}}
+
+class RoutedModel(Runnable):
+    """
+    Send every call to one of several variants of a model (e.g. the same tools or structured output on
+    Haiku and on Sonnet), chosen by a ModelRouter from the node, thread and prompt size in the run config.
+
+    When validate is given and rejects the output, the call is retried once on the next stronger model.
+    """
+
+    def __init__(self, variants: dict[str, Runnable], router: ModelRouter, validate: Optional[Callable[[Any], bool]] = None):
+        self.variants = variants
+        self.router = router
+        self.validate = validate
+
+    @property
+    def InputType(self):
+        return next(iter(self.variants.values())).InputType
+
+    @property
+    def OutputType(self):
+        return next(iter(self.variants.values())).OutputType
+
+    def _route(self, input: Any, config: RunnableConfig) -> RoutingDecision:
+        configurable, metadata = config.get("configurable", {}), config.get("metadata", {})
+        return self.router.route(metadata.get("langgraph_node"), estimate_input_tokens(input),
+                                 configurable.get("thread_id") or metadata.get("thread_id"), list(self.variants))
+
+    def _retry(self, decision: RoutingDecision, output: Any, start: float, escalated: bool) -> Optional[RoutingDecision]:
+        """Record the call and return the decision to retry with, if the output was rejected."""
+        failed = self.validate is not None and not self.validate(output)
+        self.router.record(decision, output, time.perf_counter() - start, failed, escalated)
+        return self.router.escalate(decision, list(self.variants)) if failed and not escalated else None
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        config = ensure_config(config)
+        decision, escalated = self._route(input, config), False
+        while True:
+            start = time.perf_counter()
+            output = self.variants[decision.model].invoke(input, config, **kwargs)
+            retry = self._retry(decision, output, start, escalated)
+            if retry is None:
+                return output
+            decision, escalated = retry, True
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        config = ensure_config(config)
+        decision, escalated = self._route(input, config), False
+        while True:
+            start = time.perf_counter()
+            output = await self.variants[decision.model].ainvoke(input, config, **kwargs)
+            retry = self._retry(decision, output, start, escalated)
+            if retry is None:
+                return output
+            decision, escalated = retry, True
@@ -0,0 +1,159 @@
+import asyncio, hashlib, importlib.util, json, os, re, signal, subprocess, sys, tempfile, time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from cache import SQLiteCache
+from state import Module, TestResult
+
+try:
+    import resource
+except ImportError:  # not available on Windows, where the limits are not applied
+    resource = None
+
+HAS_PYTEST = importlib.util.find_spec("pytest") is not None
+OUTPUT_TAIL_CHARS = 4000
+
+# "test_name (module.Class.test_name) ... ok" lines of unittest's verbose output
+UNITTEST_RESULT = re.compile(r"^(\w+) \(([\w.]+)\)(?:\n.*?)? \.\.\. (ok|FAIL|ERROR|skipped.*|expected failure|unexpected success)$", re.M)
+# The traceback blocks that follow the results: "FAIL: test_name (module.Class.test_name)\n-----\n<traceback>"
+UNITTEST_FAILURE = re.compile(r"^(?:FAIL|ERROR): (\w+) \(([\w.]+)\)\n-+\n(.*?)(?=^=+$|^-+\nRan )", re.M | re.S)
+
+# Run in the child before it execs the test command, since Popen's preexec_fn may deadlock in a process with
+# threads: the test runner pool, the post-coding branches and the server's workers all start subprocesses
+LIMIT_AND_EXEC = """
+import os, resource, sys
+cpu, memory = int(sys.argv[1]), int(sys.argv[2])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execv(sys.argv[3], sys.argv[3:])
+"""
+
+def module_source(module: Module) -> str:
+    return f"{module['imports']}\n\n{module['code']}\n" if module.get("imports") else f"{module['code']}\n"
+
+class TestRunner:
+    """
+    Run generated tests against the generated modules in isolated subprocesses.
+
+    Every run gets its own temporary workspace with each module written to the base name of its file_name
+    and the tests to tests.py, or to another free name if a module is called tests.py.  The tests run with pytest when it is installed, otherwise with unittest, in a child
+    process with a wall-clock timeout and, where the platform supports it, CPU time and address space
+    limits.  Runs execute on a bounded thread pool and their results are cached by a hash of the code
+    and tests, so repeated validations of the same solution do not run again.
+    """
+
+    def __init__(self, max_workers: int = 4, timeout: float = 60, cpu_seconds: int = 30, memory_bytes: int = 1024 * 1024 * 1024,
+                 cache: Optional[SQLiteCache] = None, python: str = sys.executable):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.python = python
+        self.cache = cache if cache is not None else SQLiteCache(".cache/test_results.sqlite", table="test_results", max_entries=2000)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="test-runner")
+
+    @staticmethod
+    def tests_file_name(modules: list[Module]) -> str:
+        """The file the tests are written to: tests.py, unless a module already has that name."""
+        taken = {os.path.basename(module["file_name"]) for module in modules if module.get("file_name")}
+        fileName, number = "tests.py", 1
+        while fileName in taken:
+            fileName, number = f"tests_{number}.py", number + 1
+        return fileName
+
+    @classmethod
+    def workspace_files(cls, modules: list[Module], tests: Module) -> dict[str, str]:
+        """The workspace files by name.  The tests are always the last entry."""
+        files = {os.path.basename(module["file_name"]): module_source(module) for module in modules if module.get("file_name")}
+        files[cls.tests_file_name(modules)] = module_source(tests)
+        return files
+
+    @staticmethod
+    def key(files: dict[str, str]) -> str:
+        return hashlib.sha256(json.dumps([sorted(files.items()), HAS_PYTEST]).encode()).hexdigest()
+
+    def run(self, modules: list[Module], tests: Module) -> dict:
+        """Run the tests and return {"passed", "failed", "run_error", "timed_out", "duration", "tests", "output", ...}."""
+        return self.submit(modules, tests).result()
+
+    async def arun(self, modules: list[Module], tests: Module) -> dict:
+        """Run the tests without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(modules, tests))
+
+    def submit(self, modules: list[Module], tests: Module) -> Future:
+        files = self.workspace_files(modules, tests)
+        key = self.key(files)
+        cached = self.cache.get(key)
+        if cached is not None:
+            future = Future()
+            future.set_result({**cached, "cached": True})
+            return future
+        return self.executor.submit(self._run_and_cache, key, files)
+
+    def _run_and_cache(self, key: str, files: dict[str, str]) -> dict:
+        result = self._execute(files)
+        # A timeout may be caused by a busy machine rather than by the code, so it is not cached
+        if not result["timed_out"]:
+            self.cache.set(key, result)
+        return {**result, "cached": False}
+
+    def _command(self, tests_file: str) -> list[str]:
+        if HAS_PYTEST:
+            command = [self.python, "-B", "-m", "pytest", "-q", "-p", "no:cacheprovider", "--junitxml=report.xml", tests_file]
+        else:
+            command = [self.python, "-B", "-m", "unittest", "-v", tests_file[:-len(".py")]]
+        if resource is None:
+            return command
+        return [self.python, "-c", LIMIT_AND_EXEC, str(self.cpu_seconds), str(self.memory_bytes or 0), *command]
+
+    def _execute(self, files: dict[str, str]) -> dict:
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="generated-tests-") as workspace:
+            for file_name, source in files.items():
+                with open(os.path.join(workspace, file_name), "w") as file:
+                    file.write(source)
+            env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": workspace, "PYTHONHASHSEED": "0", "HOME": workspace}
+            process = subprocess.Popen(self._command(list(files)[-1]), cwd=workspace, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True, start_new_session=True)
+            timedOut = False
+            try:
+                output, _ = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                timedOut = True
+                os.killpg(process.pid, signal.SIGKILL)
+                output, _ = process.communicate()
+            report = os.path.join(workspace, "report.xml")
+            tests = self._parse_junit(report) if os.path.exists(report) else self._parse_unittest(output)
+
+        passed = sum(1 for test in tests if test["outcome"] == "passed")
+        failed = sum(1 for test in tests if test["outcome"] in ("failed", "error"))
+        return {"passed": passed, "failed": failed, "timed_out": timedOut, "exit_code": process.returncode,
+                "run_error": not tests and (timedOut or process.returncode != 0),
+                "duration": round(time.perf_counter() - start, 3), "tests": tests, "output": output[-OUTPUT_TAIL_CHARS:]}
+
+    @staticmethod
+    def _parse_junit(path: str) -> list[TestResult]:
+        results = []
+        for case in ElementTree.parse(path).iter("testcase"):
+            name = ".".join(part for part in (case.get("classname"), case.get("name")) if part)
+            outcome, message = "passed", ""
+            for tag in ("failure", "error", "skipped"):
+                element = case.find(tag)
+                if element is not None:
+                    outcome = {"failure": "failed", "error": "error", "skipped": "skipped"}[tag]
+                    message = (element.get("message") or element.text or "")[:1000]
+                    break
+            results.append(TestResult(name=name, outcome=outcome, message=message))
+        return results
+
+    @staticmethod
+    def _parse_unittest(output: str) -> list[TestResult]:
+        outcomes = {"ok": "passed", "FAIL": "failed", "ERROR": "error", "expected failure": "passed", "unexpected success": "failed"}
+        testName = lambda name, path: path if path.endswith(f".{name}") else f"{path}.{name}"
+        messages = {testName(name, path): traceback.strip()[-1000:] for name, path, traceback in UNITTEST_FAILURE.findall(output)}
+        return [TestResult(name=testName(name, path), outcome=outcomes.get(status, "skipped"), message=messages.get(testName(name, path), ""))
+                for name, path, status in UNITTEST_RESULT.findall(output)]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
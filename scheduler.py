@@ -0,0 +1,303 @@
+import asyncio, heapq, itertools, threading, time
+from collections import defaultdict
+from typing import Any, Callable, NamedTuple, Optional
+from langchain_core.messages import BaseMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
+from context import message_tokens
+from costs import response_usage
+from extraction import estimate_tokens
+
+# Requests are admitted in priority order first, so interactive work never queues behind batch work
+INTERACTIVE = 0
+BACKGROUND = 1
+BATCH = 2
+PRIORITIES = {"interactive": INTERACTIVE, "background": BACKGROUND, "batch": BATCH}
+
+# The documenter and reviewer are off the path the user is waiting on
+DEFAULT_NODE_PRIORITY = {"documenter": BACKGROUND, "validator": BACKGROUND}
+
+class ModelLimits(NamedTuple):
+    """Requests and input tokens per minute allowed for a model.  None means unlimited."""
+    rpm: Optional[int]
+    tpm: Optional[int]
+
+# Matched against model names by prefix
+DEFAULT_LIMITS = {
+    "claude-3-5-haiku": ModelLimits(rpm=50, tpm=50000),
+    "claude-3-5-sonnet": ModelLimits(rpm=50, tpm=40000),
+}
+
+def parse_limits(rpm: Optional[list[str]] = None, tpm: Optional[list[str]] = None,
+                 defaults: dict[str, ModelLimits] = DEFAULT_LIMITS) -> dict[str, ModelLimits]:
+    """
+    Override the default limits from "model=value" settings, where a bare value applies to every model
+    and 0 means unlimited, e.g. rpm=["4000"], tpm=["claude-3-5-haiku=400000", "claude-3-5-sonnet=200000"].
+    """
+    limits = dict(defaults)
+    for field, settings in (("rpm", rpm), ("tpm", tpm)):
+        for setting in settings or []:
+            prefix, _, value = setting.rpartition("=")
+            perMinute = int(value) or None
+            for model in ([prefix] if prefix else list(limits)):
+                limits[model] = limits.get(model, ModelLimits(None, None))._replace(**{field: perMinute})
+    return limits
+
+class TokenBucket:
+    """A bucket refilled continuously at per_minute / 60 per second, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: Optional[int], clock: Callable[[], float]):
+        self.capacity = per_minute
+        self.rate = per_minute / 60 if per_minute else None
+        self.tokens = float(per_minute or 0)
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken.  Requests larger than the bucket wait for a full bucket."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Return (or, when negative, charge) tokens after the actual usage of a request is known."""
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self, now: float):
+        if self.rate:
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+
+class Ticket(NamedTuple):
+    model: str
+    tokens: int
+    priority: int
+    thread_id: str
+    wait: float
+
+class _Request:
+    __slots__ = ("key", "start", "tokens", "thread_id", "priority", "enqueued")
+
+    def __init__(self, key: tuple, start: float, tokens: int, thread_id: str, priority: int, enqueued: float):
+        self.key, self.start, self.tokens, self.thread_id, self.priority, self.enqueued = key, start, tokens, thread_id, priority, enqueued
+
+    def __lt__(self, other: "_Request") -> bool:
+        return self.key < other.key
+
+class _Lane:
+    """The buckets, queue and fair queuing clock of one model."""
+
+    def __init__(self, limits: ModelLimits, clock: Callable[[], float]):
+        self.requests = TokenBucket(limits.rpm, clock)
+        self.tokens = TokenBucket(limits.tpm, clock)
+        self.queue: list[_Request] = []
+        self.virtual_time = 0.0
+        self.finish_tags: dict[str, float] = {}
+        self.blocked_until = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now), self.blocked_until - now)
+
+class ModelScheduler:
+    """
+    Process-wide admission control for LLM calls.
+
+    Every model has token buckets for requests per minute and input tokens per minute.  Calls that
+    cannot be admitted yet wait in a per-model queue ordered by priority and then by weighted fair
+    queuing across threads: each thread's requests are tagged with a virtual finish time that grows
+    with the tokens it has already been given, so one busy session cannot starve the others.  A 429
+    from the API blocks the model for its retry-after period instead of letting every caller retry.
+    """
+
+    def __init__(self, limits: Optional[dict[str, ModelLimits]] = None, default_limits: ModelLimits = ModelLimits(None, None),
+                 node_priority: Optional[dict[str, int]] = None, thread_weights: Optional[dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic, poll_interval: float = 0.5):
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        self.default_limits = default_limits
+        self.node_priority = DEFAULT_NODE_PRIORITY if node_priority is None else node_priority
+        self.thread_weights = thread_weights or {}
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self._lanes: dict[str, _Lane] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._metrics = defaultdict(lambda: {"admitted": 0, "waited": 0, "rate_limited": 0, "queue_depth": 0, "max_queue_depth": 0,
+                                             "total_wait": 0.0, "max_wait": 0.0})
+        self._priority_waits = defaultdict(lambda: {"admitted": 0, "total_wait": 0.0, "max_wait": 0.0})
+
+    def model_limits(self, model: str) -> ModelLimits:
+        matches = [prefix for prefix in self.limits if model.startswith(prefix)]
+        return self.limits[max(matches, key=len)] if matches else self.default_limits
+
+    def _lane(self, model: str) -> _Lane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _Lane(self.model_limits(model), self.clock)
+        return lane
+
+    def priority(self, node: Optional[str] = None, priority: Any = None) -> int:
+        if priority is not None:
+            return PRIORITIES.get(priority, priority) if isinstance(priority, str) else int(priority)
+        return self.node_priority.get(node, INTERACTIVE)
+
+    def acquire(self, model: str, tokens: int, thread_id: Optional[str] = None, node: Optional[str] = None,
+                priority: Any = None) -> Ticket:
+        """Block until a call of about `tokens` input tokens to `model` may be sent."""
+        thread_id = thread_id or "default"
+        priority = self.priority(node, priority)
+        with self._condition:
+            lane = self._lane(model)
+            metrics = self._metrics[model]
+            start = max(lane.virtual_time, lane.finish_tags.get(thread_id, 0.0))
+            finish = start + max(tokens, 1) / self.thread_weights.get(thread_id, 1.0)
+            lane.finish_tags[thread_id] = finish
+            enqueued = self.clock()
+            request = _Request((priority, finish, next(self._sequence)), start, tokens, thread_id, priority, enqueued)
+            heapq.heappush(lane.queue, request)
+            metrics["queue_depth"] = len(lane.queue)
+            metrics["max_queue_depth"] = max(metrics["max_queue_depth"], len(lane.queue))
+
+            blocked = False
+            while True:
+                now = self.clock()
+                wait = lane.wait_time(tokens, now) if lane.queue[0] is request else None
+                if wait is not None and wait <= 0:
+                    break
+                blocked = True
+                self._condition.wait(self.poll_interval if wait is None else min(wait, self.poll_interval))
+
+            heapq.heappop(lane.queue)
+            lane.requests.take(1, now)
+            lane.tokens.take(tokens, now)
+            lane.virtual_time = max(lane.virtual_time, request.start)
+            if len(lane.finish_tags) > 1000:
+                lane.finish_tags = {thread: tag for thread, tag in lane.finish_tags.items() if tag > lane.virtual_time}
+            waited = now - enqueued
+            metrics["admitted"] += 1
+            metrics["waited"] += blocked
+            metrics["queue_depth"] = len(lane.queue)
+            metrics["total_wait"] += waited
+            metrics["max_wait"] = max(metrics["max_wait"], waited)
+            priorityMetrics = self._priority_waits[priority]
+            priorityMetrics["admitted"] += 1
+            priorityMetrics["total_wait"] += waited
+            priorityMetrics["max_wait"] = max(priorityMetrics["max_wait"], waited)
+            self._condition.notify_all()
+        return Ticket(model, tokens, priority, thread_id, waited)
+
+    def release(self, ticket: Ticket, input_tokens: Optional[int] = None):
+        """Correct the token bucket with the input tokens the call actually used."""
+        if input_tokens is None:
+            return
+        with self._condition:
+            self._lane(ticket.model).tokens.adjust(ticket.tokens - input_tokens)
+            self._condition.notify_all()
+
+    def rate_limited(self, model: str, retry_after: Optional[float] = None):
+        """Record a 429 from the API: empty the model's buckets and hold every caller for retry_after seconds."""
+        with self._condition:
+            lane = self._lane(model)
+            now = self.clock()
+            lane.requests.drain(now)
+            lane.tokens.drain(now)
+            lane.blocked_until = max(lane.blocked_until, now + (retry_after or 0))
+            self._metrics[model]["rate_limited"] += 1
+
+    def metrics(self) -> dict:
+        """Admissions, queue depth and wait times per model and per priority."""
+        with self._condition:
+            models = {model: {**metrics, "avg_wait": round(metrics["total_wait"] / metrics["admitted"], 4) if metrics["admitted"] else 0.0}
+                      for model, metrics in self._metrics.items()}
+            priorities = {name: dict(self._priority_waits[level]) for name, level in PRIORITIES.items() if level in self._priority_waits}
+            return {"models": models, "priorities": priorities}
+
+def estimate_input_tokens(value: Any) -> int:
+    """Estimate the prompt tokens of a model input: a prompt value, a list of messages or a string."""
+    if isinstance(value, PromptValue):
+        value = value.to_messages()
+    if isinstance(value, BaseMessage):
+        return message_tokens(value)
+    if isinstance(value, (list, tuple)):
+        return sum(message_tokens(item) if isinstance(item, BaseMessage) else estimate_tokens(str(item)) for item in value)
+    return estimate_tokens(str(value))
+
+def retry_after(error: Exception) -> Optional[float]:
+    """The retry-after of a 429 error from the Anthropic client, or None if the error is not a rate limit."""
+    response = getattr(error, "response", None)
+    if getattr(error, "status_code", None) != 429 and getattr(response, "status_code", None) != 429:
+        return None
+    try:
+        return float(response.headers.get("retry-after", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+class ScheduledModel(Runnable):
+    """
+    Wrap a chat model (or a model with tools or structured output) so every call is admitted by a ModelScheduler.
+
+    The thread id, graph node and an optional "priority" are read from the run config, so batch runs
+    can be given a lower priority with config={"configurable": {"thread_id": ..., "priority": "batch"}}.
+    """
+
+    def __init__(self, bound: Runnable, scheduler: ModelScheduler, model: str):
+        self.bound = bound
+        self.scheduler = scheduler
+        self.model = model
+
+    @property
+    def InputType(self):
+        return self.bound.InputType
+
+    @property
+    def OutputType(self):
+        return self.bound.OutputType
+
+    def _acquire(self, input: Any, config: RunnableConfig) -> Ticket:
+        configurable, metadata = config.get("configurable", {}), config.get("metadata", {})
+        return self.scheduler.acquire(self.model, estimate_input_tokens(input), configurable.get("thread_id") or metadata.get("thread_id"),
+                                      metadata.get("langgraph_node"), configurable.get("priority", metadata.get("priority")))
+
+    def _release(self, ticket: Ticket, output: Any):
+        message = output.get("raw") if isinstance(output, dict) else output
+        usage = response_usage(message) if hasattr(message, "usage_metadata") else None
+        self.scheduler.release(ticket, usage[1] if usage else None)
+
+    def _rate_limited(self, error: Exception):
+        wait = retry_after(error)
+        if wait is not None:
+            self.scheduler.rate_limited(self.model, wait)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        config = ensure_config(config)
+        ticket = self._acquire(input, config)
+        try:
+            output = self.bound.invoke(input, config, **kwargs)
+        except Exception as error:
+            self._rate_limited(error)
+            raise
+        self._release(ticket, output)
+        return output
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        config = ensure_config(config)
+        ticket = await asyncio.to_thread(self._acquire, input, config)
+        try:
+            output = await self.bound.ainvoke(input, config, **kwargs)
+        except Exception as error:
+            self._rate_limited(error)
+            raise
+        self._release(ticket, output)
+        return output
@@ -1,27 +1,61 @@
-import logging
-from fastapi import FastAPI 
+import logging, os
+from fastapi import FastAPI, HTTPException
 from copilotkit.integrations.fastapi import add_fastapi_endpoint
 from copilotkit import CopilotKitSDK, Action as CopilotAction, LangGraphAgent
 
 from agent import CodeSolutionAgent
 from state import State
-from app import configure_environment, create_llms, build_graph, stream_graph_updates
+from app import configure_environment, create_llms, build_graph, stream_graph_updates, HAIKU_MODEL, SONNET_MODEL
 
 from langgraph.graph import StateGraph
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.checkpoint.memory import MemorySaver
 from utils import URLRetrievalTool, configure_logging
+from cache import SearchCache
+from checkpointer import SQLiteCheckpointer
+from sessions import SessionSaver
+from costs import CostLedger, CostCallbackHandler
+from scheduler import ModelScheduler, parse_limits
+from routing import ModelRouter
+from content_index import ContentIndexes
+from summarizer import HierarchicalSummarizer
  
 configure_environment()
 logger = configure_logging()
-memory_checkpointer = MemorySaver()
+# Set CHECKPOINT_DB to keep checkpoints on disk, and KEEP_CHECKPOINTS to bound the history kept per thread.
+# Otherwise sessions are kept in memory, bounded by SESSION_MAX_THREADS, SESSION_IDLE_TTL (seconds) and
+# SESSION_MAX_MB, and evicted sessions are spilled to SESSION_SPILL_DB when it is set.
+if os.environ.get("CHECKPOINT_DB"):
+    checkpointer = SQLiteCheckpointer(os.environ["CHECKPOINT_DB"],
+                                      keep_last=int(os.environ["KEEP_CHECKPOINTS"]) if os.environ.get("KEEP_CHECKPOINTS") else None)
+else:
+    checkpointer = SessionSaver(max_threads=int(os.environ.get("SESSION_MAX_THREADS", 200)),
+                                idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", 3600)),
+                                max_bytes=int(float(os.environ.get("SESSION_MAX_MB", 256)) * 1024 * 1024),
+                                spill=SQLiteCheckpointer(os.environ["SESSION_SPILL_DB"], keep_last=1, compact_every=1) if os.environ.get("SESSION_SPILL_DB") else None)
 graph_builder = StateGraph(State)
-url_tool = URLRetrievalTool()
+# The pages retrieved during each session are kept in CONTENT_INDEX_DIR, so the coder can quote them after a restart,
+# for CONTENT_INDEX_MAX_AGE seconds and at most CONTENT_INDEX_MAX_FILES sessions
+content_index = ContentIndexes(directory=os.environ.get("CONTENT_INDEX_DIR", ".cache/content_index"),
+                               max_files=int(os.environ.get("CONTENT_INDEX_MAX_FILES", 1000)),
+                               max_age=float(os.environ.get("CONTENT_INDEX_MAX_AGE", 7 * 24 * 3600)))
+url_tool = URLRetrievalTool(content_index=content_index)
 search_tool = TavilySearchResults(max_results=2)
 tools = [url_tool, search_tool]
-planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm = create_llms(search_tool, url_tool)
-agent = CodeSolutionAgent(planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm, search_tool, logger)
-graph = build_graph(graph_builder, agent, tools , memory_checkpointer)
+ledger = CostLedger()
+# One scheduler for the whole process keeps every session within the API rate limits.  Set LLM_RPM and LLM_TPM to
+# the account's limits, as a number for every model or comma-separated model=number settings, e.g. claude-3-5-haiku=4000
+scheduler = ModelScheduler(parse_limits(os.environ.get("LLM_RPM", "").split(",") if os.environ.get("LLM_RPM") else None,
+                                        os.environ.get("LLM_TPM", "").split(",") if os.environ.get("LLM_TPM") else None))
+# Set ROUTE_MODELS to pick the model per call, within RUN_BUDGET (USD per thread) and LATENCY_SLO (seconds per call)
+router = ModelRouter([HAIKU_MODEL, SONNET_MODEL], latency_slo=float(os.environ["LATENCY_SLO"]) if os.environ.get("LATENCY_SLO") else None,
+                     run_budget=float(os.environ["RUN_BUDGET"]) if os.environ.get("RUN_BUDGET") else None,
+                     logger=logger) if os.environ.get("ROUTE_MODELS") else None
+planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm = create_llms(search_tool, url_tool,
+                                                                                                   callbacks=[CostCallbackHandler(ledger)],
+                                                                                                   scheduler=scheduler, router=router)
+agent = CodeSolutionAgent(planner_llm, researcher_llm, summarizer_llm, coder_llm, documenter_llm, reviewer_llm, SearchCache(search_tool), logger, tools=tools,
+                          content_index=content_index, summarizer=HierarchicalSummarizer(summarizer_llm, logger=logger))
+graph = build_graph(graph_builder, agent, tools , checkpointer)
 
 app = FastAPI()
  
@@ -56,6 +90,41 @@ sdk = CopilotKitSDK(actions=[action], agents=[agent])
  
 # Add the CopilotKit endpoint to your FastAPI app
 add_fastapi_endpoint(app, sdk, "/copilotkit_remote/")
+
+@app.get("/costs")
+def get_costs():
+    """LLM cost, token and latency totals per model, node and thread, with the most recent calls."""
+    return ledger.summary()
+
+@app.get("/scheduler")
+def get_scheduler_metrics():
+    """Queue depth and wait times of the LLM scheduler, per model and per priority."""
+    return scheduler.metrics()
+
+@app.get("/sessions")
+def get_session_stats():
+    """Resident sessions and checkpoint memory, with eviction counts."""
+    return checkpointer.stats() if isinstance(checkpointer, SessionSaver) else {}
+
+@app.get("/routing")
+def get_routing_stats():
+    """Model routing decisions, escalations and savings per node."""
+    return router.stats() if router is not None else {}
+
+@app.get("/content_index/{thread_id}")
+def get_content_index(thread_id: str, query: str = None, k: int = 4):
+    """Pages and chunks retrieved during a session, or the chunks that best match the query."""
+    index = content_index.get(thread_id)
+    if query:
+        return [chunk._asdict() for chunk in index.search(query, k)]
+    return index.stats()
+
+@app.get("/costs/{thread_id}")
+def get_thread_costs(thread_id: str):
+    totals = ledger.thread(thread_id)
+    if totals is None:
+        raise HTTPException(status_code=404, detail=f"No LLM calls recorded for thread {thread_id}")
+    return totals
  
 def main():
     """Run the uvicorn server."""
@@ -0,0 +1,180 @@
+import threading, time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+from checkpointer import SQLiteCheckpointer
+
+class SessionSaver(MemorySaver):
+    """
+    An in-memory checkpointer whose resident memory stays bounded under many sessions.
+
+    Every thread is a session in an LRU table.  Only the last keep_last checkpoints of a thread are
+    kept in memory, and threads idle for longer than idle_ttl seconds, or the least recently used
+    threads once there are more than max_threads or their checkpoints take more than max_bytes, are
+    evicted.  With a spill checkpointer, an evicted thread's latest checkpoint is written to disk and
+    loaded back the next time the thread is used, so the session can continue; without one, it is
+    dropped.
+    """
+
+    def __init__(self, max_threads: int = 200, idle_ttl: Optional[float] = 3600, max_bytes: Optional[int] = 256 * 1024 * 1024,
+                 keep_last: int = 5, spill: Optional[SQLiteCheckpointer] = None, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.keep_last = keep_last
+        self.spill = spill
+        self.clock = clock
+        self.evictions = 0
+        self.spills = 0
+        self.restores = 0
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+        self._blob_keys: dict[str, set] = defaultdict(set)
+        self._write_keys: dict[str, set] = defaultdict(set)
+        self._lock = threading.RLock()
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(session["bytes"] for session in self._sessions.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"threads": len(self._sessions), "resident_bytes": self.resident_bytes, "evictions": self.evictions,
+                    "spills": self.spills, "restores": self.restores}
+
+    def _touch(self, thread_id: str):
+        session = self._sessions.get(thread_id)
+        if session is None:
+            session = self._sessions[thread_id] = {"last_used": self.clock(), "bytes": 0}
+        session["last_used"] = self.clock()
+        self._sessions.move_to_end(thread_id)
+
+    def _measure(self, thread_id: str):
+        size = sum(len(checkpoint[1]) + len(metadata[1]) for namespace in self.storage.get(thread_id, {}).values()
+                   for checkpoint, metadata, _ in namespace.values())
+        size += sum(len(self.blobs[key][1]) for key in self._blob_keys[thread_id] if key in self.blobs)
+        size += sum(len(write[2][1]) for key in self._write_keys[thread_id] for write in self.writes.get(key, {}).values())
+        self._sessions[thread_id]["bytes"] = size
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """Drop all but the last keep_last checkpoints of a thread, with the writes and blobs only they used."""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+        kept = sorted(checkpoints)[-self.keep_last:]
+        for checkpoint_id in sorted(checkpoints)[:-self.keep_last]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._write_keys[thread_id].discard((thread_id, checkpoint_ns, checkpoint_id))
+        # The channel versions still referenced by a kept checkpoint of any namespace
+        used = {(namespace, channel, version) for namespace, saved in self.storage[thread_id].items() for checkpoint_id in saved
+                if namespace != checkpoint_ns or checkpoint_id in kept
+                for channel, version in self.serde.loads_typed(saved[checkpoint_id][0])["channel_versions"].items()}
+        for key in [key for key in self._blob_keys[thread_id] if key[1] == checkpoint_ns and key[1:] not in used]:
+            self.blobs.pop(key, None)
+            self._blob_keys[thread_id].discard(key)
+
+    def _evict(self, current: Optional[str] = None):
+        """Evict idle threads, then the least recently used ones until the table is within its bounds."""
+        now = self.clock()
+        for thread_id, session in list(self._sessions.items()):
+            if thread_id != current and self.idle_ttl is not None and now - session["last_used"] > self.idle_ttl:
+                self._evict_thread(thread_id)
+        for thread_id in list(self._sessions):
+            if len(self._sessions) <= self.max_threads and (self.max_bytes is None or self.resident_bytes <= self.max_bytes):
+                break
+            if thread_id != current:
+                self._evict_thread(thread_id)
+
+    def _evict_thread(self, thread_id: str):
+        if self.spill is not None:
+            for checkpoint_ns in list(self.storage.get(thread_id, {})):
+                latest = super().get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}})
+                if latest is not None:
+                    self._copy(latest, self.spill)
+            self.spills += 1
+        self._drop(thread_id)
+        self.evictions += 1
+
+    @staticmethod
+    def _copy(saved: CheckpointTuple, target):
+        """Write a checkpoint and its pending writes to another checkpointer."""
+        configurable = saved.config["configurable"]
+        parent = saved.parent_config or {"configurable": {"thread_id": configurable["thread_id"],
+                                                          "checkpoint_ns": configurable.get("checkpoint_ns", "")}}
+        config = target.put(parent, saved.checkpoint, saved.metadata, saved.checkpoint["channel_versions"])
+        writesByTask = defaultdict(list)
+        for task_id, channel, value in saved.pending_writes or []:
+            writesByTask[task_id].append((channel, value))
+        for task_id, writes in writesByTask.items():
+            target.put_writes(config, writes, task_id)
+
+    def _drop(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        self._sessions.pop(thread_id, None)
+
+    def _restore(self, thread_id: str):
+        """Load a thread that is not resident back from the spill checkpointer."""
+        if thread_id in self._sessions or self.spill is None:
+            return
+        saved = self.spill.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+        if saved is None:
+            return
+        self._touch(thread_id)
+        self._copy(saved, self)
+        self.restores += 1
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._restore(thread_id)
+            if thread_id not in self._sessions:
+                return self.spill.get_tuple(config) if self.spill is not None else None
+            self._touch(thread_id)
+            saved = super().get_tuple(config)
+        if saved is None and self.spill is not None:
+            return self.spill.get_tuple(config)
+        return saved
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        if config is not None and self.spill is not None and config["configurable"]["thread_id"] not in self._sessions:
+            yield from self.spill.list(config, filter=filter, before=before, limit=limit)
+            return
+        with self._lock:
+            saved = list(super().list(config, filter=filter, before=before, limit=limit))
+        yield from saved
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            self._touch(thread_id)
+            result = super().put(config, checkpoint, metadata, new_versions)
+            self._blob_keys[thread_id].update((thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items())
+            self._prune(thread_id, checkpoint_ns)
+            self._measure(thread_id)
+            self._evict(current=thread_id)
+        return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._touch(thread_id)
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys[thread_id].add((thread_id, config["configurable"].get("checkpoint_ns", ""),
+                                             config["configurable"]["checkpoint_id"]))
+            self._measure(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+        if self.spill is not None:
+            self.spill.delete_thread(thread_id)
@@ -24,10 +24,19 @@ class CodeReview(BaseModel):
     reviewed_code: str = Field(description="Reviewed code annotated with reviewer comments")
 
 # TypedDict classes are used to track state because CoAgent does not support Pydantic models
+class TestResult(TypedDict):
+    name: str
+    outcome: str  # passed, failed, error or skipped
+    message: str
+
 class Validation(TypedDict):
     compile_errors: list[str] = []
     feedback: str
     reviewed_code: str
+    test_results: list[TestResult]
+    tests_passed: int
+    tests_failed: int
+    test_output: str
 
 class ResearchStep(TypedDict):
     """Define a step in the research process."""
@@ -44,6 +53,28 @@ class ResearchState(TypedDict):
     final_research: str
     is_complete: bool
 
+def merge_research_state(left: ResearchState, right: ResearchState) -> ResearchState:
+    """
+    Merge a research update into the current research state.
+
+    An update that carries a problem_statement starts a new research run and replaces the state.
+    Any other update is partial: research_results are appended, research_plan steps are replaced
+    by id and the remaining keys overwrite the current values.  This lets parallel research
+    branches each report only their own step and result.
+    """
+    if not left or "problem_statement" in right:
+        return right
+    merged = ResearchState(**left)
+    for key, value in right.items():
+        if key == "research_results":
+            merged[key] = left.get(key, []) + value
+        elif key == "research_plan":
+            updatedSteps = {step["id"]: step for step in value}
+            merged[key] = [updatedSteps.get(step["id"], step) for step in left.get(key, [])]
+        else:
+            merged[key] = value
+    return merged
+
 class ResearchStateManager():
     def __init__(self, state: ResearchState):
         self._state = state
@@ -62,6 +93,7 @@ class CodingStep(TypedDict):
     description: str
     file_name: str
     status: str
+    depends_on: list[int]
 
 class Module(TypedDict):
     prefix: str
@@ -77,6 +109,31 @@ class CodingState(TypedDict):
     modules: list[Module]
     is_complete: bool
 
+def merge_coding_state(left: CodingState, right: CodingState) -> CodingState:
+    """
+    Merge a coding update into the current coding state.
+
+    An update that carries every CodingState field is a new code plan and replaces the state.  Any other
+    update is partial: modules replace the module with the same file name and are kept in plan order,
+    code_plan steps are replaced by id and the remaining keys overwrite the current values.  This lets
+    modules generated in parallel each report only their own step and module.
+    """
+    if not left or set(CodingState.__annotations__) <= set(right):
+        return right
+    merged = CodingState(**left)
+    for key, value in right.items():
+        if key == "code_plan":
+            updatedSteps = {step["id"]: step for step in value}
+            merged[key] = [updatedSteps.get(step["id"], step) for step in left.get(key, [])]
+            merged["is_complete"] = all(step["status"] == "done" for step in merged[key])
+        elif key != "modules":
+            merged[key] = value
+    if "modules" in right:
+        modules = {module.get("file_name"): module for module in left.get("modules", []) + right["modules"]}
+        planOrder = {step["file_name"]: position for position, step in enumerate(merged["code_plan"])}
+        merged["modules"] = sorted(modules.values(), key=lambda module: planOrder.get(module.get("file_name"), len(planOrder)))
+    return merged
+
 class CodingStateManager():
     def __init__(self, state: CodingState):
         self._state = state
@@ -87,6 +144,35 @@ class CodingStateManager():
     def getCurrentStep(self) -> CodingStep:
         return self.getStep(self._state["current_step"])
 
+    def getStepById(self, step_id: int) -> CodingStep:
+        return next(step for step in self._state["code_plan"] if step["id"] == step_id)
+
+    def getDependencies(self, step: CodingStep) -> list[CodingStep]:
+        """Return every step the given step depends on, directly or transitively, in plan order."""
+        stepIds = {planStep["id"] for planStep in self._state["code_plan"]}
+        pending = [dependency for dependency in step.get("depends_on", []) if dependency in stepIds]
+        found = set()
+        while pending:
+            dependency = pending.pop()
+            if dependency not in found and dependency != step["id"]:
+                found.add(dependency)
+                pending.extend(d for d in self.getStepById(dependency).get("depends_on", []) if d in stepIds)
+        return [planStep for planStep in self._state["code_plan"] if planStep["id"] in found]
+
+    def getReadySteps(self) -> list[CodingStep]:
+        """
+        Return the steps that are not done and whose dependencies are all done.
+
+        Dependencies on unknown step ids are ignored.  If pending steps remain but none is ready, the plan
+        has a dependency cycle and the first pending step is returned to break it.
+        """
+        stepIds = {step["id"] for step in self._state["code_plan"]}
+        done = {step["id"] for step in self._state["code_plan"] if step["status"] == "done"}
+        pending = [step for step in self._state["code_plan"] if step["status"] != "done"]
+        ready = [step for step in pending
+                 if all(dependency in done or dependency not in stepIds for dependency in step.get("depends_on", []))]
+        return ready or pending[:1]
+
 class DocumentationState(TypedDict):
     prefix: str
     markdown: str
@@ -96,22 +182,56 @@ def merge_agent_status(left: Dict[str, str], right: Dict[str,str]) -> Dict[str,
         left[key] = value
     return left
 
+def merge_validation(left: Validation, right: Validation) -> Validation:
+    """The code review and the test run report into validation separately, so their updates are merged."""
+    return {**(left or {}), **(right or {})}
+
 class LLMCost(TypedDict):
     model: str
     input_tokens: int
     output_tokens: int
-
-def merge_llm_costs(left: list[LLMCost], right: list[LLMCost]) -> list[LLMCost]:
-    return left + right
+    calls: int
+    cost: float
+    cache_read_tokens: int
+    cache_write_tokens: int
+
+def llm_cost_totals(costs) -> Dict[str, LLMCost]:
+    """
+    llmCosts as totals per model.  States saved before the totals were kept per model hold a list with
+    one entry per call, without a price, so those calls are summed and priced here.
+    """
+    if not isinstance(costs, list):
+        return dict(costs or {})
+    from costs import call_cost
+    totals = {}
+    for usage in costs:
+        model = usage["model"]
+        call = LLMCost(model=model, input_tokens=usage["input_tokens"], output_tokens=usage["output_tokens"], calls=1,
+                       cache_read_tokens=0, cache_write_tokens=0, cost=call_cost(model, usage["input_tokens"], usage["output_tokens"]))
+        totals = merge_llm_costs(totals, {model: call})
+    return totals
+
+def merge_llm_costs(left: Dict[str, LLMCost], right: Dict[str, LLMCost]) -> Dict[str, LLMCost]:
+    """Add the usage in right to the running totals per model, so the state stays one entry per model."""
+    merged = llm_cost_totals(left)
+    for model, usage in llm_cost_totals(right).items():
+        total = merged.get(model)
+        merged[model] = usage if total is None else LLMCost(model=model, input_tokens=total["input_tokens"] + usage["input_tokens"],
+                                                           output_tokens=total["output_tokens"] + usage["output_tokens"],
+                                                           calls=total.get("calls", 0) + usage.get("calls", 0),
+                                                           cache_read_tokens=total.get("cache_read_tokens", 0) + usage.get("cache_read_tokens", 0),
+                                                           cache_write_tokens=total.get("cache_write_tokens", 0) + usage.get("cache_write_tokens", 0),
+                                                           cost=total.get("cost", 0.0) + usage.get("cost", 0.0))
+    return merged
     
 class State(MessagesState):
-    research: ResearchState
-    generated_code: CodingState
+    research: Annotated[ResearchState, merge_research_state]
+    generated_code: Annotated[CodingState, merge_coding_state]
     generated_tests: Module
     documentation: DocumentationState
-    validation: Validation
+    validation: Annotated[Validation, merge_validation]
     agentStatus: Annotated[Dict[str, str], merge_agent_status]
-    llmCosts: Annotated[list[LLMCost], merge_llm_costs]
+    llmCosts: Annotated[Dict[str, LLMCost], merge_llm_costs]
 
 class StateWrapper:
     def __init__(self, state: MessagesState):
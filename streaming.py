@@ -0,0 +1,89 @@
+import sys, threading
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_config
+
+# CopilotKit is only needed by the server, and moved its LangGraph helpers between releases
+try:
+    from copilotkit.langgraph import copilotkit_customize_config
+except ImportError:
+    try:
+        from copilotkit.langchain import copilotkit_customize_config
+    except ImportError:
+        copilotkit_customize_config = None
+
+def streaming_config(state_key: str, tool: str) -> Optional[RunnableConfig]:
+    """
+    Config for a structured output call made inside a graph node that streams its partial output to the UI.
+
+    CopilotKit forwards the arguments of the `tool` call to the co-agent state under `state_key` as they
+    are generated, so e.g. a CodeSolution can be rendered while the coder is still writing it.  Outside
+    a graph run, or without CopilotKit, the node's own config is returned unchanged.
+    """
+    try:
+        config = get_config()
+    except RuntimeError:
+        return None
+    if copilotkit_customize_config is None:
+        return config
+    return copilotkit_customize_config(config, emit_tool_calls=False,
+                                       emit_intermediate_state=[{"state_key": state_key, "tool": tool}])
+
+class BranchCancelled(Exception):
+    """Raised inside an LLM call of a branch that was abandoned, to stop the call."""
+
+class StopWhenCancelled(BaseCallbackHandler):
+    """
+    Stop the LLM calls of a branch once its cancelled event is set.
+
+    A call that has not started is not made, and a call that is streaming stops at its next token, so an
+    abandoned branch stops spending tokens and streaming output to the UI.
+    """
+
+    raise_error = True
+
+    def __init__(self, cancelled: threading.Event):
+        self.cancelled = cancelled
+
+    def _check(self, *args: Any, **kwargs: Any):
+        if self.cancelled.is_set():
+            raise BranchCancelled("The branch was cancelled")
+
+    on_chat_model_start = on_llm_start = on_llm_new_token = _check
+
+def with_cancellation(config: Optional[RunnableConfig], cancelled: threading.Event) -> RunnableConfig:
+    """A copy of config whose LLM calls stop once cancelled is set."""
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(StopWhenCancelled(cancelled))
+    else:
+        callbacks = list(callbacks or []) + [StopWhenCancelled(cancelled)]
+    config["callbacks"] = callbacks
+    return config
+
+class TokenPrinter:
+    """Print the token deltas of a graph run streamed with stream_mode "messages", one header per node."""
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.node = None
+
+    def __call__(self, chunk, metadata: dict):
+        if not isinstance(chunk, AIMessage):
+            return
+        text = chunk.content if isinstance(chunk.content, str) else "".join(
+            block.get("text", "") or block.get("partial_json", "") for block in chunk.content if isinstance(block, dict))
+        if not text:
+            text = "".join(call.get("args") or "" for call in getattr(chunk, "tool_call_chunks", []))
+        if not text:
+            return
+        node = metadata.get("langgraph_node")
+        if node != self.node:
+            self.node = node
+            self.out.write(f"\n[{node}] ")
+        self.out.write(text)
+        self.out.flush()
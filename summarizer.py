@@ -0,0 +1,133 @@
+import hashlib, json
+from typing import Any, Optional, Sequence
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from cache import SQLiteCache
+from costs import llm_cost
+from extraction import estimate_tokens, truncate_to_tokens
+from state import LLMCost, merge_llm_costs
+
+MAP_PROMPT = """
+    You are part of a team of researchers tasked with gathering information that will be used to generate a code solution
+    for this problem: {problem}
+
+    Condense the research result below into notes of at most about {words} words.  Keep the key findings, recommendations,
+    the code examples that matter most for the problem, and every source URL cited.  Output Markdown only.
+
+    The research result is:
+
+    {text}
+"""
+
+MERGE_PROMPT = """
+    You are part of a team of researchers tasked with gathering information that will be used to generate a code solution
+    for this problem: {problem}
+
+    Merge the research notes below into one set of notes of at most about {words} words.  Combine findings that overlap,
+    keep the recommendations and the most relevant code examples, and keep every source URL cited.  Output Markdown only.
+
+    The research notes are:
+
+    {text}
+"""
+
+def response_text(response: AIMessage) -> str:
+    content = response.content
+    if isinstance(content, str):
+        return content
+    return "".join(block if isinstance(block, str) else block.get("text", "") for block in content)
+
+class HierarchicalSummarizer:
+    """
+    Condense a large set of research results in a map-reduce tree, so the final summary prompt stays bounded.
+
+    Every result longer than the first level's token budget is condensed on its own, all at once (map).  The
+    notes are then merged fan_in at a time, level by level, until at most fan_in are left for the final
+    summary (reduce).  Each level's outputs are held to that level's token budget, so no prompt grows with
+    the number of research steps and the summary takes about log_fan_in(steps) rounds of calls instead of
+    one call over everything.  Map outputs are kept in a SQLite file, keyed by the problem and the result,
+    so a resumed or repeated run only condenses the results that are new.
+    """
+
+    def __init__(self, llm, fan_in: int = 4, level_tokens: Sequence[int] = (1000, 2000), direct_tokens: int = 30000,
+                 max_concurrency: int = 8, path: Optional[str] = ".cache/summaries.sqlite", ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 5000, logger=None):
+        """
+        Args:
+            llm: The model that condenses and merges the results.
+            fan_in: Number of notes merged by one call, and the number left for the final summary.
+            level_tokens: Token budget of each output of the map level, then of each reduce level; the last
+                budget is used for all deeper levels.
+            direct_tokens: Results that add up to no more than this are summarized in one call, without the tree.
+            max_concurrency: Maximum number of condense or merge calls running at once.
+            path: SQLite file caching the map outputs, or None to not cache them.
+        """
+        self.llm = llm
+        self.fan_in = max(fan_in, 2)
+        self.level_tokens = tuple(level_tokens)
+        self.direct_tokens = direct_tokens
+        self.max_concurrency = max_concurrency
+        self.store = SQLiteCache(path, table="summaries", ttl=ttl, max_entries=max_entries) if path else None
+        self.logger = logger
+
+    def budget(self, level: int) -> int:
+        return self.level_tokens[min(level, len(self.level_tokens) - 1)]
+
+    def key(self, problem: str, text: str, budget: int) -> str:
+        return hashlib.sha256(json.dumps([MAP_PROMPT, problem, text, budget]).encode()).hexdigest()
+
+    def _run(self, template: str, problem: str, texts: list[str], budget: int) -> tuple[list[str], dict[str, LLMCost]]:
+        """Condense or merge every text concurrently, each output truncated to the budget."""
+        if not texts:
+            return [], {}
+        chain = ChatPromptTemplate.from_messages([("human", template)]) | self.llm
+        responses = chain.batch([{"problem": problem, "text": text, "words": budget * 3 // 4} for text in texts],
+                                {"max_concurrency": self.max_concurrency})
+        costs = {}
+        for response in responses:
+            costs = merge_llm_costs(costs, llm_cost(response))
+        return [truncate_to_tokens(response_text(response), budget) for response in responses], costs
+
+    def _map(self, problem: str, results: list[str]) -> tuple[list[str], dict[str, LLMCost]]:
+        budget = self.budget(0)
+        notes: list[Optional[str]] = [result if estimate_tokens(result) <= budget else None for result in results]
+        if self.store is not None:
+            for index, result in enumerate(results):
+                if notes[index] is None:
+                    notes[index] = self.store.get(self.key(problem, result, budget))
+        pending = [index for index, note in enumerate(notes) if note is None]
+        condensed, costs = self._run(MAP_PROMPT, problem, [results[index] for index in pending], budget)
+        for index, note in zip(pending, condensed):
+            notes[index] = note
+            if self.store is not None:
+                self.store.set(self.key(problem, results[index], budget), note)
+        if self.logger:
+            self.logger.info(f"Condensed {len(pending)} of {len(results)} research results "
+                             f"({len(results) - len(pending)} short enough or cached)")
+        return notes, costs
+
+    def condense(self, problem: str, results: list[str]) -> tuple[list[str], dict[str, LLMCost]]:
+        """
+        The research results reduced to at most fan_in notes for the final summary, and the llmCosts of doing so.
+        Results small enough to summarize in one call are returned unchanged.
+        """
+        if sum(estimate_tokens(result) for result in results) <= self.direct_tokens:
+            return list(results), {}
+        notes, costs = self._map(problem, results)
+        level = 1
+        while len(notes) > self.fan_in:
+            groups = [notes[start:start + self.fan_in] for start in range(0, len(notes), self.fan_in)]
+            merging = [index for index, group in enumerate(groups) if len(group) > 1]
+            merged, levelCosts = self._run(MERGE_PROMPT, problem, ["\n\n---\n\n".join(groups[index]) for index in merging],
+                                           self.budget(level))
+            costs = merge_llm_costs(costs, levelCosts)
+            notes = [group[0] for group in groups]
+            for index, note in zip(merging, merged):
+                notes[index] = note
+            if self.logger:
+                self.logger.info(f"Merged research notes at level {level} into {len(notes)}")
+            level += 1
+        return notes, costs
+
+    def stats(self) -> dict[str, Any]:
+        return self.store.stats() if self.store is not None else {}
@@ -1,11 +1,12 @@
 from agent import CodeSolutionAgent
-from state import State, ResearchState, DocumentationState, Validation, Module, CodeSolution
+from state import State, ResearchState, DocumentationState, Validation, Module, CodeSolution, merge_agent_status, merge_coding_state, merge_llm_costs, merge_research_state, merge_validation
 from langchain_anthropic import ChatAnthropic
 from pprint import pprint
 import logging
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.messages import HumanMessage
 from utils import URLRetrievalTool
+from cache import LLMResponseCache
 from dotenv import load_dotenv
 from typing import cast
 import pickle
@@ -18,21 +19,29 @@ SONNET_MODEL = "claude-3-5-sonnet-latest"
 # Define a function that will merge the agent output with the current state.  Output and state are dictionaries.
 # Output may not contain all of the keys that are in state.
 # Messages from output should be appended to messages in state.
-# Only update the keys that are in output.
+# Only update the keys that are in output.  Keys with a reducer in State are merged the way the graph merges them.
+REDUCERS = {"llmCosts": merge_llm_costs, "generated_code": merge_coding_state, "research": merge_research_state,
+            "validation": merge_validation, "agentStatus": merge_agent_status}
+
 def merge_state(state, output):
     for key, value in output.items():
-        if key in ["messages", "llmCosts"]:
+        if key == "messages":
             state[key] += value
+        elif key in REDUCERS:
+            state[key] = REDUCERS[key](state.get(key) or {}, value)
         else:
             state[key] = value
     return state
 
 
 
-planner_llm = ChatAnthropic(model=HAIKU_MODEL)
-researcher_llm = ChatAnthropic(model=HAIKU_MODEL).bind_tools([URLRetrievalTool()])
+# Replay unchanged upstream calls from the LLM cache instead of paying for them on every run
+llm_cache = LLMResponseCache(mode="record")
+
+planner_llm = ChatAnthropic(model=HAIKU_MODEL, cache=llm_cache)
+researcher_llm = ChatAnthropic(model=HAIKU_MODEL, cache=llm_cache).bind_tools([URLRetrievalTool()])
 #reviewer_llm = ChatAnthropic(model=HAIKU_MODEL, max_tokens=4096).with_structured_output(CodeReview, include_raw=True)
-tester_llm = ChatAnthropic(model=HAIKU_MODEL, max_tokens=4096).with_structured_output(CodeSolution, include_raw=True)
+tester_llm = ChatAnthropic(model=HAIKU_MODEL, max_tokens=4096, cache=llm_cache).with_structured_output(CodeSolution, include_raw=True)
 search = TavilySearchResults(max_results=2)
 agent = CodeSolutionAgent(planner_llm=planner_llm, researcher_llm=researcher_llm, summarizer_llm=None, coder_llm=tester_llm, documenter_llm=None, reviewer_llm=None, searchTool=search, logger=logging.getLogger())
 
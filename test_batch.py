@@ -0,0 +1,65 @@
+import json, logging, operator, os, tempfile, unittest
+from typing import Annotated, TypedDict
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END
+from batch import BatchRunner, read_manifest, read_prompts
+from journal import JournalReader
+
+class CoderState(TypedDict, total=False):
+    messages: Annotated[list, operator.add]
+    generated_code: dict
+
+def coder(state: CoderState) -> dict:
+    prompt = state["messages"][0][1]
+    if "fail" in prompt:
+        raise RuntimeError("The coder failed")
+    return {"generated_code": {"modules": [{"prefix": prompt, "imports": "", "code": "def solve():\n    pass", "file_name": "src/solution.py"}]}}
+
+# Keeps the progress lines and the traceback of the failing item out of the test output
+logger = logging.getLogger("test_batch")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+def build():
+    builder = StateGraph(CoderState)
+    builder.add_node("coder", coder)
+    builder.add_edge(START, "coder")
+    builder.add_edge("coder", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+class BatchRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.directory.name, "batch")
+        prompts = os.path.join(self.directory.name, "prompts.jsonl")
+        with open(prompts, "w") as file:
+            file.write('{"id": "csv parser", "prompt": "Write a CSV parser"}\n\n{"input": "Write a JSON parser"}\n{"prompt": "This one will fail"}\n')
+        self.items = read_prompts(prompts)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_prompts(self):
+        self.assertEqual("csv_parser", self.items[0]["id"])
+        self.assertEqual(["Write a CSV parser", "Write a JSON parser", "This one will fail"], [item["prompt"] for item in self.items])
+        self.assertEqual(self.items[1]["id"], read_prompts(os.path.join(self.directory.name, "prompts.jsonl"))[1]["id"])
+
+    def test_results_manifest_and_resume(self):
+        graph = build()
+        summary = BatchRunner(graph, self.output_dir, workers=2, logger=logger).run(self.items)
+        self.assertEqual({"items": 3, "ran": 3, "done": 2, "failed": 1}, summary)
+        with open(os.path.join(self.output_dir, "csv_parser", "solution.py")) as file:
+            self.assertIn("def solve()", file.read())
+        state = JournalReader(os.path.join(self.output_dir, "csv_parser", "state.journal"), {"messages": operator.add}).state_at()
+        self.assertEqual("src/solution.py", state["generated_code"]["modules"][0]["file_name"])
+        manifest = read_manifest(self.output_dir)
+        self.assertEqual("RuntimeError: The coder failed", manifest[self.items[2]["id"]]["error"])
+        self.assertEqual("batch-csv_parser", manifest["csv_parser"]["thread_id"])
+        # A rerun skips the finished items, and retries the failed one only when asked to
+        self.assertEqual(0, BatchRunner(graph, self.output_dir, logger=logger).run(self.items)["ran"])
+        self.assertEqual({"items": 3, "ran": 1, "done": 0, "failed": 1}, BatchRunner(graph, self.output_dir, logger=logger, retry_failed=True).run(self.items))
+        with open(os.path.join(self.output_dir, "summary.json")) as file:
+            self.assertEqual(1, json.load(file)["ran"])
+
+if __name__ == "__main__":
+    unittest.main()
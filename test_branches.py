@@ -0,0 +1,75 @@
+import logging, threading, time, unittest
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from agent import CodeSolutionAgent
+from costs import llm_cost
+
+class SlowStreamingModel(BaseChatModel):
+    """A chat model that streams its answer one token every delay seconds."""
+
+    tokens: int = 40
+    delay: float = 0.02
+    streaming: bool = True
+    streamed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for _ in range(self.tokens):
+            time.sleep(self.delay)
+            self.streamed += 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content="token "))
+            if run_manager:
+                run_manager.on_llm_new_token("token ", chunk=chunk)
+            yield chunk
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("token " * self.tokens))])
+
+class RunBranchTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = CodeSolutionAgent(None, None, None, None, None, None, None, logging.getLogger("test"), branch_timeout=0.2)
+
+    def test_timed_out_branch_stops_its_llm_call(self):
+        model = SlowStreamingModel(streaming=True)
+        finished = threading.Event()
+        def branch(state):
+            try:
+                return {"llmCosts": llm_cost(model.invoke("Document the code", self.agent.branch_config("streaming_documentation", "Documentation")))}
+            finally:
+                finished.set()
+        start = time.perf_counter()
+        self.assertEqual({"agentStatus": {"documentation": "timedOut"}}, self.agent.run_branch("documenter", branch, {}))
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertTrue(finished.wait(2))
+        self.assertLess(model.streamed, model.tokens)
+        self.assertEqual(1, self.agent.abandoned_branches)
+
+    def test_result_of_a_timed_out_branch_is_discarded_and_counted(self):
+        finished = threading.Event()
+        response = AIMessage("", response_metadata={"model": "claude-3-5-haiku-latest"},
+                             usage_metadata={"input_tokens": 1000, "output_tokens": 100, "total_tokens": 1100})
+        def branch(state):
+            time.sleep(0.4)
+            return {"llmCosts": llm_cost(response)}
+        with self.assertLogs("test", level="INFO") as logs:
+            self.assertEqual({"agentStatus": {"tests": "timedOut"}}, self.agent.run_branch("tester", branch, {}))
+            for _ in range(50):
+                if self.agent.abandoned_costs:
+                    break
+                time.sleep(0.02)
+        self.assertEqual(1, self.agent.abandoned_costs["claude-3-5-haiku-latest"]["calls"])
+        self.assertTrue(any("result was discarded" in line for line in logs.output))
+
+    def test_branch_within_the_timeout(self):
+        self.assertEqual({"agentStatus": {"tests": "done"}}, self.agent.run_branch("tester", lambda state: {"agentStatus": {"tests": "done"}}, {}))
+        with self.assertRaises(ValueError):
+            self.agent.run_branch("tester", lambda state: int("x"), {})
+        self.assertEqual(0, self.agent.abandoned_branches)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os, tempfile, unittest
+from cache import SearchCache, normalize_query
+
+class FakeSearch:
+    name = "tavily_search_results_json"
+    max_results = 2
+
+    def __init__(self):
+        self.queries = []
+
+    def invoke(self, query, config=None, **kwargs):
+        self.queries.append(query)
+        return "Error: rate limited" if "error" in query else [{"url": "https://example.com", "content": query}]
+
+class NormalizeQueryTest(unittest.TestCase):
+    def test_equivalent_queries_share_a_key(self):
+        self.assertEqual(normalize_query("LangGraph unit test generation"), normalize_query("langgraph unit tests generation"))
+        self.assertEqual(normalize_query("How to use LangGraph's ToolNode?"), normalize_query("use  langgraph s toolnode"))
+        self.assertEqual(normalize_query("python libraries for PDF parsing"), normalize_query("Python library for pdf parsing"))
+        self.assertEqual(normalize_query("pytest classes"), normalize_query("pytest class"))
+
+    def test_different_searches_keep_different_keys(self):
+        self.assertNotEqual(normalize_query("convert json to csv"), normalize_query("convert csv to json"))
+        self.assertNotEqual(normalize_query("retry retry backoff"), normalize_query("retry backoff"))
+        self.assertEqual("pandas status redis", normalize_query("pandas status redis"))
+
+class SearchCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "search.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_near_identical_queries_search_once(self):
+        search = FakeSearch()
+        cache = SearchCache(search, self.path)
+        first = cache.invoke("LangGraph unit test generation")
+        self.assertEqual(first, cache.invoke("langgraph unit tests generation"))
+        self.assertEqual(["LangGraph unit test generation"], search.queries)
+        cache.invoke("convert csv to json")
+        cache.invoke("convert json to csv")
+        self.assertEqual(3, len(search.queries))
+
+    def test_results_survive_a_restart_but_errors_are_not_cached(self):
+        SearchCache(FakeSearch(), self.path).invoke("langgraph checkpointer")
+        search = FakeSearch()
+        cache = SearchCache(search, self.path)
+        cache.invoke("LangGraph checkpointers")
+        self.assertEqual([], search.queries)
+        cache.invoke("search error")
+        cache.invoke("search error")
+        self.assertEqual(2, len(search.queries))
+
+    def test_ttl(self):
+        search = FakeSearch()
+        cache = SearchCache(search, self.path, ttl=-1)
+        cache.invoke("langgraph checkpointer")
+        cache.invoke("langgraph checkpointer")
+        self.assertEqual(2, len(search.queries))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio, operator, os, sqlite3, tempfile, threading, unittest
+from typing import Annotated, TypedDict
+from langgraph.graph import StateGraph, START, END
+from checkpointer import SQLiteCheckpointer
+
+class CounterState(TypedDict):
+    notes: Annotated[list[str], operator.add]
+    count: int
+
+def build(checkpointer):
+    """A two-node graph, so every invoke writes several checkpoints and both channels change."""
+    builder = StateGraph(CounterState)
+    builder.add_node("note", lambda state: {"notes": [f"note {state['count']} " + "x" * 2000]})
+    builder.add_node("count", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "note")
+    builder.add_edge("note", "count")
+    builder.add_edge("count", END)
+    return builder.compile(checkpointer=checkpointer)
+
+class SQLiteCheckpointerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoints.sqlite")
+        self.config = {"configurable": {"thread_id": "thread-1"}}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_graph(self, checkpointer, times: int):
+        graph = build(checkpointer)
+        state = {"notes": [], "count": 0}
+        for _ in range(times):
+            state = graph.invoke({"notes": [], "count": state["count"]}, self.config)
+        return graph, state
+
+    def test_round_trip(self):
+        graph, state = self.run_graph(SQLiteCheckpointer(self.path, compress_threshold=100), 3)
+        self.assertEqual(3, state["count"])
+        self.assertEqual(3, len(state["notes"]))
+        # A new saver on the same file restores the thread, including the compressed message history
+        restored = build(SQLiteCheckpointer(self.path)).get_state(self.config)
+        self.assertEqual(state, restored.values)
+        history = list(graph.get_state_history(self.config))
+        self.assertEqual(history[0].config, restored.config)
+        # Every earlier run's final state is still in the history
+        self.assertEqual([3, 2, 1], [snapshot.values["count"] for snapshot in history if snapshot.next == ()])
+        with sqlite3.connect(self.path) as connection:
+            self.assertTrue(connection.execute("SELECT COUNT(*) FROM blobs WHERE compressed = 1").fetchone()[0])
+
+    def test_compaction_keeps_the_newest_checkpoints(self):
+        graph, state = self.run_graph(SQLiteCheckpointer(self.path, keep_last=2, compact_every=1), 4)
+        history = list(graph.get_state_history(self.config))
+        self.assertEqual(2, len(history))
+        self.assertEqual(state, graph.get_state(self.config).values)
+        with sqlite3.connect(self.path) as connection:
+            checkpoints = connection.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            blobs = {channel: count for channel, count in connection.execute("SELECT channel, COUNT(*) FROM blobs GROUP BY channel")}
+        self.assertEqual(2, checkpoints)
+        # Only the blob versions the two remaining checkpoints reference are kept
+        self.assertLessEqual(blobs["notes"], 2)
+        self.assertLessEqual(blobs["count"], 2)
+
+    def test_compaction_runs_in_batches(self):
+        checkpointer = SQLiteCheckpointer(self.path, keep_last=2, compact_every=4)
+        counts = []
+        put = checkpointer.put
+        def record(*args):
+            config = put(*args)
+            counts.append(checkpointer._count("thread-1"))
+            return config
+        checkpointer.put = record
+        self.run_graph(checkpointer, 4)
+        # The thread grows to keep_last + compact_every - 1 checkpoints, then is compacted back to keep_last
+        self.assertEqual([1, 2, 3, 4, 5, 2, 3, 4, 5, 2, 3, 4, 5, 2, 3, 4], counts)
+
+    def test_async_calls_run_off_the_event_loop(self):
+        checkpointer = SQLiteCheckpointer(self.path, keep_last=2, compact_every=1)
+        threads = set()
+        put = checkpointer.put
+        def record(*args):
+            threads.add(threading.get_ident())
+            return put(*args)
+        checkpointer.put = record
+
+        async def run():
+            graph = build(checkpointer)
+            state = await graph.ainvoke({"notes": [], "count": 0}, self.config)
+            history = [snapshot async for snapshot in graph.aget_state_history(self.config)]
+            return state, history, threading.get_ident()
+
+        state, history, loopThread = asyncio.run(run())
+        self.assertEqual(1, state["count"])
+        self.assertEqual(2, len(history))
+        self.assertTrue(threads)
+        self.assertNotIn(loopThread, threads)
+
+    def test_delete_thread(self):
+        checkpointer = SQLiteCheckpointer(self.path)
+        graph, _ = self.run_graph(checkpointer, 1)
+        checkpointer.delete_thread("thread-1")
+        self.assertIsNone(checkpointer.get_tuple(self.config))
+        self.assertEqual([], list(graph.get_state_history(self.config)))
+
+if __name__ == "__main__":
+    unittest.main()
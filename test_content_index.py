@@ -0,0 +1,133 @@
+import os, tempfile, time, unittest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from content_index import ContentIndex, ContentIndexes, elide_repeats, format_page, format_page_passages
+from context import ContextWindow
+
+ARTICLE = ("The csv module implements classes to read and write tabular data in CSV format. "
+           "It allows programmers to say write this data in the format preferred by Excel without knowing the details. "
+           "The reader object iterates over lines in the given csvfile and returns each row as a list of strings. ") * 5
+OTHER = ("The json module exposes an API familiar to users of the marshal and pickle modules. "
+         "It encodes Python objects as JSON strings and decodes JSON documents into dictionaries and lists. ") * 5
+
+def retrieval(content: str, call: str) -> list:
+    return [AIMessage(content="", tool_calls=[{"name": "url_retrieval", "args": {"url": "https://example.com"}, "id": call}]),
+            ToolMessage(content=content, tool_call_id=call, name="url_retrieval")]
+
+class ContentIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = ContentIndex(chunk_tokens=40)
+
+    def test_near_duplicate_shares_the_reference(self):
+        page, duplicate = self.index.add("https://docs.python.org/3/library/csv.html", ARTICLE)
+        self.assertFalse(duplicate)
+        mirror, duplicate = self.index.add("https://mirror.example.org/csv.html", ARTICLE + " Last updated today.")
+        self.assertTrue(duplicate)
+        self.assertEqual(page.ref, mirror.ref)
+        self.assertIn("same content as https://docs.python.org/3/library/csv.html", format_page(mirror, "https://mirror.example.org/csv.html"))
+        other, duplicate = self.index.add("https://docs.python.org/3/library/json.html", OTHER)
+        self.assertFalse(duplicate)
+        self.assertNotEqual(page.ref, other.ref)
+        self.assertEqual(2, self.index.stats()["pages"])
+
+    def test_strict_threshold_keeps_edited_pages_apart(self):
+        index = ContentIndex(threshold=1.0)
+        page, _ = index.add("https://example.com/a", ARTICLE)
+        edited, duplicate = index.add("https://example.com/b", ARTICLE.replace("Excel", "spreadsheets", 1) + " Edited.")
+        self.assertFalse(duplicate)
+        self.assertNotEqual(page.ref, edited.ref)
+
+    def test_lookup_by_normalized_url(self):
+        page, _ = self.index.add("https://docs.python.org/3/library/csv.html", ARTICLE)
+        self.assertEqual(page, self.index.get("https://DOCS.python.org/3/library/csv.html#module-csv"))
+        self.assertIsNone(self.index.get("https://docs.python.org/3/library/json.html"))
+        self.assertEqual(1, self.index.stats()["fetches_saved"])
+
+    def test_passages_and_search(self):
+        csv, _ = self.index.add("https://example.com/csv", ARTICLE)
+        self.index.add("https://example.com/json", OTHER)
+        passages = self.index.passages(csv, "reader iterates over lines", k=2)
+        self.assertTrue(passages)
+        self.assertLessEqual(len(passages), 2)
+        self.assertTrue(all(chunk.ref == csv.ref for chunk in passages))
+        self.assertEqual(csv.ref, self.index.passages(csv, "unrelated zebra", k=1)[0].ref)
+        self.assertEqual("https://example.com/json", self.index.search("decodes JSON documents", k=1)[0].url)
+
+    def test_elide_repeats(self):
+        page, _ = self.index.add("https://example.com/csv", ARTICLE)
+        full = format_page(page, page.url)
+        self.assertEqual((full, {page.ref}), elide_repeats(full, set()))
+        elided, shown = elide_repeats(full, {page.ref})
+        self.assertNotIn(ARTICLE[:80], elided)
+        self.assertIn(f"[{page.ref}] is shown in full above", elided)
+        self.assertEqual(set(), shown)
+        chunks = self.index.passages(page, "reader", k=3)
+        passages = format_page_passages(page, page.url, "reader", chunks)
+        text, shown = elide_repeats(passages, {chunks[0].id})
+        self.assertNotIn(f"[{chunks[0].id}]", text)
+        self.assertEqual({chunk.id for chunk in chunks[1:]}, shown)
+        self.assertIn("1 of these passages are shown above", text)
+        self.assertEqual(("Error retrieving URL", set()), elide_repeats("Error retrieving URL", {page.ref}))
+
+class ContentIndexesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def files(self) -> list[str]:
+        return sorted(os.listdir(self.directory.name))
+
+    def test_run_is_loaded_back_from_disk(self):
+        ContentIndexes(directory=self.directory.name).get("run-1").add("https://example.com/csv", ARTICLE)
+        index = ContentIndexes(directory=self.directory.name).get("run-1")
+        self.assertEqual(1, index.stats()["pages"])
+        self.assertEqual("https://example.com/csv", index.search("reader iterates", k=1)[0].url)
+
+    def test_sweep_deletes_old_and_surplus_run_files(self):
+        indexes = ContentIndexes(directory=self.directory.name)
+        for number in range(4):
+            indexes.get(f"run-{number}").add("https://example.com/csv", ARTICLE)
+            os.utime(indexes.path(f"run-{number}"), (time.time() - number * 3600,) * 2)
+        os.utime(indexes.path("run-3"), (time.time() - 30 * 24 * 3600,) * 2)
+        # Files of the runs still in memory are never deleted
+        self.assertEqual(0, indexes.sweep())
+        indexes = ContentIndexes(directory=self.directory.name, max_files=2, max_age=7 * 24 * 3600)
+        self.assertEqual(["run-0.jsonl", "run-1.jsonl"], self.files())
+        self.assertEqual(2, indexes.files_deleted)
+
+    def test_new_runs_sweep_at_most_every_interval(self):
+        indexes = ContentIndexes(max_runs=1, directory=self.directory.name, max_files=1, sweep_interval=0)
+        for number in range(3):
+            indexes.get(f"run-{number}").add("https://example.com/csv", ARTICLE)
+        # run-2 is in memory, and run-1 is the newest of the others
+        self.assertEqual(["run-1.jsonl", "run-2.jsonl"], self.files())
+
+class ContextWindowRepeatsTest(unittest.TestCase):
+    def setUp(self):
+        index = ContentIndex()
+        page, _ = index.add("https://example.com/csv", ARTICLE)
+        self.page = format_page(page, page.url)
+
+    def test_repeat_is_elided_when_the_first_copy_is_visible(self):
+        history = [HumanMessage("Write a CSV parser")] + retrieval(self.page, "call-1") + retrieval(self.page, "call-2")
+        window = ContextWindow(keep_tool_results=2).fit(history)
+        self.assertEqual(self.page, window[2].content)
+        self.assertIn("is shown in full above", window[4].content)
+        # The history itself is left as retrieved
+        self.assertEqual(self.page, history[4].content)
+
+    def test_repeat_is_kept_when_the_first_copy_is_compacted(self):
+        history = [HumanMessage("Write a CSV parser")] + retrieval(self.page, "call-1") + retrieval(self.page, "call-2")
+        window = ContextWindow(keep_tool_results=0).fit(history)
+        self.assertIn("result truncated", window[2].content)
+        self.assertEqual(self.page, window[4].content)
+
+    def test_parallel_branches_each_see_the_page(self):
+        # Research steps run in parallel share the run's index, but each branch sends only its own history
+        for call in ("branch-1", "branch-2"):
+            window = ContextWindow().fit([HumanMessage("Write a CSV parser")] + retrieval(self.page, call))
+            self.assertEqual(self.page, window[-1].content)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import threading, time, unittest
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from fetcher import PooledFetcher, UnsupportedContentError
+
+class PooledFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+        self.fetcher = PooledFetcher(max_connections_per_host=2)
+        self.fetcher._client = httpx.Client(transport=httpx.MockTransport(self.respond))
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return httpx.Response(200, text="x" * 1000, headers={"content-type": "text/html"})
+
+    def test_connections_per_host_are_limited_across_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(self.fetcher.get, ["https://example.com/page"] * 8))
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(2, self.peak)
+
+    def test_body_and_content_type_limits(self):
+        self.assertEqual(100, len(self.fetcher.get("https://example.com/", max_bytes=100).content))
+        with self.assertRaises(UnsupportedContentError):
+            self.fetcher.get("https://example.com/", content_types=("text/plain",))
+
+    def test_fetch_all_returns_the_error_of_a_bad_url(self):
+        good, bad = self.fetcher.fetch_all(["https://example.com/", "http://[::1"])
+        self.assertEqual(200, good.status_code)
+        self.assertIsInstance(bad, ValueError)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import io, os, pickle, tempfile, unittest
+from contextlib import redirect_stdout
+from langchain_core.messages import AIMessage, HumanMessage
+from inspector import main, parse_query, resolve
+from journal import StateJournal
+
+class QueryTest(unittest.TestCase):
+    def test_parse_and_resolve(self):
+        self.assertEqual(["generated_code", "modules", -1, "file name"], parse_query("generated_code.modules[-1]['file name']"))
+        state = {"messages": [HumanMessage("Write a CSV parser")], "generated_code": {"modules": [{"code": "a"}, {"code": "b"}]}}
+        self.assertEqual("b", resolve(state, "generated_code.modules[1].code"))
+        self.assertEqual("Write a CSV parser", resolve(state, "messages[0].content"))
+        with self.assertRaises(ValueError):
+            parse_query("modules[")
+
+class InspectorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "run.journal")
+        with StateJournal(self.path) as journal:
+            journal.record_input({"messages": [HumanMessage("Write a CSV parser", id="1")]})
+            journal.record_event({"planner": {"messages": [AIMessage("1. Read the file\n2. Split the lines", id="2")]}})
+            journal.record_event({"coder": {"generated_code": {"modules": [{"file_name": "csv_parser.py", "code": "x" * 2000}]}}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_main(self, *argv) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main(list(argv))
+        return output.getvalue()
+
+    def test_list_and_update(self):
+        lines = self.run_main("list", self.path).splitlines()[1:]
+        self.assertEqual(["__input__", "planner", "coder"], [line.split()[2] for line in lines if " update " in line])
+        self.assertEqual(["planner"], [line.split()[2] for line in self.run_main("list", self.path, "--node", "planner").splitlines()[1:]])
+        self.assertIn("Split the lines", self.run_main("update", self.path, "1", "planner.messages[0].content"))
+
+    def test_state_at_an_event_and_truncation(self):
+        self.assertNotIn("generated_code", self.run_main("fields", self.path, "--at", "1"))
+        self.assertIn("list (1 items)", self.run_main("fields", self.path, "generated_code"))
+        self.assertIn("[1900 more chars]", self.run_main("show", self.path, "generated_code.modules[0].code", "--max-chars", "25"))
+        messages = self.run_main("messages", self.path).splitlines()
+        self.assertEqual(2, len(messages))
+        self.assertIn("1. Read the file", messages[1])
+
+    def test_directory_of_state_pickles(self):
+        for number, node in enumerate(("planner", "coder")):
+            with open(os.path.join(self.directory.name, f"{node}_{1000 + number}.pkl"), "wb") as file:
+                pickle.dump({"count": number, "node": node}, file)
+        self.assertEqual(["planner", "coder"], [line.split()[2] for line in self.run_main("list", self.directory.name).splitlines()[1:]])
+        self.assertEqual("planner", self.run_main("show", self.directory.name, "node", "--at", "0").strip())
+
+if __name__ == "__main__":
+    unittest.main()
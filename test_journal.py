@@ -0,0 +1,75 @@
+import operator, os, tempfile, unittest
+from types import SimpleNamespace
+from langchain_core.messages import AIMessage, HumanMessage
+from costs import llm_cost
+from journal import HEADER, SNAPSHOT, UPDATE, JournalReader, StateJournal
+
+REDUCERS = {"notes": operator.add}
+
+class FakeGraph:
+    """Hands the journal the state the test has accumulated when it takes a snapshot."""
+
+    def __init__(self):
+        self.state = {}
+
+    def get_state(self, config=None):
+        return SimpleNamespace(values=self.state)
+
+class StateJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "run.journal")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, events: int, snapshot_every: int = 3) -> list[dict]:
+        """Journal a run of `events` events and return the state after each of them."""
+        graph = FakeGraph()
+        graph.state = {"notes": [], "count": 0}
+        states = [dict(graph.state)]
+        with StateJournal(self.path, snapshot_every=snapshot_every) as journal:
+            journal.record_input(graph.state)
+            for number in range(1, events + 1):
+                update = {"notes": [f"note {number}"], "count": number}
+                graph.state = {"notes": graph.state["notes"] + update["notes"], "count": number}
+                states.append(graph.state)
+                journal.record_event({"worker": update}, graph)
+        return states
+
+    def test_state_at_every_event(self):
+        states = self.write(7)
+        reader = JournalReader(self.path, REDUCERS)
+        self.assertEqual([3, 6], [record.index for record in reader.records() if record.kind == SNAPSHOT])
+        for index, state in enumerate(states):
+            self.assertEqual(state, reader.state_at(index))
+        self.assertEqual(states[-1], reader.state_at())
+        self.assertEqual(["__input__"] + ["worker"] * 7, [record.node for record, _ in reader.updates()])
+
+    def test_interrupted_write_is_ignored_and_the_journal_continues(self):
+        states = self.write(4)
+        with open(self.path, "ab") as file:
+            file.write(HEADER.pack(UPDATE, 5, 0.0, 6, 100) + b"worker" + b"x" * 10)
+        self.assertEqual(states[-1], JournalReader(self.path, REDUCERS).state_at())
+        with StateJournal(self.path) as journal:
+            self.assertEqual(4, journal.index)
+
+    def test_state_reducers_are_used_by_default(self):
+        response = AIMessage("1. Read the file", id="2", response_metadata={"model": "claude-3-5-haiku-latest"},
+                             usage_metadata={"input_tokens": 1000, "output_tokens": 100, "total_tokens": 1100})
+        with StateJournal(self.path) as journal:
+            journal.record_input({"messages": [HumanMessage("Write a CSV parser", id="1")]})
+            journal.record_event({"planner": {"messages": [response], "llmCosts": llm_cost(response)}})
+            journal.record_event({"coder": {"llmCosts": llm_cost(response)}})
+        state = JournalReader(self.path).state_at()
+        self.assertEqual(["1", "2"], [message.id for message in state["messages"]])
+        self.assertEqual(2, state["llmCosts"]["claude-3-5-haiku-latest"]["calls"])
+
+    def test_not_a_journal(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a journal")
+        with self.assertRaises(ValueError):
+            JournalReader(self.path).records()
+
+if __name__ == "__main__":
+    unittest.main()
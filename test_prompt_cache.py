@@ -0,0 +1,58 @@
+import logging, unittest
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from agent import CodeSolutionAgent
+from prompt_cache import EPHEMERAL, cache_history
+
+# Renders the prompts into the request payload ChatAnthropic would send, without calling the API
+client = ChatAnthropic(model="claude-3-5-haiku-latest", api_key="offline")
+
+def payload(prompt_value) -> dict:
+    return client._get_request_payload(prompt_value)
+
+def breakpoints(blocks) -> list:
+    return [block for block in blocks if isinstance(block, dict) and "cache_control" in block] if isinstance(blocks, list) else []
+
+class PromptCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = CodeSolutionAgent(None, None, None, None, None, None, None, logging.getLogger("test"))
+
+    def coder_payload(self, step: dict) -> dict:
+        return payload(self.agent.coder_prompt().invoke({"research_output": "The research document. " * 500,
+                                                         "messages": [HumanMessage("Write a CSV parser")], "code_step": step,
+                                                         "implemented_modules": "", "source_passages": ""}))
+
+    def test_coder_caches_instructions_and_research(self):
+        first = self.coder_payload({"id": 1, "name": "reader"})
+        second = self.coder_payload({"id": 2, "name": "writer"})
+        cached, step = first["system"]
+        self.assertEqual(cached["cache_control"], EPHEMERAL)
+        self.assertIn("The research document.", cached["text"])
+        self.assertNotIn("cache_control", step)
+        self.assertIn("reader", step["text"])
+        # Every module shares the cached prefix, and only the step after the breakpoint changes
+        self.assertEqual(cached, second["system"][0])
+        self.assertEqual([], [block for message in first["messages"] for block in breakpoints(message["content"])])
+
+    def test_researcher_caches_the_history(self):
+        history = [HumanMessage("Write a CSV parser"),
+                   AIMessage(content="", tool_calls=[{"name": "url_retrieval", "args": {"url": "https://example.com"}, "id": "call-1"}]),
+                   ToolMessage(content="Retrieved page. " * 500, tool_call_id="call-1", name="url_retrieval")]
+        request = payload(self.agent.researcher_prompt().invoke({"messages": cache_history(history), "problem": "Write a CSV parser",
+                                                                 "query": "csv module", "search_results": "[]"}))
+        self.assertEqual([], breakpoints(request["system"]))
+        last = request["messages"][-1]["content"]
+        # The tool result and the step's human message are sent as one user message, with the breakpoint between them
+        self.assertEqual("tool_result", last[0]["type"])
+        self.assertEqual(EPHEMERAL, last[0]["cache_control"])
+        self.assertNotIn("cache_control", last[-1])
+        self.assertIn("csv module", last[-1]["text"])
+        self.assertIsInstance(history[-1].content, str)
+
+    def test_cache_history_skips_empty_messages(self):
+        history = [HumanMessage("Write a CSV parser"), AIMessage(content="")]
+        self.assertIs(cache_history(history), history)
+        self.assertEqual([], cache_history([]))
+
+if __name__ == "__main__":
+    unittest.main()
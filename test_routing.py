@@ -0,0 +1,99 @@
+import unittest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from routing import ModelRouter, RoutedModel, valid_json_list
+
+HAIKU = "claude-3-5-haiku-latest"
+SONNET = "claude-3-5-sonnet-latest"
+
+def reply(model: str, content: str, input_tokens: int = 1000, output_tokens: int = 1000):
+    """A fake model variant that answers every call with content and the given usage."""
+    calls = []
+    def respond(input):
+        calls.append(input)
+        return AIMessage(content=content, response_metadata={"model": model},
+                         usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens})
+    return RunnableLambda(respond), calls
+
+def config(node: str, thread_id: str = "thread-1") -> dict:
+    return {"configurable": {"thread_id": thread_id}, "metadata": {"langgraph_node": node}}
+
+class ModelRouterTest(unittest.TestCase):
+    def test_cheapest_model_by_default(self):
+        decision = ModelRouter([HAIKU, SONNET]).route("researcher", 1000)
+        self.assertEqual((HAIKU, "cheapest"), (decision.model, decision.reason))
+
+    def test_node_floor(self):
+        router = ModelRouter([HAIKU, SONNET])
+        self.assertEqual(SONNET, router.route("validator", 100).model)
+        self.assertEqual(HAIKU, ModelRouter([HAIKU, SONNET], node_floor={}).route("validator", 100).model)
+
+    def test_large_prompts_escalate(self):
+        router = ModelRouter([HAIKU, SONNET], escalate_tokens=20000)
+        self.assertEqual(HAIKU, router.route("coder", 20000).model)
+        self.assertEqual(SONNET, router.route("coder", 20001).model)
+        # The strongest model is as far as a prompt can escalate
+        self.assertEqual(SONNET, router.route("validator", 50000).model)
+        self.assertEqual(HAIKU, ModelRouter([HAIKU, SONNET], escalate_tokens=None).route("coder", 50000).model)
+
+    def test_latency_slo_skips_slow_models(self):
+        router = ModelRouter([HAIKU, SONNET], latency_slo=2.0)
+        router.record(router.route("coder", 1000), None, latency=5.0)
+        self.assertEqual(SONNET, router.route("coder", 1000).model)
+        self.assertEqual(HAIKU, router.route("researcher", 1000).model)
+
+    def test_budget_falls_back_to_the_cheapest_allowed_model(self):
+        router = ModelRouter([HAIKU, SONNET], escalate_tokens=1000, run_budget=0.05)
+        decision = router.route("coder", 5000, "thread-1")
+        self.assertEqual(SONNET, decision.model)
+        router.record(decision, reply(SONNET, "x", 5000, 2000)[0].invoke(None), latency=1.0)
+        self.assertAlmostEqual(0.045, router.thread_cost("thread-1"))
+        decision = router.route("coder", 5000, "thread-1")
+        self.assertEqual(HAIKU, decision.model)
+        self.assertIn("budget", decision.reason)
+        # Other runs have their own budget, and the node floor is kept even over budget
+        self.assertEqual(SONNET, router.route("coder", 5000, "thread-2").model)
+        self.assertEqual(SONNET, router.route("validator", 100, "thread-1").model)
+
+    def test_escalate(self):
+        router = ModelRouter([HAIKU, SONNET])
+        decision = router.route("researcher", 100)
+        self.assertEqual(SONNET, router.escalate(decision).model)
+        self.assertIsNone(router.escalate(decision._replace(model=SONNET)))
+
+    def test_savings_against_the_strongest_model(self):
+        router = ModelRouter([HAIKU, SONNET])
+        router.record(router.route("researcher", 1000), reply(HAIKU, "x", 1_000_000, 0)[0].invoke(None), latency=1.0)
+        stats = router.stats()["nodes"]["researcher"]
+        self.assertEqual((1, 0.8, 3.0), (stats["calls"], stats["cost"], stats["baseline_cost"]))
+        self.assertAlmostEqual(2.2, stats["saved"])
+
+class RoutedModelTest(unittest.TestCase):
+    def test_invalid_output_is_retried_once_on_the_next_model(self):
+        router = ModelRouter([HAIKU, SONNET])
+        haiku, haikuCalls = reply(HAIKU, "not json")
+        sonnet, sonnetCalls = reply(SONNET, "[]")
+        model = RoutedModel({HAIKU: haiku, SONNET: sonnet}, router, valid_json_list)
+        self.assertEqual("[]", model.invoke("plan", config("research_planner")).content)
+        self.assertEqual((1, 1), (len(haikuCalls), len(sonnetCalls)))
+        stats = router.stats()["nodes"]["research_planner"]
+        self.assertEqual((2, 1, 1), (stats["calls"], stats["failures"], stats["escalations"]))
+
+    def test_retry_output_is_returned_even_if_invalid(self):
+        router = ModelRouter([HAIKU, SONNET])
+        haiku, haikuCalls = reply(HAIKU, "not json")
+        sonnet, sonnetCalls = reply(SONNET, "still not json")
+        model = RoutedModel({HAIKU: haiku, SONNET: sonnet}, router, valid_json_list)
+        self.assertEqual("still not json", model.invoke("plan", config("research_planner")).content)
+        self.assertEqual((1, 1), (len(haikuCalls), len(sonnetCalls)))
+
+    def test_valid_output_is_not_retried(self):
+        router = ModelRouter([HAIKU, SONNET])
+        haiku, haikuCalls = reply(HAIKU, "[1]")
+        sonnet, sonnetCalls = reply(SONNET, "[2]")
+        model = RoutedModel({HAIKU: haiku, SONNET: sonnet}, router, valid_json_list)
+        self.assertEqual("[1]", model.invoke("plan", config("research_planner")).content)
+        self.assertEqual((1, 0), (len(haikuCalls), len(sonnetCalls)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os, tempfile, unittest
+from cache import SQLiteCache
+from sandbox import TestRunner, resource
+from state import Module
+
+def module(file_name: str, code: str, imports: str = "") -> Module:
+    return Module(prefix="", language="python", imports=imports, code=code, file_name=file_name)
+
+TESTS = """
+class AddTest(unittest.TestCase):
+    def test_add(self):
+        self.assertEqual(3, add(1, 2))
+
+    def test_wrong(self):
+        self.assertEqual(4, add(1, 2))
+"""
+
+class TestRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.runner = TestRunner(max_workers=2, timeout=30, cpu_seconds=2,
+                                 cache=SQLiteCache(os.path.join(self.directory.name, "test_results.sqlite"), table="test_results"))
+
+    def tearDown(self):
+        self.runner.close()
+        self.directory.cleanup()
+
+    def test_runs_the_tests_against_the_modules(self):
+        modules = [module("src/calculator.py", "def add(a, b):\n    return a + b")]
+        tests = module("tests.py", TESTS, "import unittest\nfrom calculator import add")
+        result = self.runner.run(modules, tests)
+        self.assertEqual((1, 1, False), (result["passed"], result["failed"], result["cached"]))
+        self.assertEqual({"passed", "failed"}, {test["outcome"] for test in result["tests"]})
+        self.assertTrue(self.runner.run(modules, tests)["cached"])
+
+    def test_module_named_tests_is_not_overwritten(self):
+        modules = [module("tests.py", "def add(a, b):\n    return a + b")]
+        self.assertEqual("tests_1.py", self.runner.tests_file_name(modules))
+        result = self.runner.run(modules, module("tests_1.py", TESTS, "import unittest\nfrom tests import add"))
+        self.assertEqual((1, 1), (result["passed"], result["failed"]))
+
+    @unittest.skipIf(resource is None, "rlimits are not supported on this platform")
+    def test_cpu_limit_stops_a_runaway_test(self):
+        tests = module("tests.py", "class SpinTest(unittest.TestCase):\n    def test_spin(self):\n        while True:\n            pass",
+                       "import unittest")
+        result = self.runner.run([], tests)
+        self.assertFalse(result["timed_out"])
+        self.assertTrue(result["run_error"])
+        self.assertLess(result["duration"], 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading, time, unittest
+from scheduler import DEFAULT_LIMITS, ModelLimits, ModelScheduler, parse_limits
+
+MODEL = "claude-3-5-haiku-latest"
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class ParseLimitsTest(unittest.TestCase):
+    def test_overrides(self):
+        limits = parse_limits(rpm=["4000"], tpm=["claude-3-5-haiku=400000", "claude-3-opus=0"])
+        self.assertEqual(ModelLimits(4000, 400000), limits["claude-3-5-haiku"])
+        self.assertEqual(ModelLimits(4000, DEFAULT_LIMITS["claude-3-5-sonnet"].tpm), limits["claude-3-5-sonnet"])
+        self.assertEqual(ModelLimits(None, None), limits["claude-3-opus"])
+        self.assertEqual(DEFAULT_LIMITS, parse_limits())
+
+class ModelSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        # One request per second, and no requests left until the clock moves
+        self.scheduler = ModelScheduler({"claude-3-5-haiku": ModelLimits(rpm=60, tpm=None)}, clock=self.clock, poll_interval=0.01)
+        self.scheduler.rate_limited(MODEL)
+        self.admitted = []
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.join(2)
+
+    def enqueue(self, name: str, **kwargs):
+        """Start a call in its own thread and wait until it is queued."""
+        queued = self.scheduler.metrics()["models"][MODEL]["queue_depth"]
+        thread = threading.Thread(target=lambda: self.admitted.append((name, self.scheduler.acquire(MODEL, 1000, **kwargs))))
+        thread.start()
+        self.threads.append(thread)
+        while self.scheduler.metrics()["models"][MODEL]["queue_depth"] == queued:
+            time.sleep(0.005)
+
+    def admit(self, count: int) -> list[str]:
+        """Move the clock one second per call and return the calls in the order they were admitted."""
+        for _ in range(count):
+            admitted = len(self.admitted)
+            self.clock.now += 1
+            while len(self.admitted) == admitted:
+                time.sleep(0.005)
+        return [name for name, _ in self.admitted]
+
+    def test_interactive_calls_go_before_batch_calls(self):
+        self.enqueue("batch", thread_id="batch-run", priority="batch")
+        self.enqueue("documenter", thread_id="session", node="documenter")
+        self.enqueue("coder", thread_id="session", node="coder")
+        self.assertEqual(["coder", "documenter", "batch"], self.admit(3))
+        metrics = self.scheduler.metrics()
+        self.assertEqual(3, metrics["models"][MODEL]["waited"])
+        self.assertEqual({"interactive", "background", "batch"}, set(metrics["priorities"]))
+
+    def test_a_busy_thread_does_not_starve_the_others(self):
+        for number in range(3):
+            self.enqueue(f"busy {number}", thread_id="busy")
+        self.enqueue("quiet", thread_id="quiet")
+        self.assertEqual(["busy 0", "quiet", "busy 1", "busy 2"], self.admit(4))
+
+    def test_rate_limit_holds_callers_for_retry_after(self):
+        self.clock.now += 1
+        self.scheduler.rate_limited(MODEL, retry_after=5)
+        self.enqueue("coder")
+        self.clock.now += 4
+        time.sleep(0.05)
+        self.assertEqual([], [name for name, _ in self.admitted])
+        self.assertEqual(["coder"], self.admit(1))
+        self.assertEqual(2, self.scheduler.metrics()["models"][MODEL]["rate_limited"])
+
+if __name__ == "__main__":
+    unittest.main()
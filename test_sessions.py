@@ -0,0 +1,61 @@
+import os, tempfile, unittest
+from checkpointer import SQLiteCheckpointer
+from sessions import SessionSaver
+from test_checkpointer import build
+
+def config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class SessionSaverTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.clock = Clock()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_graph(self, graph, thread_id: str) -> dict:
+        state = graph.get_state(config(thread_id)).values
+        return graph.invoke({"notes": [], "count": state.get("count", 0)}, config(thread_id))
+
+    def test_only_the_last_checkpoints_stay_resident(self):
+        saver = SessionSaver(keep_last=2)
+        graph = build(saver)
+        for _ in range(3):
+            state = self.run_graph(graph, "thread-1")
+        self.assertEqual(3, state["count"])
+        self.assertEqual(2, len(list(graph.get_state_history(config("thread-1")))))
+        self.assertEqual(state, graph.get_state(config("thread-1")).values)
+
+    def test_evicted_thread_is_spilled_and_restored(self):
+        saver = SessionSaver(max_threads=1, spill=SQLiteCheckpointer(os.path.join(self.directory.name, "sessions.sqlite")), clock=self.clock)
+        graph = build(saver)
+        first = self.run_graph(graph, "thread-1")
+        self.run_graph(graph, "thread-2")
+        self.assertEqual({"threads": 1, "evictions": 1, "spills": 1, "restores": 0},
+                         {key: value for key, value in saver.stats().items() if key != "resident_bytes"})
+        self.assertEqual(first, graph.get_state(config("thread-1")).values)
+        self.assertEqual(1, saver.restores)
+        # The restored session continues where it left off
+        state = self.run_graph(graph, "thread-1")
+        self.assertEqual((2, 2), (state["count"], len(state["notes"])))
+
+    def test_idle_threads_are_dropped_without_a_spill(self):
+        saver = SessionSaver(idle_ttl=60, clock=self.clock)
+        graph = build(saver)
+        self.run_graph(graph, "thread-1")
+        self.clock.now = 120
+        self.run_graph(graph, "thread-2")
+        self.assertEqual(1, saver.stats()["threads"])
+        self.assertEqual({}, graph.get_state(config("thread-1")).values)
+        self.assertGreater(saver.resident_bytes, 0)
+
+if __name__ == "__main__":
+    unittest.main()
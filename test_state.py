@@ -0,0 +1,55 @@
+import pickle, unittest
+from costs import llm_cost
+from langchain_core.messages import AIMessage
+from state import CodingState, Module, merge_coding_state, merge_llm_costs
+
+HAIKU = "claude-3-5-haiku-20241022"
+
+def response(input_tokens: int, output_tokens: int) -> AIMessage:
+    return AIMessage(content="", response_metadata={"model": HAIKU},
+                     usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens})
+
+class LLMCostsTest(unittest.TestCase):
+    def test_totals_per_model(self):
+        costs = merge_llm_costs(llm_cost(response(1000, 100)), llm_cost(response(2000, 200)))
+        self.assertEqual([HAIKU], list(costs))
+        self.assertEqual((3000, 300, 2), (costs[HAIKU]["input_tokens"], costs[HAIKU]["output_tokens"], costs[HAIKU]["calls"]))
+        self.assertAlmostEqual((3000 * 0.80 + 300 * 4.00) / 1_000_000, costs[HAIKU]["cost"])
+
+    def test_old_state_with_a_list_of_calls(self):
+        with open("output/state/code_planner.pkl", "rb") as f:
+            state = pickle.load(f)
+        self.assertIsInstance(state["llmCosts"], list)
+        costs = merge_llm_costs(state["llmCosts"], llm_cost(response(1000, 100)))
+        self.assertEqual([HAIKU], list(costs))
+        self.assertEqual(len(state["llmCosts"]) + 1, costs[HAIKU]["calls"])
+        self.assertEqual(sum(call["input_tokens"] for call in state["llmCosts"]) + 1000, costs[HAIKU]["input_tokens"])
+        self.assertGreater(costs[HAIKU]["cost"], 0)
+        self.assertEqual(costs, merge_llm_costs(llm_cost(response(1000, 100)), state["llmCosts"]))
+
+class CodingStateTest(unittest.TestCase):
+    def plan(self) -> CodingState:
+        steps = [{"id": 1, "name": "reader", "description": "", "file_name": "reader.py", "status": "pending", "depends_on": []},
+                 {"id": 2, "name": "writer", "description": "", "file_name": "writer.py", "status": "pending", "depends_on": []}]
+        return CodingState(code_plan=steps, current_step=0, modules=[], is_complete=False)
+
+    def module(self, file_name: str) -> Module:
+        return Module(prefix="", language="python", imports="", code="pass", file_name=file_name)
+
+    def test_coder_update_keeps_the_rest_of_the_plan(self):
+        plan = self.plan()
+        update = {"modules": [self.module("writer.py")], "code_plan": [{**plan["code_plan"][1], "status": "done"}], "current_step": 1}
+        merged = merge_coding_state(plan, update)
+        self.assertEqual(["pending", "done"], [step["status"] for step in merged["code_plan"]])
+        self.assertFalse(merged["is_complete"])
+        merged = merge_coding_state(merged, {"modules": [self.module("reader.py")], "code_plan": [{**plan["code_plan"][0], "status": "done"}]})
+        self.assertTrue(merged["is_complete"])
+        # Modules are kept in plan order, whatever order they were generated in
+        self.assertEqual(["reader.py", "writer.py"], [module["file_name"] for module in merged["modules"]])
+
+    def test_new_plan_replaces_the_state(self):
+        plan = merge_coding_state(self.plan(), {"modules": [self.module("reader.py")], "code_plan": []})
+        self.assertEqual(self.plan(), merge_coding_state(plan, self.plan()))
+
+if __name__ == "__main__":
+    unittest.main()
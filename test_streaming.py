@@ -0,0 +1,29 @@
+import io, threading, unittest
+from langchain_core.callbacks import CallbackManager
+from langchain_core.messages import AIMessageChunk, ToolMessage
+from streaming import StopWhenCancelled, TokenPrinter, streaming_config, with_cancellation
+
+class TokenPrinterTest(unittest.TestCase):
+    def test_one_header_per_node(self):
+        out = io.StringIO()
+        printer = TokenPrinter(out)
+        printer(AIMessageChunk(content="1. Read"), {"langgraph_node": "planner"})
+        printer(AIMessageChunk(content=" the file"), {"langgraph_node": "planner"})
+        printer(ToolMessage("page", tool_call_id="1"), {"langgraph_node": "tools"})
+        printer(AIMessageChunk(content=[{"type": "input_json_delta", "partial_json": '{"prefix": "A'}]), {"langgraph_node": "coder"})
+        printer(AIMessageChunk(content="", tool_call_chunks=[{"name": None, "args": 'CSV"', "id": None, "index": 0}]), {"langgraph_node": "coder"})
+        self.assertEqual('\n[planner] 1. Read the file\n[coder] {"prefix": "ACSV"', out.getvalue())
+
+class StreamingConfigTest(unittest.TestCase):
+    def test_outside_a_graph_run(self):
+        self.assertIsNone(streaming_config("streaming_code", "CodeSolution"))
+
+    def test_with_cancellation_keeps_the_callbacks(self):
+        cancelled = threading.Event()
+        config = with_cancellation({"callbacks": CallbackManager([]), "tags": ["coder"]}, cancelled)
+        self.assertEqual(["coder"], config["tags"])
+        self.assertTrue(any(isinstance(handler, StopWhenCancelled) for handler in config["callbacks"].handlers))
+        self.assertIsInstance(with_cancellation(None, cancelled)["callbacks"][0], StopWhenCancelled)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os, tempfile, unittest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from extraction import estimate_tokens
+from summarizer import HierarchicalSummarizer
+
+PROBLEM = "Write a CSV parser"
+
+def fake_llm():
+    """A model that answers every prompt with a long note, recording whether it was asked to condense or merge."""
+    calls = []
+    def respond(prompt):
+        text = prompt.to_string()
+        calls.append("merge" if "Merge the research notes" in text else "condense")
+        return AIMessage(f"{calls[-1]} note " * 500, response_metadata={"model": "claude-3-5-haiku-latest"},
+                         usage_metadata={"input_tokens": estimate_tokens(text), "output_tokens": 1000, "total_tokens": 1000})
+    return RunnableLambda(respond), calls
+
+def results(count: int) -> list[str]:
+    return [f"Research result {number}: " + "the csv module handles quoting " * 40 for number in range(count)]
+
+class HierarchicalSummarizerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "summaries.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def summarizer(self, llm, path=None) -> HierarchicalSummarizer:
+        return HierarchicalSummarizer(llm, fan_in=2, level_tokens=(50, 100), direct_tokens=1000, path=path)
+
+    def test_small_result_sets_are_summarized_directly(self):
+        llm, calls = fake_llm()
+        self.assertEqual((results(2), {}), self.summarizer(llm).condense(PROBLEM, results(2)))
+        self.assertEqual([], calls)
+
+    def test_results_are_condensed_then_merged_level_by_level(self):
+        llm, calls = fake_llm()
+        notes, costs = self.summarizer(llm).condense(PROBLEM, results(5))
+        # 5 condensed notes, merged two at a time into 3 and then into 2; the odd note out is carried up as it is
+        self.assertEqual(["condense"] * 5 + ["merge"] * 3, calls)
+        self.assertEqual(["merge", "condense"], [note.split()[0] for note in notes])
+        self.assertTrue(all(estimate_tokens(note) <= 120 for note in notes))
+        self.assertEqual(8, costs["claude-3-5-haiku-latest"]["calls"])
+
+    def test_condensed_results_are_reused_by_a_repeated_run(self):
+        llm, calls = fake_llm()
+        self.summarizer(llm, self.path).condense(PROBLEM, results(4))
+        self.assertEqual(4, calls.count("condense"))
+        llm, calls = fake_llm()
+        notes, costs = self.summarizer(llm, self.path).condense(PROBLEM, results(5))
+        self.assertEqual(["condense"] + ["merge"] * 3, calls)
+        self.assertEqual(2, len(notes))
+        self.assertEqual(4, costs["claude-3-5-haiku-latest"]["calls"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import asyncio, unittest
+import httpx
+from content_index import ContentIndexes
+from utils import URLRetrievalTool
+
+RUN = {"configurable": {"thread_id": "run-1"}}
+
+class FakeFetcher:
+    """Serves the same plain text page for every URL."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    def get(self, url, headers=None, max_bytes=None, content_types=None):
+        self.calls += 1
+        return httpx.Response(200, text=self.text, headers={"content-type": "text/plain"}, request=httpx.Request("GET", url))
+
+class URLRetrievalToolTest(unittest.TestCase):
+    def tool(self, text: str = "A page about parsing CSV files.", **kwargs) -> URLRetrievalTool:
+        return URLRetrievalTool(fetcher=FakeFetcher(text), use_cache=False, content_index=ContentIndexes(), **kwargs)
+
+    def test_invalid_urls_are_reported_to_the_llm(self):
+        tool = URLRetrievalTool(use_cache=False, content_index=ContentIndexes())
+        for url in ("http://exa mple.com/\x00", "http://[::1"):
+            self.assertTrue(tool.invoke({"url": url}, RUN).startswith(f"Error retrieving content from {url}"))
+            self.assertTrue(asyncio.run(tool.ainvoke({"url": url}, RUN)).startswith("Error retrieving content"))
+        self.assertTrue(tool.retrieve_all(["http://[::1"])[0].startswith("Error retrieving content"))
+
+    def test_repeat_url_is_served_from_the_run_index(self):
+        tool = self.tool()
+        first = tool.invoke({"url": "https://example.com/csv"}, RUN)
+        self.assertEqual("[page-1] https://example.com/csv#reader\n\nA page about parsing CSV files.",
+                         tool.invoke({"url": "https://example.com/csv#reader"}, RUN))
+        self.assertEqual(1, tool.fetcher.calls)
+        self.assertTrue(first.startswith("[page-1] https://example.com/csv"))
+
+    def test_passages_past_the_token_limit_are_indexed(self):
+        filler = "\n\n".join(f"Paragraph {number} is about the weather in Paris in spring." for number in range(200))
+        tool = self.tool(filler + "\n\nUse DataFrame.to_json with lines=True to write JSONL.", max_tokens=100, top_k=1)
+        page = tool.invoke({"url": "https://example.com/pandas"}, RUN)
+        self.assertIn("[... content truncated ...]", page)
+        self.assertNotIn("to_json", page)
+        passages = tool.invoke({"url": "https://example.com/pandas", "query": "write JSONL with to_json"}, RUN)
+        self.assertIn("Use DataFrame.to_json with lines=True", passages)
+        self.assertEqual(1, tool.fetcher.calls)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,13 +3,15 @@ import json
 from langchain_core.messages import ToolMessage
 from langgraph.graph import END
 from state import State
+from extraction import truncate_to_tokens
 
 
 class BasicToolNode:
-    """A node that runs the tools requested in the last AIMessage."""
+    """A node that runs the tools requested in the last AIMessage.  Tool output is bounded to max_tokens."""
 
-    def __init__(self, tools: list) -> None:
+    def __init__(self, tools: list, max_tokens: int = 8000) -> None:
         self.tools_by_name = {tool.name: tool for tool in tools}
+        self.max_tokens = max_tokens
 
     def __call__(self, inputs: dict):
         if messages := inputs.get("messages", []):
@@ -18,12 +20,23 @@ class BasicToolNode:
             raise ValueError("No message found in input")
         outputs = []
         for tool_call in message.tool_calls:
+            if tool_call["name"] not in self.tools_by_name:
+                # Like the prebuilt ToolNode, let the model correct itself instead of failing the whole node
+                outputs.append(
+                    ToolMessage(
+                        content=f"Error: {tool_call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].",
+                        name=tool_call["name"],
+                        tool_call_id=tool_call["id"],
+                        status="error",
+                    )
+                )
+                continue
             tool_result = self.tools_by_name[tool_call["name"]].invoke(
                 tool_call["args"]
             )
             outputs.append(
                 ToolMessage(
-                    content=json.dumps(tool_result),
+                    content=truncate_to_tokens(tool_result if isinstance(tool_result, str) else json.dumps(tool_result), self.max_tokens),
                     name=tool_call["name"],
                     tool_call_id=tool_call["id"],
                 )
@@ -63,9 +63,25 @@ class Wrapper:
 
         return wrapper
     
-import requests
-from bs4 import BeautifulSoup
+import asyncio, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+import httpx
+from langchain_core.runnables import ensure_config
 from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+from fetcher import PooledFetcher, shared_fetcher
+from cache import PageCache
+from content_index import ContentIndex, ContentIndexes, Page, format_page, format_page_passages
+from extraction import HTML_CONTENT_TYPES, extract_main_text, truncate_to_tokens
+
+# A URL the LLM made up may fail to parse (InvalidURL or ValueError) before any request is made
+RETRIEVAL_ERRORS = (httpx.HTTPError, httpx.InvalidURL, ValueError)
+
+class URLRetrievalInput(BaseModel):
+    url: str = Field(description="The URL of the page to retrieve")
+    query: Optional[str] = Field(default=None, description="What you are looking for on the page.  When given, only the passages "
+                                                            "of the page most relevant to it are returned instead of the whole page.")
 
 # Define a custom tool for retrieving and parsing content from a URL
 class   URLRetrievalTool(BaseTool):
@@ -73,32 +89,125 @@ class   URLRetrievalTool(BaseTool):
     A tool for retrieving and parsing text content from a given URL.
 
     This tool fetches the HTML content of a webpage and extracts the text content,
-    removing all HTML tags. It is useful for obtaining the main textual content from
-    web pages for further processing or analysis.
+    removing all HTML tags and page boilerplate. It is useful for obtaining the main textual
+    content from web pages for further processing or analysis.  Downloads are capped at
+    max_bytes, non-HTML content is rejected from the response headers, and the text returned
+    is bounded to max_tokens.  Requests go through a shared
+    PooledFetcher, so connections are reused across calls and bounded by timeouts,
+    and the extracted text is kept in a PageCache so repeat pages are not re-downloaded
+    or re-parsed.  Within a run (a graph thread), every page is indexed in a ContentIndex, so
+    a URL retrieved again is served without fetching it, and a page whose text is a near duplicate
+    of an earlier one gets the earlier page's [page-N] reference.  When the call has a query, only
+    the top_k chunks of the page most relevant to it are returned.  A page or passage that the LLM
+    can still see earlier in its prompt is left out when the prompt is assembled (ContextWindow).
 
     Methods:
         _run(url: str) -> str: Retrieves and parses the text content from the specified URL.
+        _arun(url: str) -> str: Asynchronously retrieves and parses the text content from the specified URL.
+        retrieve_all(urls: list[str]) -> list[str]: Retrieves several URLs concurrently.
+        aretrieve_all(urls: list[str]) -> list[str]: Asynchronously retrieves several URLs concurrently.
     """
 
-    def __init__(self):
-        super().__init__(name="url_retrieval", description="Retrieve and parse text from a URL.  Can be used to gather more details on a topic from a list of URLs.  For example, these Urls could be retrieved from search results.")
-
-    def _run(self, url: str) -> str:
+    fetcher: Any = Field(default_factory=shared_fetcher, exclude=True)
+    cache: Any = Field(default_factory=PageCache, exclude=True)
+    content_index: Any = Field(default_factory=ContentIndexes, exclude=True)
+    args_schema: type[BaseModel] = URLRetrievalInput
+    max_bytes: int = 2 * 1024 * 1024
+    max_tokens: int = 4000
+    top_k: int = 4
+
+    def __init__(self, fetcher: PooledFetcher = None, cache: PageCache = None, use_cache: bool = True,
+                 max_bytes: int = 2 * 1024 * 1024, max_tokens: int = 4000, content_index: ContentIndexes = None,
+                 dedupe: bool = True, top_k: int = 4):
+        overrides = {"fetcher": fetcher} if fetcher else {}
+        if cache or not use_cache:
+            overrides["cache"] = cache
+        if content_index or not dedupe:
+            overrides["content_index"] = content_index
+        super().__init__(name="url_retrieval", description="Retrieve and parse text from a URL.  Can be used to gather more details on a topic from a list of URLs.  For example, these Urls could be retrieved from search results.",
+                         max_bytes=max_bytes, max_tokens=max_tokens, top_k=top_k, **overrides)
+
+    def _run(self, url: str, query: Optional[str] = None) -> str:
         """
         Retrieve and parse text content from the specified URL.
 
         Parameters:
             url (str): The URL of the webpage to retrieve and parse.
+            query (str): Optional description of what to look for on the page.
 
         Returns:
-            str: The plain text content of the webpage, or an error message if retrieval fails.
+            str: The plain text content of the webpage or the passages relevant to the query, headed by the
+            page's reference within the run, or an error message if retrieval fails.
         """
+        index = self._run_index()
+        try:
+            page = index.get(url) if index is not None else None
+            if page is not None:
+                return self._respond(index, page, url, query)
+            if self.cache is None:
+                text = self._parse(self._fetch(url))
+            else:
+                text = self.cache.retrieve(url, self._fetch, self._parse)
+        except RETRIEVAL_ERRORS as e:
+            return f"Error retrieving content from {url}: {e}"
+        if index is None:
+            return truncate_to_tokens(text, self.max_tokens)
+        page, _ = index.add(url, text)
+        return self._respond(index, page, url, query)
+
+    async def _arun(self, url: str, query: Optional[str] = None) -> str:
+        """Asynchronously retrieve and parse text content from the specified URL."""
+        async def aparse(response):
+            return await asyncio.to_thread(self._parse, response)
+
+        index = self._run_index()
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an error for bad responses
-            # Parse the HTML content using BeautifulSoup
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = soup.get_text(separator='\n')  # Extract text with newlines
-            return text.strip()  # Return the parsed text
-        except requests.RequestException as e:
-            return f"Error retrieving content from {url}: {e}"
\ No newline at end of file
+            page = index.get(url) if index is not None else None
+            if page is not None:
+                return self._respond(index, page, url, query)
+            if self.cache is None:
+                text = await aparse(await self._afetch(url))
+            else:
+                text = await self.cache.aretrieve(url, self._afetch, aparse)
+        except RETRIEVAL_ERRORS as e:
+            return f"Error retrieving content from {url}: {e}"
+        if index is None:
+            return truncate_to_tokens(text, self.max_tokens)
+        page, _ = index.add(url, text)
+        return self._respond(index, page, url, query)
+
+    def _run_index(self) -> Optional[ContentIndex]:
+        """The content index of the graph thread the tool is called from, or None outside a graph run."""
+        threadId = ensure_config().get("configurable", {}).get("thread_id")
+        return self.content_index.get(threadId) if self.content_index is not None and threadId else None
+
+    def _respond(self, index: ContentIndex, page: Page, url: str, query: Optional[str]) -> str:
+        """The page's text up to max_tokens, or its passages most relevant to the query."""
+        if query:
+            return format_page_passages(page, url, query, index.passages(page, query, self.top_k))
+        return format_page(page, url, self.max_tokens)
+
+    def retrieve_all(self, urls: list[str], max_workers: int = 8) -> list[str]:
+        """Retrieve and parse several URLs concurrently, in the order given."""
+        # Each URL runs in a copy of the caller's context, so the pages are indexed in the caller's run
+        contexts = [contextvars.copy_context() for _ in urls]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda context, url: context.run(self._run, url), contexts, urls))
+
+    async def aretrieve_all(self, urls: list[str]) -> list[str]:
+        """Asynchronously retrieve and parse several URLs concurrently, in the order given."""
+        return await asyncio.gather(*(self._arun(url) for url in urls))
+
+    def _fetch(self, url: str, headers: dict = None) -> httpx.Response:
+        return self.fetcher.get(url, headers, max_bytes=self.max_bytes, content_types=HTML_CONTENT_TYPES)
+
+    async def _afetch(self, url: str, headers: dict = None) -> httpx.Response:
+        return await self.fetcher.aget(url, headers, max_bytes=self.max_bytes, content_types=HTML_CONTENT_TYPES)
+
+    def _parse(self, response: httpx.Response) -> str:
+        """The whole main text of the page, so every passage is indexed.  Only what is returned is cut to max_tokens."""
+        response.raise_for_status()  # Raise an error for bad responses
+        if response.headers.get("content-type", "").startswith("text/plain"):
+            return response.text.strip()
+        # Keep only the main content of the page
+        return extract_main_text(response.text, None)